@@ -0,0 +1,365 @@
+"""
+Admission control for chat requests.
+
+Every chat request builds a RAG instance and opens an upstream stream. Left
+unbounded, a burst of users starts all of them at once: providers answer with
+429s, requests fall back to the simplified prompt, and memory spikes. Requests
+are admitted per provider instead:
+
+    max_concurrent     - requests for the provider in progress at once
+    tokens_per_minute  - estimated prompt and answer tokens started per minute
+
+Both are set in generator.json, under "admission" for the defaults and under a
+provider's own "admission" block to override them. A request that cannot start
+waits in a FIFO queue and can be told its position. When `max_queue` requests
+are already waiting, new ones are rejected at once with a retry hint rather
+than piling up. A request that waits longer than `queue_timeout_seconds` is
+rejected the same way.
+
+Everything here runs on the event loop, so no locks are needed around the
+limiters.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from api.config import configs, get_context_token_budget
+from api.prompt_budget import output_token_reserve, prompt_token_limit
+from api.session_store import get_history_token_budget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 8
+DEFAULT_MAX_QUEUE = 100
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 120.0
+# How often a waiting request checks whether its queue position changed
+POSITION_POLL_SECONDS = 1.0
+# Suggested retry delay when the queue is full and the token budget is not the cause
+REJECT_RETRY_AFTER_SECONDS = 5.0
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away: the queue is full or the wait timed out."""
+
+    def __init__(self, message: str, retry_after: float = REJECT_RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """A tokens-per-minute budget that refills continuously."""
+
+    def __init__(self, tokens_per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def wait_time(self, tokens: float) -> float:
+        """Seconds until `tokens` are available; 0 if they are now."""
+        self._refill()
+        missing = tokens - self._tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def adjust(self, tokens: float) -> None:
+        """Take tokens out of the budget, or put them back if negative; may go into debt."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - tokens)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "future")
+
+    def __init__(self, tokens: int, future: asyncio.Future):
+        self.tokens = tokens
+        self.future = future
+
+
+class ProviderLimiter:
+    """Concurrency slots, a token budget and a FIFO wait queue for one provider."""
+
+    def __init__(self, name: str, max_concurrent: int, tokens_per_minute: Optional[int] = None):
+        self.name = name
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.waiters: Deque[_Waiter] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def clamp(self, tokens: int) -> int:
+        """Cap an estimate at the bucket size, so a large request can still run on an idle provider."""
+        tokens = max(0, int(tokens))
+        return min(tokens, int(self.bucket.capacity)) if self.bucket else tokens
+
+    def token_wait(self, tokens: int) -> float:
+        return self.bucket.wait_time(tokens) if self.bucket else 0.0
+
+    def _start(self, tokens: int) -> None:
+        self.active += 1
+        self.admitted += 1
+        if self.bucket:
+            self.bucket.adjust(tokens)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """Start a request right away if nobody is waiting and a slot and tokens are free."""
+        if self.waiters or self.active >= self.max_concurrent or self.token_wait(tokens) > 0:
+            return False
+        self._start(tokens)
+        return True
+
+    def enqueue(self, tokens: int) -> _Waiter:
+        waiter = _Waiter(tokens, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        # Schedule a start for when the token budget has refilled
+        self._dispatch()
+        return waiter
+
+    def position(self, waiter: _Waiter) -> int:
+        """1-based position of a waiter in the queue, 0 once it has been admitted."""
+        try:
+            return self.waiters.index(waiter) + 1
+        except ValueError:
+            return 0
+
+    def remove(self, waiter: _Waiter) -> None:
+        """Drop a waiter that gave up; requests behind it may now start."""
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+        waiter.future.cancel()
+        self._dispatch()
+
+    def release(self, refund_tokens: int = 0) -> None:
+        """Free a slot, returning unused tokens to the budget."""
+        self.active -= 1
+        if self.bucket and refund_tokens:
+            self.bucket.adjust(-refund_tokens)
+        self._dispatch()
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Start waiters in order while slots and tokens allow; the head waits for
+        # the budget to refill rather than being overtaken by smaller requests
+        while self.waiters and self.active < self.max_concurrent:
+            waiter = self.waiters[0]
+            if waiter.future.done():
+                self.waiters.popleft()
+                continue
+            wait = self.token_wait(waiter.tokens)
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            self.waiters.popleft()
+            self._start(waiter.tokens)
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "tokens_per_minute": int(self.bucket.capacity) if self.bucket else None,
+            "tokens_available": int(self.bucket.available) if self.bucket else None,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class Ticket:
+    """An admitted request; release it when the request is done."""
+
+    def __init__(self, limiter: ProviderLimiter, tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self._released = False
+
+    def settle(self, tokens: int) -> None:
+        """
+        Replace the admission estimate with a better one, e.g. once the prompt is built.
+
+        The difference is charged to, or returned to, the provider's token budget.
+        """
+        tokens = self.limiter.clamp(tokens)
+        if self.limiter.bucket and not self._released:
+            self.limiter.bucket.adjust(tokens - self.tokens)
+        self.tokens = tokens
+
+    def release(self) -> None:
+        """Free the slot; safe to call more than once."""
+        if not self._released:
+            self._released = True
+            self.limiter.release()
+
+    async def __aenter__(self) -> "Ticket":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """Admits chat requests per provider, queueing or rejecting them under load."""
+
+    def __init__(self, max_queue: int = DEFAULT_MAX_QUEUE,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT_SECONDS,
+                 default_limits: Optional[Dict[str, Any]] = None,
+                 provider_limits: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Args:
+            max_queue: Requests allowed to wait across all providers; more are rejected.
+            queue_timeout: Longest wait for admission, in seconds.
+            default_limits: "max_concurrent" and "tokens_per_minute" for providers without their own.
+            provider_limits: Overrides of the defaults by provider name.
+        """
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.default_limits = default_limits or {}
+        self.provider_limits = provider_limits or {}
+        self.queued = 0
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            limits = dict(self.default_limits, **self.provider_limits.get(provider, {}))
+            limiter = ProviderLimiter(provider, limits.get("max_concurrent", DEFAULT_MAX_CONCURRENT),
+                                      limits.get("tokens_per_minute"))
+            self._limiters[provider] = limiter
+        return limiter
+
+    async def admit(self, provider: str, tokens: int,
+                    on_position: Optional[Callable[[int], Awaitable[None]]] = None) -> Ticket:
+        """
+        Wait until a request for `provider` may start.
+
+        Args:
+            provider: The provider the request will call.
+            tokens: Estimated prompt and answer tokens, charged to the provider's budget.
+            on_position: Called with the request's 1-based queue position whenever it changes.
+
+        Returns:
+            Ticket: Release it when the request is done.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out.
+        """
+        limiter = self.limiter(provider)
+        tokens = limiter.clamp(tokens)
+        if limiter.try_acquire(tokens):
+            return Ticket(limiter, tokens)
+        if self.queued >= self.max_queue:
+            limiter.rejected += 1
+            logger.warning(f"Rejecting {provider} request: {self.queued} requests already waiting")
+            raise AdmissionRejected(
+                f"The server is busy ({self.queued} requests waiting). Please retry shortly.",
+                retry_after=max(REJECT_RETRY_AFTER_SECONDS, limiter.token_wait(tokens)),
+            )
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        waiter = limiter.enqueue(tokens)
+        self.queued += 1
+        last_position = None
+        try:
+            while not waiter.future.done():
+                position = limiter.position(waiter)
+                if on_position is not None and position != last_position:
+                    last_position = position
+                    await on_position(position)
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    limiter.rejected += 1
+                    raise AdmissionRejected(
+                        f"Timed out after {self.queue_timeout:.0f}s waiting for a {provider} slot. Please retry shortly.")
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), min(remaining, POSITION_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+            return Ticket(limiter, tokens)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the caller gave up, e.g. its client disconnected
+                limiter.release(refund_tokens=tokens)
+            else:
+                limiter.remove(waiter)
+            raise
+        finally:
+            self.queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue length and per-provider usage, for the metrics endpoint."""
+        return {
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "providers": {name: limiter.stats() for name, limiter in self._limiters.items()},
+        }
+
+
+def estimate_request_tokens(provider: str, model: Optional[str], input_tokens: int) -> int:
+    """
+    Upper estimate of the tokens a chat request will use before its prompt is built.
+
+    Assumes the retrieved context and the history fill their budgets, up to the
+    model's prompt limit.
+    """
+    prompt_tokens = input_tokens + get_context_token_budget(provider, model) + get_history_token_budget()
+    return min(prompt_tokens, prompt_token_limit(provider, model)) + output_token_reserve(provider, model)
+
+
+def queue_event(position: int) -> str:
+    """The websocket message telling a client its queue position."""
+    return json.dumps({"type": "queue", "position": position})
+
+
+def retry_after_header(error: AdmissionRejected) -> Dict[str, str]:
+    return {"Retry-After": str(math.ceil(error.retry_after))}
+
+
+_admission_controller: Optional[AdmissionController] = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller, configured from generator.json."""
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                settings = configs.get("admission", {})
+                provider_limits = {
+                    name: provider["admission"]
+                    for name, provider in configs.get("providers", {}).items()
+                    if "admission" in provider
+                }
+                _admission_controller = AdmissionController(
+                    max_queue=settings.get("max_queue", DEFAULT_MAX_QUEUE),
+                    queue_timeout=settings.get("queue_timeout_seconds", DEFAULT_QUEUE_TIMEOUT_SECONDS),
+                    default_limits={key: settings[key] for key in ("max_concurrent", "tokens_per_minute")
+                                    if key in settings},
+                    provider_limits=provider_limits,
+                )
+    return _admission_controller
@@ -117,6 +117,18 @@ class WikiExportRequest(BaseModel):
     pages: List[WikiPage] = Field(..., description="List of wiki pages to export")
     format: Literal["markdown", "json"] = Field(..., description="Export format (markdown or json)")
 
+class IndexPrepareRequest(BaseModel):
+    """
+    Model for requesting that a repository's index be prepared ahead of chat.
+    """
+    repo_url: str = Field(..., description="URL of the repository to index")
+    type: str = Field("github", description="Type of repository (e.g., 'github', 'gitlab', 'bitbucket')")
+    token: Optional[str] = Field(None, description="Personal access token for private repositories")
+    excluded_dirs: Optional[str] = Field(None, description="Newline-separated directories to exclude, as sent with chat requests")
+    excluded_files: Optional[str] = Field(None, description="Newline-separated file patterns to exclude, as sent with chat requests")
+    included_dirs: Optional[str] = Field(None, description="Newline-separated directories to include exclusively, as sent with chat requests")
+    included_files: Optional[str] = Field(None, description="Newline-separated file patterns to include exclusively, as sent with chat requests")
+
 # --- Model Configuration Models ---
 class Model(BaseModel):
     """
@@ -391,15 +403,48 @@ def generate_json_export(repo_url: str, pages: List[WikiPage]) -> str:
     return json.dumps(export_data, indent=2)
 
 # Import the simplified chat implementation
-from api.simple_chat import chat_completions_stream
+from api.simple_chat import chat_completions_stream, resume_chat_stream
 from api.websocket_wiki import handle_websocket_chat
+from api.storage_manager import KIND_WIKI, get_storage_manager, start_background_sweeper
+from api.atomic_io import atomic_write, file_lock
+from api.admission import get_admission_controller
+from api.cancellation import cancellation_stats
+from api.executors import executor_stats, get_loop_lag_monitor, run_io
+from api.http_pool import close_http_pools, get_http_pools
+from api.index_jobs import get_index_job_manager, preload_count_from_env, preload_recent_indexes, split_filter
+from api.query_cache import get_query_cache
+from api.retriever_cache import get_retriever_cache
+from api.stream_buffer import get_stream_registry
 
 # Add the chat_completions_stream endpoint to the main app
 app.add_api_route("/chat/completions/stream", chat_completions_stream, methods=["POST"])
+app.add_api_route("/chat/completions/stream/{stream_id}", resume_chat_stream, methods=["GET"])
 
 # Add the WebSocket endpoint
 app.add_websocket_route("/ws/chat", handle_websocket_chat)
 
+@app.on_event("startup")
+async def start_storage_sweeper():
+    """Enforce the configured disk budgets for clones, indexes and wiki caches in the background."""
+    start_background_sweeper()
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    """Sample event loop lag so blocking work on the loop shows up in /api/metrics."""
+    get_loop_lag_monitor().start()
+
+@app.on_event("startup")
+async def preload_indexes():
+    """Load the most recently used repository indexes before the server accepts requests."""
+    count = preload_count_from_env()
+    if count:
+        await run_io(preload_recent_indexes, count)
+
+@app.on_event("shutdown")
+async def close_connection_pools():
+    """Close the keep-alive connections shared by provider clients and repository API helpers."""
+    await close_http_pools()
+
 # --- Wiki Cache Helper Functions ---
 
 WIKI_CACHE_DIR = os.path.join(get_adalflow_default_root_path(), "wikicache")
@@ -417,12 +462,24 @@ async def read_wiki_cache(owner: str, repo: str, repo_type: str, language: str)
         try:
             with open(cache_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                return WikiCacheData(**data)
+            get_storage_manager().touch(KIND_WIKI, f"{owner}_{repo}", cache_path)
+            return WikiCacheData(**data)
         except Exception as e:
             logger.error(f"Error reading wiki cache from {cache_path}: {e}")
             return None
     return None
 
+def _write_wiki_cache_file(cache_path: str, payload: dict) -> None:
+    """Write a wiki cache file; blocks on other writers, so run it off the event loop."""
+    # Concurrent writers serialize; readers only ever see a complete file
+    with file_lock(cache_path), atomic_write(cache_path) as f:
+        json.dump(payload, f, indent=2)
+
+def _remove_wiki_cache_file(cache_path: str) -> None:
+    """Delete a wiki cache file once no writer holds it; run it off the event loop."""
+    with file_lock(cache_path):
+        os.remove(cache_path)
+
 async def save_wiki_cache(data: WikiCacheRequest) -> bool:
     """Saves wiki cache data to the file system."""
     cache_path = get_wiki_cache_path(data.repo.owner, data.repo.repo, data.repo.type, data.language)
@@ -445,9 +502,9 @@ async def save_wiki_cache(data: WikiCacheRequest) -> bool:
 
 
         logger.info(f"Writing cache file to: {cache_path}")
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(payload.model_dump(), f, indent=2)
+        await run_io(_write_wiki_cache_file, cache_path, payload.model_dump())
         logger.info(f"Wiki cache successfully saved to {cache_path}")
+        get_storage_manager().touch(KIND_WIKI, f"{data.repo.owner}_{data.repo.repo}", cache_path)
         return True
     except IOError as e:
         logger.error(f"IOError saving wiki cache to {cache_path}: {e.strerror} (errno: {e.errno})", exc_info=True)
@@ -527,7 +584,7 @@ async def delete_wiki_cache(
 
     if os.path.exists(cache_path):
         try:
-            os.remove(cache_path)
+            await run_io(_remove_wiki_cache_file, cache_path)
             logger.info(f"Successfully deleted wiki cache: {cache_path}")
             return {"message": f"Wiki cache for {owner}/{repo} ({language}) deleted successfully"}
         except Exception as e:
@@ -546,6 +603,56 @@ async def health_check():
         "service": "deepwiki-api"
     }
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Entry counts and hit rates of the in-process retrieval caches."""
+    retriever_cache = get_retriever_cache()
+    return {
+        "query_cache": get_query_cache().stats(),
+        "retriever_cache": {
+            "entries": len(retriever_cache),
+            "size_bytes": retriever_cache.size_bytes,
+            "max_bytes": retriever_cache.max_bytes,
+        },
+    }
+
+@app.post("/api/index/prepare", status_code=202)
+async def prepare_repository_index(request: IndexPrepareRequest):
+    """Start preparing a repository's index in the background, e.g. as soon as its page opens."""
+    job = await get_index_job_manager().submit(
+        request.repo_url,
+        request.type,
+        request.token,
+        excluded_dirs=split_filter(request.excluded_dirs),
+        excluded_files=split_filter(request.excluded_files),
+        included_dirs=split_filter(request.included_dirs),
+        included_files=split_filter(request.included_files),
+    )
+    return job.to_dict()
+
+@app.get("/api/index/prepare/{job_id}")
+async def get_index_job(job_id: str):
+    """Status of an index preparation job: queued, running, ready or failed."""
+    manager = get_index_job_manager()
+    job = await manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Index job {job_id} has expired or does not exist")
+    # The job may have run in another worker; have this one's retriever ready too
+    manager.warm(job)
+    return job.to_dict()
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Executor usage, event loop lag, admission queues, cancelled work, resumable streams and HTTP pools of this worker, and index jobs of all workers."""
+    return {
+        "executors": executor_stats(),
+        "admission": get_admission_controller().stats(),
+        "cancellations": cancellation_stats(),
+        "streams": get_stream_registry().stats(),
+        "http": get_http_pools().stats(),
+        "index_jobs": await run_io(get_index_job_manager().stats),
+    }
+
 @app.get("/")
 async def root():
     """Root endpoint to check if the API is running and list available endpoints dynamically."""
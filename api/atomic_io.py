@@ -0,0 +1,176 @@
+"""
+Crash-safe file writes and cross-process locks.
+
+Files are written to a temporary sibling and renamed into place, so readers see either
+the old or the new content and never a truncated file. Writers coordinate through
+advisory locks on a `<path>.lock` file, which works across API workers and CLI
+processes on the same machine.
+"""
+
+import contextlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import IO, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+LOCK_SUFFIX = ".lock"
+
+
+def _fsync_dir(path: str) -> None:
+    """Flush a directory entry so a rename survives a crash (no-op where unsupported)."""
+    if fcntl is None:
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = "w", encoding: Optional[str] = "utf-8") -> Iterator[IO]:
+    """
+    Open a temporary file that replaces `path` only if the block completes.
+
+    Args:
+        path: Final file path.
+        mode: "w" for text or "wb" for binary.
+        encoding: Text encoding; ignored for binary mode.
+
+    Yields:
+        The open temporary file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(directory)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_replace(tmp_path: str, path: str) -> None:
+    """Atomically move a fully written file into place."""
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def make_temp_dir(path: str) -> str:
+    """Create a hidden temporary directory next to `path`, on the same filesystem."""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f".{os.path.basename(path)}.tmp-", dir=parent)
+
+
+def replace_directory(tmp_dir: str, path: str) -> None:
+    """
+    Swap a fully written directory into place.
+
+    An existing directory at `path` is renamed aside and deleted afterwards; processes
+    that still have its files open or memory-mapped keep working on the old copy.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    old_dir = None
+    if os.path.exists(path):
+        old_dir = os.path.join(parent, f".{os.path.basename(path)}.old-{uuid.uuid4().hex[:8]}")
+        os.rename(path, old_dir)
+    os.rename(tmp_dir, path)
+    _fsync_dir(parent)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False, blocking: bool = True,
+              timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    Hold an advisory lock associated with `path`.
+
+    The lock lives in `<path>.lock`, so it can guard files and directories that are
+    replaced by rename.
+
+    Args:
+        path: The file or directory being protected.
+        shared: Take a shared (reader) lock instead of an exclusive one.
+        blocking: Wait for the lock; if False, raise BlockingIOError when it is held.
+        timeout: Give up with TimeoutError after this many seconds (blocking mode only).
+    """
+    lock_path = path + LOCK_SUFFIX
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    lock_file = open(lock_path, "a+")
+    try:
+        _acquire(lock_file, shared, blocking, timeout, lock_path)
+        try:
+            yield
+        finally:
+            _release(lock_file)
+    finally:
+        lock_file.close()
+
+
+def _acquire(lock_file: IO, shared: bool, blocking: bool, timeout: Optional[float], lock_path: str) -> None:
+    if fcntl is None:
+        # msvcrt only offers exclusive byte-range locks
+        lock_file.seek(0)
+        op = msvcrt.LK_NBLCK
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), op, 1)
+                return
+            except OSError:
+                if not blocking:
+                    raise BlockingIOError(f"Lock {lock_path} is held by another process")
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for lock {lock_path}")
+                time.sleep(0.1)
+
+    op = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if blocking and timeout is None:
+        fcntl.flock(lock_file.fileno(), op)
+        return
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(lock_file.fileno(), op | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if not blocking:
+                raise
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for lock {lock_path}")
+            time.sleep(0.1)
+
+
+def _release(lock_file: IO) -> None:
+    if fcntl is None:
+        lock_file.seek(0)
+        with contextlib.suppress(OSError):
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -62,6 +62,8 @@ from adalflow.core.types import (
 )
 from adalflow.components.model_client.utils import parse_embedding_response
 
+from api.http_pool import get_async_http_client, get_sync_http_client, loop_async_client
+
 log = logging.getLogger(__name__)
 T = TypeVar("T")
 
@@ -242,7 +244,8 @@ class AzureAIClient(ModelClient):
 
         if api_key:
             return AzureOpenAI(
-                api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version
+                api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version,
+                http_client=get_sync_http_client(),
             )
         elif self._credential:
             # credential = DefaultAzureCredential()
@@ -253,6 +256,7 @@ class AzureAIClient(ModelClient):
                 azure_ad_token_provider=token_provider,
                 azure_endpoint=azure_endpoint,
                 api_version=api_version,
+                http_client=get_sync_http_client(),
             )
         else:
             raise ValueError(
@@ -271,7 +275,8 @@ class AzureAIClient(ModelClient):
 
         if api_key:
             return AsyncAzureOpenAI(
-                api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version
+                api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version,
+                http_client=get_async_http_client(),
             )
         elif self._credential:
             # credential = DefaultAzureCredential()
@@ -282,6 +287,7 @@ class AzureAIClient(ModelClient):
                 azure_ad_token_provider=token_provider,
                 azure_endpoint=azure_endpoint,
                 api_version=api_version,
+                http_client=get_async_http_client(),
             )
         else:
             raise ValueError(
@@ -440,12 +446,11 @@ class AzureAIClient(ModelClient):
         """
         kwargs is the combined input and model_kwargs
         """
-        if self.async_client is None:
-            self.async_client = self.init_async_client()
+        self.async_client = async_client = loop_async_client(self.async_client, self.init_async_client)
         if model_type == ModelType.EMBEDDER:
-            return await self.async_client.embeddings.create(**api_kwargs)
+            return await async_client.embeddings.create(**api_kwargs)
         elif model_type == ModelType.LLM:
-            return await self.async_client.chat.completions.create(**api_kwargs)
+            return await async_client.chat.completions.create(**api_kwargs)
         else:
             raise ValueError(f"model_type {model_type} is not supported")
 
@@ -0,0 +1,191 @@
+"""
+Cancellation of request work when the client goes away.
+
+A chat request fans out into work the client no longer needs once it
+disconnects: the upstream completion stream, embedding batches while a
+repository is indexed, and retrieval queued on the executors. Each request
+gets a CancelToken. The token is held in a context variable, and the executors
+copy the context into their worker threads, so blocking code can call
+`check_cancelled()` between units of work without the token being passed
+through every signature.
+
+When the client disconnects:
+    - the handler task is cancelled, which closes the upstream stream and
+      drops executor work that has not started yet;
+    - the token is set, so work already running on a thread stops at its next
+      checkpoint (e.g. before the next embedding batch).
+
+Cancellations are counted by kind for the metrics endpoint.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from starlette.websockets import WebSocketState
+
+logger = logging.getLogger(__name__)
+
+# Kinds of cancelled work reported by cancellation_stats()
+CANCEL_KINDS = ("requests", "streams", "queued", "embedding", "retrieval")
+
+
+class RequestCancelled(Exception):
+    """Raised at a checkpoint when the request's client has disconnected."""
+
+
+class CancelToken:
+    """A thread-safe flag set when a request is cancelled."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "client disconnected") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def check(self, kind: Optional[str] = None) -> None:
+        """
+        Raise RequestCancelled if the token is set.
+
+        Args:
+            kind: The kind of work being skipped, counted in the metrics.
+        """
+        if self._event.is_set():
+            if kind is not None:
+                record_cancellation(kind)
+            raise RequestCancelled(self.reason)
+
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "deepwiki_cancel_token", default=None)
+
+_counts: Dict[str, int] = {kind: 0 for kind in CANCEL_KINDS}
+_counts_lock = threading.Lock()
+
+
+def set_cancel_token(token: Optional[CancelToken]) -> contextvars.Token:
+    """Make `token` the current request's token in this context."""
+    return _current_token.set(token)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def check_cancelled(kind: Optional[str] = None) -> None:
+    """
+    Raise RequestCancelled if the current request has been cancelled.
+
+    Does nothing outside a request, e.g. when indexing from the CLI.
+
+    Args:
+        kind: The kind of work being skipped, counted in the metrics.
+    """
+    token = _current_token.get()
+    if token is not None:
+        token.check(kind)
+
+
+def record_cancellation(kind: str) -> None:
+    """Count one cancelled unit of work of the given kind."""
+    with _counts_lock:
+        _counts[kind] = _counts.get(kind, 0) + 1
+
+
+def cancellation_stats() -> Dict[str, int]:
+    """Cancelled work by kind, for the metrics endpoint."""
+    with _counts_lock:
+        return dict(_counts)
+
+
+def is_own_cancellation(error: BaseException, token: Optional[CancelToken]) -> bool:
+    """
+    Whether an exception is the result of cancelling `token`'s request.
+
+    For a CancelledError this also clears the pending cancellation of the
+    current task, so the handler can finish its cleanup and return normally.
+    """
+    if token is None or not token.cancelled:
+        return False
+    if isinstance(error, asyncio.CancelledError):
+        task = asyncio.current_task()
+        if task is not None:
+            task.uncancel()
+        return True
+    return isinstance(error, RequestCancelled)
+
+
+def watch_websocket_disconnect(websocket: Any, token: CancelToken,
+                               task: Optional[asyncio.Task] = None) -> asyncio.Task:
+    """
+    Cancel a request when its websocket client disconnects.
+
+    The handler must not read from the websocket after this is started; the
+    watcher owns the receive side.
+
+    Args:
+        websocket: The accepted websocket.
+        token: The request's token, set on disconnect.
+        task: The task to cancel; defaults to the current task.
+
+    Returns:
+        asyncio.Task: The watcher; cancel it once the handler is done.
+    """
+    task = task or asyncio.current_task()
+
+    async def watch():
+        while True:
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect":
+                break
+        # After the handler closed the socket itself, the client's close is expected
+        if websocket.application_state == WebSocketState.DISCONNECTED:
+            return
+        if not task.done():
+            logger.info("Client disconnected, cancelling request")
+            token.cancel()
+            record_cancellation("requests")
+            task.cancel()
+
+    return asyncio.get_running_loop().create_task(watch())
+
+
+def watch_http_disconnect(request: Any, token: CancelToken,
+                          task: Optional[asyncio.Task] = None) -> asyncio.Task:
+    """
+    Cancel request preparation when an HTTP client disconnects.
+
+    Only for the phase before a streaming response starts: the response
+    listens for the disconnect itself, so stop this watcher before returning it.
+
+    Args:
+        request: The starlette Request, with its body already read.
+        token: The request's token, set on disconnect.
+        task: The task to cancel; defaults to the current task.
+
+    Returns:
+        asyncio.Task: The watcher.
+    """
+    task = task or asyncio.current_task()
+
+    async def watch():
+        while True:
+            message = await request.receive()
+            if message.get("type") == "http.disconnect":
+                break
+        if not task.done():
+            logger.info("Client disconnected during preparation, cancelling request")
+            token.cancel()
+            record_cancellation("requests")
+            task.cancel()
+
+    return asyncio.get_running_loop().create_task(watch())
@@ -28,11 +28,22 @@ import logging
 import sys
 import os
 from urllib.parse import urlparse
+from api.config import get_context_token_budget
+from api.context_builder import build_context
 from api.data_pipeline import DatabaseManager, count_tokens, get_file_content
+from api.index_store import IndexStore
 from api.logging_config import setup_logging
 from api.rag import RAG
+from api.storage_manager import (
+    DERIVED_BUDGET_ENV,
+    REPOS_BUDGET_ENV,
+    budget_from_env,
+    get_storage_manager,
+)
 from api.repo_wiki_gen import RepoInfo, WikiGenerationHelper
+from api.vector_index import INDEX_TYPES, benchmark_index_types
 from adalflow.core.types import ModelType
+from adalflow.utils import get_adalflow_default_root_path
 
 # Setup logging
 setup_logging()
@@ -120,6 +131,21 @@ def cli():
 
 # .venv/bin/python -m api.cli generate /nfs/site/disks/ssm_lwang85_002/AI/repo-wiki/AdalFlow --repo-type "github" --output /nfs/site/disks/ssm_lwang85_002/AI/repo-wiki/AdalFlow/.deepwiki --model-provider "dashscope" --model "qwen3-coder-plus"
 
+def repo_name_from_path(repo_path: str) -> str:
+    """Return the storage name ("owner_repo") for a repository URL or local path."""
+    if repo_path.startswith('http://') or repo_path.startswith('https://'):
+        parsed = urlparse(repo_path)
+        path_parts = parsed.path.strip('/').split('/')
+        if len(path_parts) >= 2:
+            owner = path_parts[-2]
+            repo = path_parts[-1].replace('.git', '')
+            return f"{owner}_{repo}"
+        raise ValueError("Invalid repository URL format")
+    # Local path - extract from git remote
+    owner, repo = extract_repo_info(repo_path)
+    return f"{owner}_{repo}"
+
+
 @cli.command()
 @click.argument('repo_path')
 @click.option(
@@ -135,69 +161,16 @@ def remove(repo_path, repo_type):
     REPO_PATH: Repository URL or local path to remove
     """
     try:
-        from adalflow.utils import get_adalflow_default_root_path
-        from adalflow.core.db import LocalDB
-        import shutil
-        import glob
-        
-        # Parse repository information
-        if repo_path.startswith('http://') or repo_path.startswith('https://'):
-            parsed = urlparse(repo_path)
-            path_parts = parsed.path.strip('/').split('/')
-            if len(path_parts) >= 2:
-                owner = path_parts[-2]
-                repo = path_parts[-1].replace('.git', '')
-                repo_name = f"{owner}_{repo}"
-            else:
-                raise ValueError("Invalid repository URL format")
-        else:
-            # Local path - extract from git remote
-            owner, repo = extract_repo_info(repo_path)
-            repo_name = f"{owner}_{repo}"
-        
-        root_path = get_adalflow_default_root_path()
-        
-        # Remove database using LocalDB operations
-        db_file = os.path.join(root_path, "databases", f"{repo_name}.pkl")
-        if os.path.exists(db_file):
-            try:
-                # Load and clear the database
-                db = LocalDB.load_state(db_file)
-                db.reset_index()  # Clear the database content
-                db.save_state(db_file)  # Save empty state
-                # Then remove the file
-                os.remove(db_file)
-                click.echo(click.style(f"✓ Removed database: {db_file}", fg='green'))
-            except Exception as e:
-                # Fallback to direct file removal
-                os.remove(db_file)
-                click.echo(click.style(f"✓ Removed database file: {db_file}", fg='green'))
-        else:
-            click.echo(f"Database file not found: {db_file}")
-        
-        # Remove all related repositories under ~/.adalflow/repos/
-        repos_dir = os.path.join(root_path, "repos")
-        if os.path.exists(repos_dir):
-            repo_pattern = os.path.join(repos_dir, f"*{repo_name}*")
-            matching_repos = glob.glob(repo_pattern)
-            for repo_dir in matching_repos:
-                if os.path.isdir(repo_dir):
-                    shutil.rmtree(repo_dir)
-                    click.echo(click.style(f"✓ Removed repository: {repo_dir}", fg='green'))
-        
-        # Remove wiki cache
-        wikicache_dir = os.path.join(root_path, "wikicache")
-        if os.path.exists(wikicache_dir):
-            cache_pattern = os.path.join(wikicache_dir, f"*{repo_name}*")
-            matching_caches = glob.glob(cache_pattern)
-            for cache_file in matching_caches:
-                if os.path.isfile(cache_file):
-                    os.remove(cache_file)
-                    click.echo(click.style(f"✓ Removed cache: {cache_file}", fg='green'))
-                elif os.path.isdir(cache_file):
-                    shutil.rmtree(cache_file)
-                    click.echo(click.style(f"✓ Removed cache directory: {cache_file}", fg='green'))
+        repo_name = repo_name_from_path(repo_path)
         
+        # Match this repo's artifacts exactly; a substring glob would also hit
+        # e.g. "owner_repo-extra" when removing "owner_repo"
+        removed = get_storage_manager().remove_repo(repo_name)
+        if not removed:
+            click.echo(f"No stored artifacts found for {repo_name}")
+        for path in removed:
+            click.echo(click.style(f"✓ Removed: {path}", fg='green'))
+
         click.echo(click.style("✓ Cleanup completed", fg='green', bold=True))
         
     except Exception as e:
@@ -206,6 +179,106 @@ def remove(repo_path, repo_type):
         sys.exit(1)
 
 
+@cli.command()
+@click.argument('repo_path')
+@click.option(
+    '--index-type',
+    'index_types',
+    type=click.Choice(list(INDEX_TYPES), case_sensitive=False),
+    multiple=True,
+    help='Index type to compare against flat search (repeatable, default: all)'
+)
+@click.option('--queries', default=200, show_default=True, help='Number of sampled queries')
+@click.option('--top-k', default=20, show_default=True, help='k for recall@k')
+def benchmark(repo_path, index_types, queries, top_k):
+    """
+    Compare FAISS index types on a repository's stored embeddings.
+
+    Reports build time, query latency and recall@k against exact (flat) search.
+
+    REPO_PATH: Repository URL or local path whose index was generated before
+    """
+    try:
+        repo_name = repo_name_from_path(repo_path)
+        index_dir = os.path.join(get_adalflow_default_root_path(), "databases", repo_name)
+        store_dirs = sorted(
+            os.path.join(index_dir, name) for name in os.listdir(index_dir)
+            if IndexStore.exists(os.path.join(index_dir, name))
+        ) if os.path.isdir(index_dir) else []
+        if not store_dirs:
+            raise ValueError(f"No index store found for {repo_name}, run 'generate' first")
+
+        for store_dir in store_dirs:
+            store = IndexStore.open(store_dir)
+            try:
+                click.echo(click.style(
+                    f"\n{store_dir} ({len(store.vector_ids())} vectors, {store.dimensions} dims)", bold=True
+                ))
+                results = benchmark_index_types(store, index_types or INDEX_TYPES, num_queries=queries, top_k=top_k)
+            finally:
+                store.close()
+            click.echo(f"{'type':<6} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(top_k):>10}")
+            for result in results:
+                click.echo(
+                    f"{result['index_type']:<6} {result['build_seconds']:>8.2f} {result['p50_ms']:>8.3f} "
+                    f"{result['p95_ms']:>8.3f} {result['recall']:>10.3f}"
+                )
+
+    except Exception as e:
+        logger.error(f"Error during benchmark: {e}", exc_info=True)
+        click.echo(click.style(f"✗ Error: {e}", fg='red'), err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.option(
+    '--repos-max-mb',
+    type=float,
+    help=f'Disk budget for cloned repositories in MB (default: ${REPOS_BUDGET_ENV}, unlimited if unset)'
+)
+@click.option(
+    '--derived-max-mb',
+    type=float,
+    help=f'Disk budget for indexes and wiki caches in MB (default: ${DERIVED_BUDGET_ENV}, unlimited if unset)'
+)
+@click.option(
+    '--dry-run',
+    is_flag=True,
+    help='Only show what would be removed'
+)
+def gc(repos_max_mb, derived_max_mb, dry_run):
+    """
+    Evict least recently used clones, indexes and wiki caches to fit the disk budgets.
+    """
+    try:
+        manager = get_storage_manager()
+        repos_budget = int(repos_max_mb * 1024 * 1024) if repos_max_mb is not None else budget_from_env(REPOS_BUDGET_ENV)
+        derived_budget = int(derived_max_mb * 1024 * 1024) if derived_max_mb is not None else budget_from_env(DERIVED_BUDGET_ENV)
+
+        usage = manager.usage()
+        for kind, size in usage.items():
+            click.echo(f"{kind:>6}: {size / (1024 * 1024):.1f} MB")
+
+        if repos_budget is None and derived_budget is None:
+            click.echo("No disk budget configured; nothing to do.")
+            return
+
+        evicted = manager.collect(repos_budget=repos_budget, derived_budget=derived_budget, dry_run=dry_run)
+        verb = "Would remove" if dry_run else "✓ Removed"
+        for artifact in evicted:
+            click.echo(click.style(
+                f"{verb} {artifact.kind}: {artifact.path} ({artifact.size_bytes / (1024 * 1024):.1f} MB)",
+                fg='yellow' if dry_run else 'green'
+            ))
+        freed = sum(a.size_bytes for a in evicted) / (1024 * 1024)
+        click.echo(click.style(f"{'Would free' if dry_run else 'Freed'} {freed:.1f} MB", bold=True))
+
+    except Exception as e:
+        logger.error(f"Error during garbage collection: {e}", exc_info=True)
+        click.echo(click.style(f"✗ Error: {e}", fg='red'), err=True)
+        sys.exit(1)
+
+
 @cli.command()
 @click.argument('repo_path')
 @click.option(
@@ -362,26 +435,8 @@ def generate(repo_path, repo_type, access_token, model_provider, model, output,
                 documents = retrieved_docs[0].documents
                 logger.info(f"Retrieved {len(documents)} documents for structure")
                 click.echo(f"  Retrieved {len(documents)} documents:")        
-                # Group documents by file path
-                docs_by_file = {}
-                for doc in documents:
-                    file_path = doc.meta_data.get('file_path', 'unknown')
-                    if file_path not in docs_by_file:
-                        docs_by_file[file_path] = []
-                    docs_by_file[file_path].append(doc)
-
-                # Format context text with file path grouping
-                context_parts = []
-                for file_path, docs in docs_by_file.items():
-                    # Add file header with metadata
-                    header = f"## File Path: {file_path}\n\n"
-                    # Add document content
-                    content = "\n\n".join([doc.text for doc in docs])
-
-                    context_parts.append(f"{header}{content}")
-
-                # Join all parts with clear separation
-                context_text = "\n\n" + "-" * 10 + "\n\n".join(context_parts)
+                # Merge overlapping chunks per file and fit the model's context budget
+                context_text = build_context(documents, max_tokens=get_context_token_budget(model_provider, model))
 
         # Generate structure using the LLM with context
         from api.config import get_model_config
@@ -507,13 +562,22 @@ This file contains...
         
         # Step 6: Generate content for each page (aligned with web implementation)
         click.echo(f"\nGenerating content for {len(wiki_structure.pages)} pages...")
+
+        # Prefetch context for all pages: one batched embedding call and one FAISS search
+        page_prompts = [wiki_helper.create_page_content_prompt(page) for page in wiki_structure.pages]
+        prefetched_docs = None
+        try:
+            prefetched_docs = request_rag.batch_call(page_prompts, language='en')
+            logger.info(f"Prefetched RAG context for {len(prefetched_docs)} pages")
+        except Exception as e:
+            logger.warning(f"Batched RAG retrieval failed: {e}, querying per page")
         
         for idx, page in enumerate(wiki_structure.pages, 1):
             click.echo(f"\n[{idx}/{len(wiki_structure.pages)}] Generating: {page.title}")
             logger.info(f"Generating page: {page.id} - {page.title}")
             
             # Create page content prompt using WikiGenerationHelper
-            content_prompt = wiki_helper.create_page_content_prompt(page)
+            content_prompt = page_prompts[idx - 1]
             input_too_large = False
             tokens = count_tokens(structure_prompt_content)
             if tokens > 8000:
@@ -527,7 +591,10 @@ This file contains...
                 # Query RAG for context (aligned with web implementation)
                 logger.info(f"Querying RAG for page content: {page.title}")
                 try:
-                    retrieved_docs = request_rag(content_prompt, language='en')  # Use direct call like web
+                    if prefetched_docs is not None:
+                        retrieved_docs = [prefetched_docs[idx - 1]]
+                    else:
+                        retrieved_docs = request_rag(content_prompt, language='en')  # Use direct call like web
                 except Exception as e:
                     logger.warning(f"RAG call failed for page {page.title}: {e}, proceeding without context")
                     retrieved_docs = None
@@ -537,25 +604,8 @@ This file contains...
                     documents = retrieved_docs[0].documents
                     logger.info(f"Retrieved {len(documents)} documents for page")
                     
-                    # Group documents by file path (same as web implementation)
-                    docs_by_file = {}
-                    for doc in documents:
-                        file_path = doc.meta_data.get('file_path', 'unknown')
-                        if file_path not in docs_by_file:
-                            docs_by_file[file_path] = []
-                        docs_by_file[file_path].append(doc)
-
-                    # Format context text with file path grouping (same as web implementation)
-                    context_parts = []
-                    for file_path, docs in docs_by_file.items():  
-                        # Add file header with metadata
-                        header = f"## File Path: {file_path}\n\n"
-                        # Add document content
-                        content = "\n\n".join([doc.text for doc in docs])
-                        context_parts.append(f"{header}{content}")
-
-                    # Join all parts with clear separation
-                    context_text = "\n\n" + "-" * 10 + "\n\n".join(context_parts)
+                    # Merge overlapping chunks per file and fit the model's context budget
+                    context_text = build_context(documents, max_tokens=get_context_token_budget(model_provider, model))
             
             # Create system prompt (aligned with web implementation)
             system_prompt_for_page = f"""<role>
@@ -0,0 +1,86 @@
+"""
+Long-lived model clients, embedders and generators shared across requests.
+
+Constructing a provider client creates fresh HTTP clients, so every new instance
+pays for new connections and TLS handshakes. The chat endpoints used to build
+an embedder, a generator and a provider client per request. They now take them
+from this pool, which keeps one instance per configuration for the life of the
+process. The pooled clients only hold connection state and configuration;
+per-call arguments are passed with each call.
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import adalflow as adal
+
+from api.config import get_embedder_config_by_type
+from api.tools.embedder import get_embedder
+
+logger = logging.getLogger(__name__)
+
+_pool: Dict[Hashable, Any] = {}
+# Reentrant: a generator factory takes its model client from the pool
+_pool_lock = threading.RLock()
+
+
+def _pooled(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """Return the pooled object for key, creating it with factory on first use."""
+    instance = _pool.get(key)
+    if instance is None:
+        with _pool_lock:
+            instance = _pool.get(key)
+            if instance is None:
+                instance = factory()
+                _pool[key] = instance
+                logger.info(f"Created pooled client for {key[0]}: {key[1]}")
+    return instance
+
+
+def _config_key(config: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(config or {}, sort_keys=True, default=str)
+
+
+def get_model_client(client_class: type, **init_kwargs) -> Any:
+    """
+    Return a shared instance of a model client class.
+
+    Args:
+        client_class: The client class, e.g. OpenAIClient.
+        **init_kwargs: Constructor arguments; each distinct set gets its own instance.
+
+    Returns:
+        The pooled client.
+    """
+    key = ("model_client", client_class.__name__, _config_key(init_kwargs))
+    return _pooled(key, lambda: client_class(**init_kwargs))
+
+
+def get_pooled_embedder(embedder_type: str) -> adal.Embedder:
+    """
+    Return a shared embedder for an embedder type.
+
+    The key includes the embedder's configuration, so a changed config gets a new
+    instance.
+    """
+    config = get_embedder_config_by_type(embedder_type) or {}
+    key = ("embedder", embedder_type, _config_key({
+        "model_client": getattr(config.get("model_client"), "__name__", None),
+        "initialize_kwargs": config.get("initialize_kwargs"),
+        "model_kwargs": config.get("model_kwargs"),
+        "batch_size": config.get("batch_size"),
+    }))
+    return _pooled(key, lambda: get_embedder(embedder_type=embedder_type))
+
+
+def get_pooled_generator(provider: str, model: Optional[str], factory: Callable[[], adal.Generator]) -> adal.Generator:
+    """Return a shared generator for a (provider, model) pair, built with factory on first use."""
+    return _pooled(("generator", f"{provider}/{model}"), factory)
+
+
+def clear_client_pool() -> None:
+    """Drop all pooled clients, e.g. after credentials or configuration change."""
+    with _pool_lock:
+        _pool.clear()
@@ -54,6 +54,11 @@ WIKI_AUTH_CODE = os.environ.get('DEEPWIKI_AUTH_CODE', '')
 # Embedder settings
 EMBEDDER_TYPE = os.environ.get('DEEPWIKI_EMBEDDER_TYPE', 'openai').lower()
 
+# Retrieved-context tokens per prompt when generator.json doesn't set a budget
+DEFAULT_CONTEXT_TOKEN_BUDGET = 8000
+# Model context window (prompt plus answer) when generator.json doesn't set one
+DEFAULT_CONTEXT_WINDOW = 32768
+
 # Get configuration directory from environment variable, or use default if not set
 CONFIG_DIR = os.environ.get('DEEPWIKI_CONFIG_DIR', None)
 
@@ -201,6 +206,28 @@ def get_embedder_config():
     else:
         return configs.get("embedder", {})
 
+def get_embedder_config_by_type(embedder_type: str = None):
+    """
+    Get the embedder configuration for an explicit embedder type.
+
+    Args:
+        embedder_type: 'ollama', 'google', 'github_copilot' or 'openai'. If None,
+            the type is determined from the current configuration.
+
+    Returns:
+        dict: The embedder configuration with model_client resolved
+    """
+    if embedder_type is None:
+        embedder_type = get_embedder_type()
+    if embedder_type == 'ollama':
+        return configs["embedder_ollama"]
+    elif embedder_type == 'google':
+        return configs["embedder_google"]
+    elif embedder_type == 'github_copilot':
+        return configs["embedder_github_copilot"]
+    else:  # default to openai
+        return configs["embedder"]
+
 def is_ollama_embedder():
     """
     Check if the current embedder configuration uses OllamaClient.
@@ -364,6 +391,11 @@ lang_config = load_lang_config()
 if generator_config:
     configs["default_provider"] = generator_config.get("default_provider", "google")
     configs["providers"] = generator_config.get("providers", {})
+    configs["context_token_budget"] = generator_config.get("context_token_budget", DEFAULT_CONTEXT_TOKEN_BUDGET)
+    configs["context_window"] = generator_config.get("context_window", DEFAULT_CONTEXT_WINDOW)
+    if "history_token_budget" in generator_config:
+        configs["history_token_budget"] = generator_config["history_token_budget"]
+    configs["admission"] = generator_config.get("admission", {})
 
 # Update embedder configuration
 if embedder_config:
@@ -382,6 +414,49 @@ if lang_config:
     configs["lang_config"] = lang_config
 
 
+def get_context_token_budget(provider=None, model=None):
+    """
+    Get the maximum number of retrieved-context tokens to put in a prompt for a model.
+
+    A model entry in the provider's "context_token_budgets" wins, then the provider's
+    "context_token_budget", then the top-level "context_token_budget" in generator.json.
+
+    Parameters:
+        provider (str): Model provider
+        model (str): Model name, or None to use the provider's default model
+
+    Returns:
+        int: The token budget
+    """
+    provider_config = configs.get("providers", {}).get(provider or configs.get("default_provider"), {})
+    model = model or provider_config.get("default_model")
+    model_budgets = provider_config.get("context_token_budgets", {})
+    if model in model_budgets:
+        return int(model_budgets[model])
+    return int(provider_config.get("context_token_budget",
+                                   configs.get("context_token_budget", DEFAULT_CONTEXT_TOKEN_BUDGET)))
+
+def get_context_window(provider=None, model=None):
+    """
+    Get the context window of a model: the most tokens its prompt and answer may use together.
+
+    A model entry in the provider's "context_windows" wins, then the provider's
+    "context_window", then the top-level "context_window" in generator.json.
+
+    Parameters:
+        provider (str): Model provider
+        model (str): Model name, or None to use the provider's default model
+
+    Returns:
+        int: The context window in tokens
+    """
+    provider_config = configs.get("providers", {}).get(provider or configs.get("default_provider"), {})
+    model = model or provider_config.get("default_model")
+    model_windows = provider_config.get("context_windows", {})
+    if model in model_windows:
+        return int(model_windows[model])
+    return int(provider_config.get("context_window", configs.get("context_window", DEFAULT_CONTEXT_WINDOW)))
+
 def get_model_config(provider="google", model=None):
     """
     Get configuration for the specified provider and model
@@ -450,6 +525,9 @@ def get_model_config(provider="google", model=None):
             )
         
         result["model_client"] = create_iflow_client
+        # The client class and its arguments, for callers that share instances through the client pool
+        result["client_class"] = model_client
+        result["initialize_kwargs"] = {"base_url": base_url, "env_api_key_name": api_key_env}
         result["model_kwargs"] = {"model": model, **model_params}  # model is already stripped if needed
         
         logger.info(f"✅ iFlow Client Factory Created Successfully!")
@@ -0,0 +1,159 @@
+"""
+Assemble retrieved chunks into the context section of a prompt.
+
+Adjacent chunks overlap by `chunk_overlap` words, so joining retrieved chunks
+verbatim repeats large spans. Chunks of the same file are merged by their
+character offsets in the file (recorded by the index store), falling back to
+text overlap for chunks without offsets. The result is then cut to a token
+budget, keeping the highest-ranked files first; the span that reaches the budget
+is truncated rather than dropped.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from adalflow.core.types import Document
+
+from api.data_pipeline import count_tokens
+from api.prompt_budget import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Shortest suffix/prefix overlap treated as a repeated span when chunks have no offsets
+MIN_TEXT_OVERLAP = 20
+# Stop adding sections once fewer tokens than this remain
+MIN_SECTION_TOKENS = 50
+
+# Between the spans of a file, and between file sections
+SEPARATOR = "\n\n"
+# Opens the context
+DIVIDER = "\n\n" + "-" * 10
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """Return the length of the longest suffix of `left` that is a prefix of `right`."""
+    tail = left[-len(right):] if len(left) > len(right) else left
+    # KMP failure function over right + separator + tail
+    pattern = right + "\0" + tail
+    failure = [0] * len(pattern)
+    for i in range(1, len(pattern)):
+        k = failure[i - 1]
+        while k and pattern[i] != pattern[k]:
+            k = failure[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        failure[i] = k
+    return failure[-1]
+
+
+def merge_chunks(documents: Sequence[Document]) -> List[str]:
+    """
+    Merge chunks of one file into non-overlapping spans.
+
+    Chunks with character offsets are ordered by position; overlapping or adjacent
+    chunks become one span. Chunks without offsets are deduplicated and joined where
+    one ends with the start of the next.
+
+    Args:
+        documents: Retrieved chunks of the same file.
+
+    Returns:
+        List[str]: Span texts in file order (offset chunks first).
+    """
+    located = sorted(
+        (doc for doc in documents if doc.meta_data.get("char_start") is not None),
+        key=lambda doc: doc.meta_data["char_start"],
+    )
+    spans: List[str] = []
+    current_text, current_end = None, None
+    seen = set()
+    for doc in located:
+        start, end = doc.meta_data["char_start"], doc.meta_data["char_end"]
+        if (start, end) in seen:
+            continue
+        seen.add((start, end))
+        if current_text is not None and start <= current_end:
+            if end > current_end:
+                current_text += doc.text[current_end - start:]
+                current_end = end
+            continue
+        if current_text is not None:
+            spans.append(current_text)
+        current_text, current_end = doc.text, end
+    if current_text is not None:
+        spans.append(current_text)
+
+    unlocated: List[str] = []
+    for doc in documents:
+        if doc.meta_data.get("char_start") is not None or not doc.text:
+            continue
+        text = doc.text
+        if any(text in span for span in spans + unlocated):
+            continue
+        if unlocated:
+            overlap = _text_overlap(unlocated[-1], text)
+            if overlap >= MIN_TEXT_OVERLAP:
+                unlocated[-1] += text[overlap:]
+                continue
+        unlocated.append(text)
+    return spans + unlocated
+
+
+def build_context(documents: Sequence[Document], max_tokens: Optional[int] = None) -> str:
+    """
+    Build the prompt context from retrieved chunks, grouped by file.
+
+    Files keep the order of their best-ranked chunk. When `max_tokens` is given,
+    spans are added in that order until the budget is used up: the first span that
+    does not fit is truncated to what is left, and later files are left out.
+
+    Args:
+        documents: Retrieved chunks, best first.
+        max_tokens: Optional token budget for the whole context.
+
+    Returns:
+        str: The formatted context, or "" if there are no documents.
+    """
+    docs_by_file: Dict[str, List[Document]] = OrderedDict()
+    for doc in documents:
+        docs_by_file.setdefault(doc.meta_data.get("file_path", "unknown"), []).append(doc)
+
+    remaining = max_tokens - count_tokens(DIVIDER) if max_tokens is not None else None
+    separator_tokens = count_tokens(SEPARATOR)
+    context_parts = []
+    dropped = 0
+    for file_path, docs in docs_by_file.items():
+        header = f"## File Path: {file_path}\n\n"
+        spans = merge_chunks(docs)
+        if remaining is not None:
+            kept = []
+            budget = remaining - count_tokens(header) - (separator_tokens if context_parts else 0)
+            for span in spans:
+                if kept:
+                    budget -= separator_tokens
+                tokens = count_tokens(span)
+                if tokens <= budget:
+                    kept.append(span)
+                    budget -= tokens
+                    continue
+                # Cut the span that reaches the budget instead of losing it to lower-ranked files
+                if budget >= MIN_SECTION_TOKENS:
+                    span = truncate_to_tokens(span, budget)
+                    kept.append(span)
+                dropped += len(spans) - len(kept)
+                budget = 0
+                break
+            if spans:
+                remaining = budget
+            spans = kept
+        if spans:
+            context_parts.append(f"{header}" + SEPARATOR.join(spans))
+        if remaining is not None and remaining < MIN_SECTION_TOKENS:
+            break
+
+    if dropped or len(context_parts) < len(docs_by_file):
+        logger.info(f"Context trimmed to {max_tokens} tokens: kept {len(context_parts)} of {len(docs_by_file)} files")
+    if not context_parts:
+        return ""
+    return DIVIDER + SEPARATOR.join(context_parts)
@@ -58,6 +58,7 @@ from adalflow.core.embedder import (
 import adalflow.core.functional as F
 from adalflow.components.model_client.utils import parse_embedding_response
 
+from api.http_pool import get_async_http_client, get_sync_http_client, loop_async_client
 from api.logging_config import setup_logging
 
 # # Disable tqdm progress bars
@@ -186,7 +187,7 @@ class DashscopeClient(ModelClient):
     def init_sync_client(self):
         api_key, workspace_id, base_url = self._prepare_client_config()
         
-        client = OpenAI(api_key=api_key, base_url=base_url)
+        client = OpenAI(api_key=api_key, base_url=base_url, http_client=get_sync_http_client())
         
         # Store workspace_id for later use in requests
         if workspace_id:
@@ -197,7 +198,7 @@ class DashscopeClient(ModelClient):
     def init_async_client(self):
         api_key, workspace_id, base_url = self._prepare_client_config()
         
-        client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_async_http_client())
         
         # Store workspace_id for later use in requests
         if workspace_id:
@@ -506,8 +507,7 @@ class DashscopeClient(ModelClient):
         self, api_kwargs: Dict = {}, model_type: ModelType = ModelType.UNDEFINED
     ):
         """Async call to the Dashscope API."""
-        if not self.async_client:
-            self.async_client = self.init_async_client()
+        self.async_client = async_client = loop_async_client(self.async_client, self.init_async_client)
 
         if model_type == ModelType.LLM:
             if not api_kwargs.get("stream", False):
@@ -516,7 +516,7 @@ class DashscopeClient(ModelClient):
                 extra_body["enable_thinking"] = False
                 api_kwargs["extra_body"] = extra_body
 
-            completion = await self.async_client.chat.completions.create(**api_kwargs)
+            completion = await async_client.chat.completions.create(**api_kwargs)
             return completion
         elif model_type == ModelType.EMBEDDER:
             # Extract input texts from api_kwargs
@@ -555,7 +555,7 @@ class DashscopeClient(ModelClient):
             log.info(f"🔍 DashScope async embedding API call with {len(valid_texts)} valid texts out of {len(texts)} total")
             
             try:
-                response = await self.async_client.embeddings.create(**filtered_api_kwargs)
+                response = await async_client.embeddings.create(**filtered_api_kwargs)
                 log.info(f"🔍 DashScope async API call successful, response type: {type(response)}")
                 result = self.parse_embedding_response(response)
                 
@@ -1,20 +1,29 @@
 import adalflow as adal
 from adalflow.core.types import Document, List
 from adalflow.components.data_process import TextSplitter, ToEmbeddings
+from adalflow.core.embedder import BatchEmbedder
 import os
 import subprocess
 import json
 import tiktoken
 import logging
 import base64
+import hashlib
 import re
 import glob
 from adalflow.utils import get_adalflow_default_root_path
 from adalflow.core.db import LocalDB
 from api.config import configs, DEFAULT_EXCLUDED_DIRS, DEFAULT_EXCLUDED_FILES
+from api.atomic_io import atomic_replace, file_lock
+from api.index_store import IndexStore, write_index_store, migrate_pickle_to_index_store
+from api.vector_index import build_faiss_index
+from api.lexical_index import build_lexical_index
+from api.storage_manager import KIND_INDEX, KIND_REPO, get_storage_manager
+from api.retriever_cache import get_retriever_cache
 from api.ollama_patch import OllamaDocumentProcessor
+from api.cancellation import check_cancelled
+from api.http_pool import get_requests_session
 from urllib.parse import urlparse, urlunparse, quote
-import requests
 from requests.exceptions import RequestException
 
 from api.tools.embedder import get_embedder
@@ -405,6 +414,19 @@ def read_all_documents(path: str, embedder_type: str = None, is_ollama_embedder:
     logger.info(f"Found {len(documents)} documents")
     return documents
 
+class CancellableBatchEmbedder(BatchEmbedder):
+    """BatchEmbedder that stops between batches once the request is cancelled."""
+
+    def call(self, input, model_kwargs=None):
+        if isinstance(input, str):
+            input = [input]
+        embeddings = []
+        for i in range(0, len(input), self.batch_size):
+            # Raises RequestCancelled if the client that asked for this index went away
+            check_cancelled("embedding")
+            embeddings.append(self.embedder.call(input=input[i:i + self.batch_size], model_kwargs=model_kwargs or {}))
+        return embeddings
+
 def prepare_data_pipeline(embedder_type: str = None, is_ollama_embedder: bool = None):
     """
     Creates and returns the data transformation pipeline.
@@ -443,6 +465,9 @@ def prepare_data_pipeline(embedder_type: str = None, is_ollama_embedder: bool =
         embedder_transformer = ToEmbeddings(
             embedder=embedder, batch_size=batch_size
         )
+        embedder_transformer.batch_embedder = CancellableBatchEmbedder(
+            embedder=embedder, batch_size=batch_size
+        )
 
     data_transformer = adal.Sequential(
         splitter, embedder_transformer
@@ -472,9 +497,104 @@ def transform_documents_and_save_to_db(
     db.load(documents)
     db.transform(key="split_and_embed")
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    db.save_state(filepath=db_path)
+    # Pickle to a temporary file and rename it, so a crash never leaves a truncated database
+    with file_lock(db_path):
+        tmp_path = f"{db_path}.{os.getpid()}.tmp"
+        db.save_state(filepath=tmp_path)
+        atomic_replace(tmp_path, db_path)
     return db
 
+def get_index_fingerprint(embedder_type: str = None,
+                          excluded_dirs: List[str] = None, excluded_files: List[str] = None,
+                          included_dirs: List[str] = None, included_files: List[str] = None) -> tuple:
+    """
+    Compute the fingerprint of everything that determines an index store's contents.
+
+    Stores built with different embedders, models, dimensions, splitter settings or
+    file filters are not interchangeable, so each combination gets its own store.
+
+    Args:
+        embedder_type (str, optional): The embedder type. If None, determined from configuration.
+        excluded_dirs, excluded_files, included_dirs, included_files: The request's file filters.
+
+    Returns:
+        tuple: (fingerprint, key) where key is the dict the fingerprint was computed from.
+    """
+    from api.config import get_embedder_config_by_type, get_embedder_type
+
+    if embedder_type is None:
+        embedder_type = get_embedder_type()
+    embedder_config = get_embedder_config_by_type(embedder_type)
+    model_kwargs = embedder_config.get("model_kwargs", {})
+
+    key = {
+        "embedder_type": embedder_type,
+        "embedder_client": embedder_config.get("client_class"),
+        "model": model_kwargs.get("model"),
+        "dimensions": model_kwargs.get("dimensions"),
+        "text_splitter": configs.get("text_splitter", {}),
+        "filters": {
+            "excluded_dirs": sorted(excluded_dirs or []),
+            "excluded_files": sorted(excluded_files or []),
+            "included_dirs": sorted(included_dirs or []),
+            "included_files": sorted(included_files or []),
+        },
+    }
+    fingerprint = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return fingerprint, key
+
+def probe_embedding_dimensions(embedder_type: str = None) -> int:
+    """
+    Embed a short probe string to find the dimension the configured embedder produces.
+
+    Args:
+        embedder_type (str, optional): The embedder type. If None, determined from configuration.
+
+    Returns:
+        int: The embedding dimension, or None if the embedder could not be reached.
+    """
+    try:
+        result = get_embedder(embedder_type=embedder_type)(input="dimension probe")
+        if result.error or not result.data:
+            logger.warning(f"Embedding dimension probe failed: {result.error}")
+            return None
+        return len(result.data[0].embedding)
+    except Exception as e:
+        logger.warning(f"Embedding dimension probe failed: {e}")
+        return None
+
+def transform_documents_and_save_to_store(
+    documents: List[Document], store_dir: str, embedder_type: str = None,
+    manifest_extra: dict = None
+) -> IndexStore:
+    """
+    Transforms a list of documents and writes them to a columnar index store.
+
+    Args:
+        documents (list): A list of `Document` objects.
+        store_dir (str): The directory of the index store.
+        embedder_type (str, optional): The embedder type ('openai', 'google', 'ollama').
+                                     If None, will be determined from configuration.
+        manifest_extra (dict, optional): Extra fields to record in the store manifest.
+
+    Returns:
+        IndexStore: The written store, opened for reading.
+    """
+    data_transformer = prepare_data_pipeline(embedder_type)
+    transformed_docs = data_transformer(documents)
+    store = write_index_store(transformed_docs, store_dir, source_documents=documents,
+                              manifest_extra=manifest_extra)
+    _build_search_indexes(store)
+    return store
+
+def _build_search_indexes(store: IndexStore) -> None:
+    """Persist the FAISS and BM25 indexes next to a freshly written store so queries never rebuild them."""
+    try:
+        build_faiss_index(store)
+    except ValueError as e:
+        logger.warning(f"Skipping FAISS index build: {e}")
+    build_lexical_index(store)
+
 def get_github_file_content(repo_url: str, file_path: str, access_token: str = None) -> str:
     """
     Retrieves the content of a file from a GitHub repository using the GitHub API.
@@ -524,7 +644,7 @@ def get_github_file_content(repo_url: str, file_path: str, access_token: str = N
             headers["Authorization"] = f"token {access_token}"
         logger.info(f"Fetching file content from GitHub API: {api_url}")
         try:
-            response = requests.get(api_url, headers=headers)
+            response = get_requests_session().get(api_url, headers=headers)
             response.raise_for_status()
         except RequestException as e:
             raise ValueError(f"Error fetching file content: {e}")
@@ -595,7 +715,7 @@ def get_gitlab_file_content(repo_url: str, file_path: str, access_token: str = N
             if access_token:
                 project_headers["PRIVATE-TOKEN"] = access_token
             
-            project_response = requests.get(project_info_url, headers=project_headers)
+            project_response = get_requests_session().get(project_info_url, headers=project_headers)
             if project_response.status_code == 200:
                 project_data = project_response.json()
                 default_branch = project_data.get('default_branch', 'main')
@@ -614,7 +734,7 @@ def get_gitlab_file_content(repo_url: str, file_path: str, access_token: str = N
             headers["PRIVATE-TOKEN"] = access_token
         logger.info(f"Fetching file content from GitLab API: {api_url}")
         try:
-            response = requests.get(api_url, headers=headers)
+            response = get_requests_session().get(api_url, headers=headers)
             response.raise_for_status()
             content = response.text
         except RequestException as e:
@@ -666,7 +786,7 @@ def get_bitbucket_file_content(repo_url: str, file_path: str, access_token: str
             if access_token:
                 repo_headers["Authorization"] = f"Bearer {access_token}"
             
-            repo_response = requests.get(repo_info_url, headers=repo_headers)
+            repo_response = get_requests_session().get(repo_info_url, headers=repo_headers)
             if repo_response.status_code == 200:
                 repo_data = repo_response.json()
                 default_branch = repo_data.get('mainbranch', {}).get('name', 'main')
@@ -688,7 +808,7 @@ def get_bitbucket_file_content(repo_url: str, file_path: str, access_token: str
             headers["Authorization"] = f"Bearer {access_token}"
         logger.info(f"Fetching file content from Bitbucket API: {api_url}")
         try:
-            response = requests.get(api_url, headers=headers)
+            response = get_requests_session().get(api_url, headers=headers)
             if response.status_code == 200:
                 content = response.text
             elif response.status_code == 404:
@@ -736,7 +856,7 @@ def get_file_content(repo_url: str, file_path: str, type: str = "github", access
 
 class DatabaseManager:
     """
-    Manages the creation, loading, transformation, and persistence of LocalDB instances.
+    Manages the creation, loading, transformation, and persistence of repository index stores.
     """
 
     def __init__(self):
@@ -772,8 +892,10 @@ class DatabaseManager:
         
         self.reset_database()
         self._create_repo(repo_url_or_path, type, access_token)
-        return self.prepare_db_index(embedder_type=embedder_type, excluded_dirs=excluded_dirs, excluded_files=excluded_files,
-                                   included_dirs=included_dirs, included_files=included_files)
+        documents = self.prepare_db_index(embedder_type=embedder_type, excluded_dirs=excluded_dirs, excluded_files=excluded_files,
+                                          included_dirs=included_dirs, included_files=included_files)
+        get_storage_manager().touch(KIND_INDEX, self.repo_paths["repo_name"], self.repo_paths["index_store_dir"])
+        return documents
 
     def reset_database(self):
         """
@@ -803,7 +925,8 @@ class DatabaseManager:
         Download and prepare all paths.
         Paths:
         ~/.adalflow/repos/{owner}_{repo_name} (for url, local path will be the same)
-        ~/.adalflow/databases/{owner}_{repo_name}.pkl
+        ~/.adalflow/databases/{owner}_{repo_name}/{fingerprint}/ (index stores, one per embedder configuration)
+        ~/.adalflow/databases/{owner}_{repo_name}.pkl (legacy LocalDB, migrated on first load)
 
         Args:
             repo_url_or_path (str): The URL or local path of the repository
@@ -823,23 +946,29 @@ class DatabaseManager:
 
                 save_repo_dir = os.path.join(root_path, "repos", repo_name)
 
-                # Check if the repository directory already exists and is not empty
-                if not (os.path.exists(save_repo_dir) and os.listdir(save_repo_dir)):
-                    # Only download if the repository doesn't exist or is empty
-                    download_repo(repo_url_or_path, save_repo_dir, repo_type, access_token)
-                else:
-                    logger.info(f"Repository already exists at {save_repo_dir}. Using existing repository.")
+                # Serialize clones of the same repository across processes
+                with file_lock(save_repo_dir):
+                    # Check if the repository directory already exists and is not empty
+                    if not (os.path.exists(save_repo_dir) and os.listdir(save_repo_dir)):
+                        # Only download if the repository doesn't exist or is empty
+                        download_repo(repo_url_or_path, save_repo_dir, repo_type, access_token)
+                    else:
+                        logger.info(f"Repository already exists at {save_repo_dir}. Using existing repository.")
+                get_storage_manager().touch(KIND_REPO, repo_name, save_repo_dir)
             else:  # local path
                 repo_name = os.path.basename(repo_url_or_path)
                 save_repo_dir = repo_url_or_path
 
             save_db_file = os.path.join(root_path, "databases", f"{repo_name}.pkl")
+            save_index_dir = os.path.join(root_path, "databases", repo_name)
             os.makedirs(save_repo_dir, exist_ok=True)
             os.makedirs(os.path.dirname(save_db_file), exist_ok=True)
 
             self.repo_paths = {
+                "repo_name": repo_name,
                 "save_repo_dir": save_repo_dir,
                 "save_db_file": save_db_file,
+                "save_index_dir": save_index_dir,
             }
             self.repo_url_or_path = repo_url_or_path
             logger.info(f"Repo paths: {self.repo_paths}")
@@ -870,36 +999,99 @@ class DatabaseManager:
         # Handle backward compatibility
         if embedder_type is None and is_ollama_embedder is not None:
             embedder_type = 'ollama' if is_ollama_embedder else None
-        # check the database
-        if self.repo_paths and os.path.exists(self.repo_paths["save_db_file"]):
-            logger.info("Loading existing database...")
-            try:
-                self.db = LocalDB.load_state(self.repo_paths["save_db_file"])
-                documents = self.db.get_transformed_data(key="split_and_embed")
-                if documents:
-                    logger.info(f"Loaded {len(documents)} documents from existing database")
-                    return documents
-            except Exception as e:
-                logger.error(f"Error loading existing database: {e}")
-                # Continue to create a new database
-
-        # prepare the database
-        logger.info("Creating new database...")
-        documents = read_all_documents(
-            self.repo_paths["save_repo_dir"],
-            embedder_type=embedder_type,
-            excluded_dirs=excluded_dirs,
-            excluded_files=excluded_files,
-            included_dirs=included_dirs,
-            included_files=included_files
+        # Each embedder/pipeline/filter configuration has its own store under the repo's index dir
+        fingerprint, index_key = get_index_fingerprint(
+            embedder_type, excluded_dirs, excluded_files, included_dirs, included_files
         )
-        self.db = transform_documents_and_save_to_db(
-            documents, self.repo_paths["save_db_file"], embedder_type=embedder_type
-        )
-        logger.info(f"Total documents: {len(documents)}")
-        transformed_docs = self.db.get_transformed_data(key="split_and_embed")
-        logger.info(f"Total transformed documents: {len(transformed_docs)}")
-        return transformed_docs
+        manifest_extra = {"fingerprint": fingerprint, "index_key": index_key}
+        store_dir = os.path.join(self.repo_paths["save_index_dir"], fingerprint)
+        self.repo_paths["index_store_dir"] = store_dir
+
+        # check the index store
+        documents = self._load_index_store(store_dir, fingerprint)
+        if documents is not None:
+            return documents
+
+        # Serialize builds of the same store across API workers and CLI processes
+        with file_lock(store_dir):
+            # Another process may have finished the build while we waited for the lock
+            documents = self._load_index_store(store_dir, fingerprint)
+            if documents is not None:
+                return documents
+            # Whatever is cached for this store is about to be replaced
+            get_retriever_cache().invalidate(store_dir)
+
+            # migrate a legacy LocalDB pickle if it matches the current embedder. Pickles record
+            # neither their filters nor their embedder, so only the unfiltered store is migrated,
+            # and only once the vector dimension is known from the config or a probe embedding
+            unfiltered = not any(index_key["filters"].values())
+            if unfiltered and os.path.exists(self.repo_paths["save_db_file"]):
+                logger.info("Migrating existing database to index store...")
+                try:
+                    expected_dimensions = index_key["dimensions"] or probe_embedding_dimensions(embedder_type)
+                    if not expected_dimensions:
+                        logger.warning("Embedding dimension unknown, not migrating the legacy database")
+                    else:
+                        self.db = migrate_pickle_to_index_store(
+                            self.repo_paths["save_db_file"], store_dir,
+                            expected_dimensions=expected_dimensions,
+                            manifest_extra=manifest_extra,
+                        )
+                    if self.db is not None and len(self.db) > 0:
+                        _build_search_indexes(self.db)
+                        logger.info(f"Loaded {len(self.db)} documents from migrated database")
+                        return self.db.documents()
+                except Exception as e:
+                    logger.error(f"Error migrating existing database: {e}")
+                    # Continue to create a new database
+
+            # prepare the database
+            logger.info("Creating new database...")
+            documents = read_all_documents(
+                self.repo_paths["save_repo_dir"],
+                embedder_type=embedder_type,
+                excluded_dirs=excluded_dirs,
+                excluded_files=excluded_files,
+                included_dirs=included_dirs,
+                included_files=included_files
+            )
+            self.db = transform_documents_and_save_to_store(
+                documents, store_dir, embedder_type=embedder_type, manifest_extra=manifest_extra
+            )
+            logger.info(f"Total documents: {len(documents)}")
+            logger.info(f"Total transformed documents: {len(self.db)}")
+            return self.db.documents()
+
+    def _load_index_store(self, store_dir: str, fingerprint: str):
+        """
+        Open an existing, complete index store built with the expected fingerprint.
+
+        Returns:
+            The store's documents, or None if it has to be (re)built.
+        """
+        if not IndexStore.exists(store_dir):
+            return None
+        # Reuse the store a cached retriever already has open
+        cached = get_retriever_cache().get(store_dir)
+        if cached is not None and cached.store.fingerprint == fingerprint:
+            self.db = cached.store
+            return self.db.documents()
+        logger.info(f"Loading existing index store {fingerprint}...")
+        try:
+            self.db = IndexStore.open(store_dir)
+            if self.db.fingerprint != fingerprint:
+                logger.warning(
+                    f"Index store at {store_dir} was built with a different configuration "
+                    f"({self.db.fingerprint}), rebuilding"
+                )
+            elif len(self.db) > 0:
+                logger.info(f"Loaded {len(self.db)} documents from existing index store")
+                return self.db.documents()
+            self.db.close()
+        except Exception as e:
+            logger.error(f"Error loading existing index store: {e}")
+        self.db = None
+        return None
 
     def prepare_retriever(self, repo_url_or_path: str, type: str = "github", access_token: str = None):
         """
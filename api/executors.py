@@ -0,0 +1,204 @@
+"""
+Bounded executors for blocking work done on behalf of async request handlers.
+
+The chat endpoints are coroutines on one event loop. Preparing a retriever
+(clone, file reads, embedding calls, index loads) and running retrieval (query
+embedding, FAISS search) are blocking. Run inline, one cold repository would
+stall token streaming for every other connection. Handlers hand that work to
+two thread pools instead:
+
+    io   - clones, file and index loads, HTTP calls to embedding providers
+    cpu  - retrieval (FAISS releases the GIL during search)
+
+Pool sizes bound how much of each kind of work runs at once
+(DEEPWIKI_IO_WORKERS, DEEPWIKI_CPU_WORKERS). A loop-lag monitor measures how
+late the event loop wakes up from a fixed sleep. If blocking work still reaches
+the loop, this lag grows.
+
+Tasks run in a copy of the caller's context, so a request's cancel token
+reaches the worker thread. A task cancelled while still queued never runs.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+import concurrent.futures
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from api.cancellation import record_cancellation
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS_ENV = "DEEPWIKI_IO_WORKERS"
+CPU_WORKERS_ENV = "DEEPWIKI_CPU_WORKERS"
+DEFAULT_IO_WORKERS = 8
+DEFAULT_CPU_WORKERS = min(4, os.cpu_count() or 1)
+
+# Loop lag sampling interval and how many samples are kept for stats
+LOOP_LAG_INTERVAL = 0.25
+LOOP_LAG_SAMPLES = 240
+# Lag above this is logged as a warning
+LOOP_LAG_WARN_MS = 200.0
+
+
+def _workers_from_env(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={os.environ.get(name)!r}, using {default}")
+        return default
+
+
+class BoundedExecutor:
+    """A named thread pool that counts queued and running tasks."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"deepwiki-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    def _run(self, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool and await its result."""
+        with self._lock:
+            self.queued += 1
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        future = self._executor.submit(self._run, call)
+        future.add_done_callback(self._dequeued)
+        return await asyncio.wrap_future(future)
+
+    def _dequeued(self, future: concurrent.futures.Future) -> None:
+        # A future is only cancelled if it had not started, so _run never saw it
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+            record_cancellation("queued")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(name: str, env_name: str, default_workers: int) -> BoundedExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = BoundedExecutor(name, _workers_from_env(env_name, default_workers))
+                _executors[name] = executor
+                logger.info(f"Started {name} executor with {executor.max_workers} workers")
+    return executor
+
+
+def get_io_executor() -> BoundedExecutor:
+    """Return the process-wide pool for blocking I/O."""
+    return _get_executor("io", IO_WORKERS_ENV, DEFAULT_IO_WORKERS)
+
+
+def get_cpu_executor() -> BoundedExecutor:
+    """Return the process-wide pool for CPU-bound work."""
+    return _get_executor("cpu", CPU_WORKERS_ENV, DEFAULT_CPU_WORKERS)
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking I/O call on the I/O pool."""
+    return await get_io_executor().run(func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """Run a CPU-bound call on the CPU pool."""
+    return await get_cpu_executor().run(func, *args, **kwargs)
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes from a fixed sleep."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, max_samples: int = LOOP_LAG_SAMPLES):
+        self.interval = interval
+        self._samples = deque(maxlen=max_samples)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = (time.perf_counter() - start - self.interval) * 1000
+            self._samples.append(max(lag_ms, 0.0))
+            if lag_ms > LOOP_LAG_WARN_MS:
+                logger.warning(f"Event loop lag {lag_ms:.0f} ms: blocking work is running on the loop")
+
+    def start(self) -> None:
+        """Start sampling on the running loop; does nothing if already started."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sample())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        """Lag over the kept samples, in milliseconds."""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "last_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(samples),
+            "last_ms": round(self._samples[-1], 2),
+            "p50_ms": round(samples[len(samples) // 2], 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+            "max_ms": round(samples[-1], 2),
+        }
+
+
+_loop_lag_monitor = LoopLagMonitor()
+
+
+def get_loop_lag_monitor() -> LoopLagMonitor:
+    """Return the process-wide loop lag monitor."""
+    return _loop_lag_monitor
+
+
+def executor_stats() -> Dict[str, Any]:
+    """Pool usage and event loop lag, for the metrics endpoint."""
+    return {
+        "io": get_io_executor().stats(),
+        "cpu": get_cpu_executor().stats(),
+        "loop_lag": get_loop_lag_monitor().stats(),
+    }
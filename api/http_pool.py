@@ -0,0 +1,252 @@
+"""
+Shared HTTP connection pools for provider clients and repository API helpers.
+
+Provider SDK clients, the OpenRouter client and the repository API helpers used
+to open their own HTTP connections, often per request. Each request then paid
+for DNS, TCP and TLS setup before the first token. They now draw from pools
+kept for the life of the process:
+
+    httpx.Client       - sync OpenAI-compatible SDK clients (OpenAI, Azure, DashScope)
+    httpx.AsyncClient  - async SDK clients, one per event loop (see loop_async_client)
+    aiohttp session    - OpenRouter, one per event loop
+    requests.Session   - GitHub/GitLab/Bitbucket API helpers, Ollama probes
+
+Connections are kept alive between requests, and HTTP/2 is used where the h2
+package is installed and the server supports it. Pool sizes and timeouts come
+from DEEPWIKI_HTTP_* environment variables. close_http_pools() closes
+everything at shutdown.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional
+
+import aiohttp
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS_ENV = "DEEPWIKI_HTTP_MAX_CONNECTIONS"
+MAX_KEEPALIVE_ENV = "DEEPWIKI_HTTP_MAX_KEEPALIVE"
+KEEPALIVE_EXPIRY_ENV = "DEEPWIKI_HTTP_KEEPALIVE_EXPIRY"
+CONNECT_TIMEOUT_ENV = "DEEPWIKI_HTTP_CONNECT_TIMEOUT"
+READ_TIMEOUT_ENV = "DEEPWIKI_HTTP_READ_TIMEOUT"
+HTTP2_ENV = "DEEPWIKI_HTTP2"
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# Long answers stream for minutes; the SDKs pass their own per-request timeouts on top
+DEFAULT_READ_TIMEOUT = 600.0
+
+
+def _number_from_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.environ.get(name, default)))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={os.environ.get(name)!r}, using {default}")
+        return default
+
+
+class HttpPoolSettings:
+    """Pool sizes and timeouts, read from the environment."""
+
+    def __init__(self):
+        self.max_connections = int(_number_from_env(MAX_CONNECTIONS_ENV, DEFAULT_MAX_CONNECTIONS)) or 1
+        self.max_keepalive = min(int(_number_from_env(MAX_KEEPALIVE_ENV, DEFAULT_MAX_KEEPALIVE)),
+                                 self.max_connections)
+        self.keepalive_expiry = _number_from_env(KEEPALIVE_EXPIRY_ENV, DEFAULT_KEEPALIVE_EXPIRY)
+        self.connect_timeout = _number_from_env(CONNECT_TIMEOUT_ENV, DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = _number_from_env(READ_TIMEOUT_ENV, DEFAULT_READ_TIMEOUT)
+        wants_http2 = os.environ.get(HTTP2_ENV, "true").lower() in ("true", "1", "t", "yes")
+        # httpx speaks HTTP/2 only with the optional h2 package
+        self.http2 = wants_http2 and importlib.util.find_spec("h2") is not None
+        if wants_http2 and not self.http2:
+            logger.info("HTTP/2 disabled: the h2 package is not installed")
+
+    def httpx_limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies the pool's timeouts to calls that do not pass their own."""
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+
+class HttpPools:
+    """The process-wide HTTP clients, created on first use."""
+
+    def __init__(self, settings: Optional[HttpPoolSettings] = None):
+        self.settings = settings or HttpPoolSettings()
+        self._lock = threading.Lock()
+        self._sync_client: Optional[httpx.Client] = None
+        self._requests_session: Optional[requests.Session] = None
+        # Async clients hold connections bound to the loop that opened them
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+            weakref.WeakKeyDictionary()
+        self._aiohttp_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = \
+            weakref.WeakKeyDictionary()
+
+    def sync_client(self) -> httpx.Client:
+        """The shared httpx client for sync SDK clients."""
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(
+                        limits=self.settings.httpx_limits(),
+                        timeout=self.settings.httpx_timeout(),
+                        http2=self.settings.http2,
+                        follow_redirects=True,
+                    )
+        return self._sync_client
+
+    def async_client(self) -> httpx.AsyncClient:
+        """The shared httpx client of the running event loop, for async SDK clients."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self.settings.httpx_limits(),
+                timeout=self.settings.httpx_timeout(),
+                http2=self.settings.http2,
+                follow_redirects=True,
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def aiohttp_session(self) -> aiohttp.ClientSession:
+        """The shared aiohttp session of the running event loop."""
+        loop = asyncio.get_running_loop()
+        session = self._aiohttp_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.settings.max_connections,
+                keepalive_timeout=self.settings.keepalive_expiry,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.settings.read_timeout,
+                                              connect=self.settings.connect_timeout),
+            )
+            self._aiohttp_sessions[loop] = session
+        return session
+
+    def requests_session(self) -> requests.Session:
+        """The shared requests session for repository API helpers."""
+        if self._requests_session is None:
+            with self._lock:
+                if self._requests_session is None:
+                    session = requests.Session()
+                    adapter = _TimeoutHTTPAdapter(
+                        (self.settings.connect_timeout, self.settings.read_timeout),
+                        pool_connections=self.settings.max_keepalive,
+                        pool_maxsize=self.settings.max_connections,
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._requests_session = session
+        return self._requests_session
+
+    async def close(self) -> None:
+        """Close every pooled client; async clients of other event loops are only dropped."""
+        with self._lock:
+            sync_client, self._sync_client = self._sync_client, None
+            requests_session, self._requests_session = self._requests_session, None
+            async_clients = list(self._async_clients.items())
+            aiohttp_sessions = list(self._aiohttp_sessions.items())
+            self._async_clients.clear()
+            self._aiohttp_sessions.clear()
+        if sync_client is not None:
+            sync_client.close()
+        if requests_session is not None:
+            requests_session.close()
+        loop = asyncio.get_running_loop()
+        for owner, client in async_clients:
+            if owner is loop:
+                await client.aclose()
+        for owner, session in aiohttp_sessions:
+            if owner is loop:
+                await session.close()
+        logger.info("Closed shared HTTP connection pools")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.settings.http2,
+            "max_connections": self.settings.max_connections,
+            "max_keepalive": self.settings.max_keepalive,
+            "async_clients": len(self._async_clients),
+            "aiohttp_sessions": len(self._aiohttp_sessions),
+        }
+
+
+_http_pools: Optional[HttpPools] = None
+_http_pools_lock = threading.Lock()
+
+
+def get_http_pools() -> HttpPools:
+    """Return the process-wide HTTP pools."""
+    global _http_pools
+    if _http_pools is None:
+        with _http_pools_lock:
+            if _http_pools is None:
+                _http_pools = HttpPools()
+    return _http_pools
+
+
+def get_sync_http_client() -> httpx.Client:
+    return get_http_pools().sync_client()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    return get_http_pools().async_client()
+
+
+def loop_async_client(sdk_client: Any, init: Callable[[], Any]) -> Any:
+    """
+    Return an async SDK client over the running event loop's pooled connections.
+
+    A pooled provider client is shared across event loops, but the httpx client
+    its async SDK client wraps belongs to one loop.
+
+    Args:
+        sdk_client: The SDK client cached so far, or None.
+        init: Creates an SDK client over get_async_http_client().
+
+    Returns:
+        sdk_client if it already uses this loop's connections, otherwise a new one.
+    """
+    if sdk_client is None or getattr(sdk_client, "_client", None) is not get_async_http_client():
+        return init()
+    return sdk_client
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    return get_http_pools().aiohttp_session()
+
+
+def get_requests_session() -> requests.Session:
+    return get_http_pools().requests_session()
+
+
+async def close_http_pools() -> None:
+    """Close the shared HTTP pools, e.g. at application shutdown."""
+    if _http_pools is not None:
+        await _http_pools.close()
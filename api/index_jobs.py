@@ -0,0 +1,371 @@
+"""
+Preparing repository indexes before the first question is asked.
+
+Cloning, embedding and indexing a repository used to start only when its first
+chat request arrived, so that answer waited minutes. Two things move the work
+earlier:
+
+    POST /api/index/prepare   the frontend starts a job as soon as a repository
+                              page opens, and polls its status by job id
+    startup preload           the DEEPWIKI_PRELOAD_INDEXES most recently used
+                              index stores are loaded into the retriever cache
+                              before the server accepts requests
+
+A job prepares exactly what a chat request would (same embedder, same file
+filters), so the chat request that follows finds its retriever cached.
+
+Jobs are recorded in an SQLite file (`index_jobs.sqlite` under the adalflow
+root), so every worker process can report a job's status and a repeated request
+reaching another worker joins the running job instead of starting a second one.
+The job runs in the worker that accepted it; other workers load the finished
+index into their own retriever cache when they are polled for a ready job, or
+on their first chat request for it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from adalflow.utils import get_adalflow_default_root_path
+
+from api.config import get_embedder_type
+from api.data_pipeline import DatabaseManager
+from api.executors import run_io
+from api.index_store import IndexStore
+from api.retriever_cache import get_retriever_cache
+from api.storage_manager import KIND_INDEX, get_storage_manager
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_ENV = "DEEPWIKI_PRELOAD_INDEXES"
+JOB_DB_FILE = "index_jobs.sqlite"
+
+# How long a finished job's status can still be read
+JOB_TTL_SECONDS = 3600.0
+# Jobs kept at most; the oldest finished ones are dropped first
+MAX_JOBS = 1000
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_READY = "ready"
+JOB_FAILED = "failed"
+
+# IndexJob fields, then the manager running the job and its process
+_JOB_COLUMNS = ("job_id, repo_url, repo_type, status, error, num_chunks, created_at, finished_at, store_dir, "
+                "owner, owner_pid")
+
+
+def split_filter(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a newline-separated, URL-encoded file filter as the chat endpoints receive it."""
+    if not value:
+        return None
+    return [unquote(item) for item in value.split("\n") if item.strip()] or None
+
+
+def prepare_index(repo_url: str, repo_type: str = "github", access_token: Optional[str] = None,
+                  excluded_dirs: Optional[List[str]] = None, excluded_files: Optional[List[str]] = None,
+                  included_dirs: Optional[List[str]] = None,
+                  included_files: Optional[List[str]] = None) -> Tuple[int, str]:
+    """
+    Clone and index a repository if needed, and load its retriever into the cache.
+
+    Args:
+        repo_url: URL or local path of the repository.
+        repo_type: Type of repository (github, gitlab, bitbucket).
+        access_token: Access token for private repositories.
+        excluded_dirs, excluded_files, included_dirs, included_files: File filters, as for chat requests.
+
+    Returns:
+        tuple: Number of chunks in the index, and the index store directory.
+    """
+    db_manager = DatabaseManager()
+    db_manager.prepare_database(
+        repo_url,
+        repo_type,
+        access_token,
+        embedder_type=get_embedder_type(),
+        excluded_dirs=excluded_dirs,
+        excluded_files=excluded_files,
+        included_dirs=included_dirs,
+        included_files=included_files,
+    )
+    store = db_manager.db
+    if store is None or not store.manifest.get("num_with_vectors", 0):
+        raise ValueError("No valid documents with embeddings found. Cannot create retriever.")
+    get_retriever_cache().load(store.store_dir, store=store)
+    return len(store), store.store_dir
+
+
+@dataclass
+class IndexJob:
+    """One background preparation of a repository index."""
+    job_id: str
+    repo_url: str
+    repo_type: str
+    status: str = JOB_QUEUED
+    error: Optional[str] = None
+    num_chunks: int = 0
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    store_dir: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_READY, JOB_FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "repo_url": self.repo_url,
+            "type": self.repo_type,
+            "status": self.status,
+            "error": self.error,
+            "num_chunks": self.num_chunks,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class IndexJobManager:
+    """Index preparation jobs, shared by the worker processes through SQLite."""
+
+    def __init__(self, db_path: Optional[str] = None, ttl: float = JOB_TTL_SECONDS, max_jobs: int = MAX_JOBS):
+        self.db_path = db_path or os.path.join(get_adalflow_default_root_path(), JOB_DB_FILE)
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        # Jobs running in this worker; a restarted worker may reuse a pid, so rows also record this id
+        self.owner = uuid.uuid4().hex
+        self.pid = os.getpid()
+        self._running: Dict[str, IndexJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        # Autocommit, so submit() can take the database write lock with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS index_jobs (
+                job_id TEXT PRIMARY KEY,
+                job_key TEXT NOT NULL,
+                repo_url TEXT NOT NULL,
+                repo_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                num_chunks INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                store_dir TEXT,
+                owner TEXT NOT NULL,
+                owner_pid INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS index_jobs_key ON index_jobs (job_key, status);
+        """)
+
+    def _is_running(self, row: tuple) -> bool:
+        """Whether the unfinished job of a row still has a worker running it."""
+        owner, owner_pid = row[-2:]
+        if owner == self.owner:
+            return row[0] in self._running
+        return owner_pid != self.pid and _pid_alive(owner_pid)
+
+    def _job_from_row(self, row: tuple) -> IndexJob:
+        """The job of a row; an unfinished job whose worker is gone is marked failed."""
+        job = IndexJob(*row[:-2])
+        if not job.done and not self._is_running(row):
+            job.status = JOB_FAILED
+            job.error = "The worker preparing the index stopped before it finished"
+            job.finished_at = time.time()
+            self._save(job)
+        return job
+
+    def _save(self, job: IndexJob) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE index_jobs SET status = ?, error = ?, num_chunks = ?, finished_at = ?, store_dir = ? "
+                "WHERE job_id = ?",
+                (job.status, job.error, job.num_chunks, job.finished_at, job.store_dir, job.job_id),
+            )
+
+    async def submit(self, repo_url: str, repo_type: str = "github", access_token: Optional[str] = None,
+                     excluded_dirs: Optional[List[str]] = None, excluded_files: Optional[List[str]] = None,
+                     included_dirs: Optional[List[str]] = None,
+                     included_files: Optional[List[str]] = None) -> IndexJob:
+        """
+        Start preparing a repository's index, or return the job already doing so in any worker.
+
+        Returns:
+            IndexJob: The job; poll it with get(job.job_id).
+        """
+        filters = (excluded_dirs, excluded_files, included_dirs, included_files)
+        # The write lock may be held by another worker for up to the connection timeout
+        job, created = await run_io(self._claim, json.dumps([repo_url, repo_type, *filters]), repo_url, repo_type)
+        if not created:
+            return job
+
+        def run() -> Tuple[int, str]:
+            job.status = JOB_RUNNING
+            self._save(job)
+            return prepare_index(repo_url, repo_type, access_token, *filters)
+
+        self._tasks[job.job_id] = asyncio.get_running_loop().create_task(self._run(job, run))
+        logger.info(f"Started index job {job.job_id} for {repo_url}")
+        return job
+
+    def _claim(self, key: str, repo_url: str, repo_type: str) -> Tuple[IndexJob, bool]:
+        """The active job for a key in any worker, or a new one recorded for this worker, and whether it is new."""
+        self.purge()
+        with self._lock:
+            # Held until COMMIT, so two workers cannot both miss an active job and start one each
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM index_jobs WHERE job_key = ? AND status IN (?, ?) "
+                    "ORDER BY created_at DESC", (key, JOB_QUEUED, JOB_RUNNING)
+                ).fetchall()
+                active = next((row for row in rows if self._is_running(row)), None)
+                if active is None:
+                    job = IndexJob(uuid.uuid4().hex, repo_url, repo_type)
+                    self._conn.execute(
+                        f"INSERT INTO index_jobs (job_key, {_JOB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, job.job_id, repo_url, repo_type, job.status, job.error, job.num_chunks,
+                         job.created_at, job.finished_at, job.store_dir, self.owner, self.pid),
+                    )
+                    self._running[job.job_id] = job
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if active is not None:
+            return self._running.get(active[0]) or IndexJob(*active[:-2]), False
+        return job, True
+
+    async def _run(self, job: IndexJob, run) -> None:
+        try:
+            job.num_chunks, job.store_dir = await run_io(run)
+            job.status = JOB_READY
+            logger.info(f"Index job {job.job_id} for {job.repo_url} is ready ({job.num_chunks} chunks)")
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logger.error(f"Index job {job.job_id} for {job.repo_url} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            await run_io(self._save, job)
+            self._running.pop(job.job_id, None)
+            self._tasks.pop(job.job_id, None)
+
+    async def get(self, job_id: str) -> Optional[IndexJob]:
+        """The job with this id, from whichever worker runs it, or None if it never existed or has expired."""
+        return await run_io(self._get, job_id)
+
+    def _get(self, job_id: str) -> Optional[IndexJob]:
+        self.purge()
+        job = self._running.get(job_id)
+        if job is not None:
+            return job
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM index_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._job_from_row(row) if row is not None else None
+
+    def warm(self, job: IndexJob) -> None:
+        """Load a ready job's index into this worker's retriever cache in the background, if it is not there."""
+        if job.status != JOB_READY or not job.store_dir or get_retriever_cache().get(job.store_dir) is not None:
+            return
+
+        def load() -> None:
+            try:
+                get_retriever_cache().load(job.store_dir)
+            except Exception as e:
+                logger.warning(f"Could not load index store {job.store_dir} of job {job.job_id}: {e}")
+
+        asyncio.get_running_loop().create_task(run_io(load))
+
+    def purge(self) -> None:
+        """Drop finished jobs past their TTL, and the oldest finished ones beyond max_jobs."""
+        with self._lock:
+            self._conn.execute("DELETE FROM index_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                               (JOB_READY, JOB_FAILED, time.time() - self.ttl))
+            self._conn.execute(
+                "DELETE FROM index_jobs WHERE job_id IN (SELECT job_id FROM index_jobs WHERE status IN (?, ?) "
+                "ORDER BY finished_at DESC LIMIT -1 OFFSET MAX(0, ? - "
+                "(SELECT COUNT(*) FROM index_jobs WHERE status NOT IN (?, ?))))",
+                (JOB_READY, JOB_FAILED, self.max_jobs, JOB_READY, JOB_FAILED),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts by status across all workers."""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_READY: 0, JOB_FAILED: 0}
+        with self._lock:
+            for status, count in self._conn.execute("SELECT status, COUNT(*) FROM index_jobs GROUP BY status"):
+                counts[status] = count
+        return counts
+
+
+def preload_count_from_env() -> int:
+    raw = os.environ.get(PRELOAD_ENV, "").strip()
+    try:
+        return max(0, int(raw)) if raw else 0
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {PRELOAD_ENV}: {raw!r}")
+        return 0
+
+
+def preload_recent_indexes(limit: int) -> int:
+    """
+    Load the most recently used index stores into the retriever cache.
+
+    Args:
+        limit: How many stores to load.
+
+    Returns:
+        int: How many were loaded.
+    """
+    loaded = 0
+    start = time.perf_counter()
+    for artifact in get_storage_manager().recent(KIND_INDEX):
+        if loaded >= limit:
+            break
+        # Legacy pickles are migrated by their first chat request, not preloaded
+        if not IndexStore.exists(artifact.path):
+            continue
+        try:
+            get_retriever_cache().load(artifact.path)
+            loaded += 1
+        except Exception as e:
+            logger.warning(f"Could not preload index store {artifact.path}: {e}")
+    logger.info(f"Preloaded {loaded} index store(s) in {time.perf_counter() - start:.1f}s")
+    return loaded
+
+
+_index_job_manager: Optional[IndexJobManager] = None
+_index_job_manager_lock = threading.Lock()
+
+
+def get_index_job_manager() -> IndexJobManager:
+    """Return the process-wide index job manager."""
+    global _index_job_manager
+    if _index_job_manager is None:
+        with _index_job_manager_lock:
+            if _index_job_manager is None:
+                _index_job_manager = IndexJobManager()
+    return _index_job_manager
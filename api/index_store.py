@@ -0,0 +1,665 @@
+"""
+Columnar, memory-mapped index store for repository embeddings.
+
+An index directory replaces the single LocalDB pickle and contains:
+    manifest.json   format version, chunk count, vector dimension, validation counts and
+                    checksum (written last)
+    vectors.npy     float32 matrix (num_chunks x dim), opened with mmap_mode="r"
+    meta.sqlite     per-chunk metadata (file_path, type, flags, text offsets, line ranges)
+                    and the contiguous chunk id range of each file
+    chunks.bin      UTF-8 chunk texts concatenated, located via the offsets in meta.sqlite
+
+Opening a store only reads the manifest and maps the files, so chunk text and
+vectors are paged in on demand when a search or context build touches them.
+
+Embeddings are validated once, when the store is written: rows with a missing or
+wrong-sized vector, non-finite values or zero norm are stored as zeros and flagged
+`has_vector = 0`, so readers never re-inspect documents one by one.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from adalflow.core.types import Document
+
+from api.atomic_io import atomic_write, make_temp_dir, replace_directory
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.sqlite"
+CHUNKS_FILE = "chunks.bin"
+
+# Metadata keys stored as dedicated columns; everything else goes to meta_json
+_COLUMN_META_KEYS = ("file_path", "type", "is_code", "is_implementation", "title", "token_count")
+
+_CHUNK_COLUMNS = (
+    "id, doc_id, parent_doc_id, chunk_order, file_path, type, is_code, is_implementation, "
+    "title, token_count, num_tokens, text_offset, text_length, char_start, char_end, "
+    "line_start, line_end, has_vector, meta_json"
+)
+
+
+def _vector_length(vector: Any) -> int:
+    """Return the length of an embedding vector, or 0 if it is missing or malformed."""
+    if vector is None:
+        return 0
+    try:
+        if hasattr(vector, "shape"):
+            return int(vector.shape[-1]) if len(vector.shape) > 0 else 0
+        return len(vector)
+    except Exception:
+        return 0
+
+
+def _normalize_path(path: Optional[str]) -> str:
+    """Normalize a repository-relative path for comparison ("./src\\a.py" -> "src/a.py")."""
+    path = (path or "").replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    """
+    Metadata predicates that restrict retrieval to part of a repository.
+
+    All given predicates must hold. Paths are repository-relative.
+    """
+    file_path: Optional[str] = None
+    path_prefix: Optional[str] = None
+    is_code: Optional[bool] = None
+    extensions: Optional[Tuple[str, ...]] = None
+
+    def matches(self, file_path: Optional[str], is_code: bool) -> bool:
+        path = _normalize_path(file_path)
+        if self.file_path is not None and path != _normalize_path(self.file_path):
+            return False
+        if self.path_prefix is not None:
+            prefix = _normalize_path(self.path_prefix).rstrip("/")
+            if prefix and path != prefix and not path.startswith(prefix + "/"):
+                return False
+        if self.is_code is not None and bool(is_code) != self.is_code:
+            return False
+        if self.extensions:
+            extension = os.path.splitext(path)[1].lower()
+            if extension not in {("." + e.lstrip(".")).lower() for e in self.extensions}:
+                return False
+        return True
+
+
+def _file_ranges(rows: Iterable[tuple]) -> List[tuple]:
+    """
+    Collapse (id, file_path, is_code) rows, ordered by id, into per-file id ranges.
+
+    Returns:
+        List of (file_path, is_code, start_id, end_id) with end_id exclusive.
+    """
+    ranges: List[list] = []
+    for chunk_id, file_path, is_code in rows:
+        if ranges and ranges[-1][0] == file_path and ranges[-1][3] == chunk_id:
+            ranges[-1][3] = chunk_id + 1
+        else:
+            ranges.append([file_path, int(bool(is_code)), chunk_id, chunk_id + 1])
+    return [tuple(r) for r in ranges]
+
+
+def _validate_vectors(vectors: np.ndarray, lengths: np.ndarray) -> tuple:
+    """
+    Check a stacked embedding matrix in one pass.
+
+    Args:
+        vectors: float32 matrix (num_chunks x dim), with zeros for rows of the wrong length.
+        lengths: Original vector length of each row (0 if missing).
+
+    Returns:
+        (valid, counts): a boolean row mask and the number of rows rejected per reason.
+    """
+    dimensions = vectors.shape[1]
+    missing = lengths == 0
+    wrong_dimension = ~missing & (lengths != dimensions)
+    non_finite = ~np.isfinite(vectors).all(axis=1)
+    # NaNs make the norm NaN, so only count finite rows as zero-norm
+    zero_norm = ~non_finite & (np.einsum("ij,ij->i", vectors, vectors) == 0) & ~missing & ~wrong_dimension
+    valid = ~(missing | wrong_dimension | non_finite | zero_norm) & (dimensions > 0)
+    counts = {
+        "missing": int(missing.sum()),
+        "wrong_dimension": int(wrong_dimension.sum()),
+        "non_finite": int(non_finite.sum()),
+        "zero_norm": int(zero_norm.sum()),
+    }
+    return valid, counts
+
+
+def _locate_chunk(parent_text: Optional[str], chunk_text: str, cursor: int) -> Optional[tuple]:
+    """
+    Find a chunk inside its parent document text.
+
+    TextSplitter chunks are exact substrings of the parent, emitted in order, so the
+    search starts at the previous chunk's start offset.
+
+    Returns:
+        (char_start, char_end, line_start, line_end) with 1-based lines, or None if not found.
+    """
+    if not parent_text or not chunk_text:
+        return None
+    start = parent_text.find(chunk_text, cursor)
+    if start < 0:
+        start = parent_text.find(chunk_text)
+        if start < 0:
+            return None
+    end = start + len(chunk_text)
+    line_start = parent_text.count("\n", 0, start) + 1
+    line_end = line_start + chunk_text.rstrip("\n").count("\n")
+    return start, end, line_start, line_end
+
+
+def write_index_store(documents: Sequence[Document], store_dir: str,
+                      source_documents: Optional[Sequence[Document]] = None,
+                      manifest_extra: Optional[Dict[str, Any]] = None) -> "IndexStore":
+    """
+    Write embedded chunks to a columnar index store.
+
+    Args:
+        documents: Transformed (split and embedded) chunk documents.
+        store_dir: Directory to write the store into. Created if it doesn't exist.
+        source_documents: Optional original (unsplit) documents, used to record the
+            character offsets and line ranges of each chunk within its file.
+        manifest_extra: Optional extra fields recorded in the manifest, e.g. the
+            fingerprint of the embedder and pipeline configuration that built the store.
+
+    Returns:
+        IndexStore: The freshly written store, opened for reading.
+    """
+    # Write into a temporary sibling and swap it in, so readers never see a partial store
+    tmp_dir = make_temp_dir(store_dir)
+    try:
+        _write_store_files(documents, tmp_dir, source_documents, manifest_extra)
+        replace_directory(tmp_dir, store_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Wrote index store with {len(documents)} chunks to {store_dir}")
+    return IndexStore.open(store_dir)
+
+
+def _write_store_files(documents: Sequence[Document], store_dir: str,
+                       source_documents: Optional[Sequence[Document]],
+                       manifest_extra: Optional[Dict[str, Any]]) -> None:
+    """Write all store files into an empty directory, manifest last."""
+    # The most common vector length is the index dimension; other rows are stored as zeros
+    lengths = [_vector_length(getattr(doc, "vector", None)) for doc in documents]
+    length_counts = Counter(length for length in lengths if length > 0)
+    dimensions = length_counts.most_common(1)[0][0] if length_counts else 0
+
+    vectors = np.zeros((len(documents), dimensions), dtype=np.float32)
+    for i, doc in enumerate(documents):
+        if dimensions and lengths[i] == dimensions:
+            vectors[i] = np.asarray(doc.vector, dtype=np.float32).reshape(-1)
+    valid, validation = _validate_vectors(vectors, np.asarray(lengths, dtype=np.int64))
+    vectors[~valid] = 0.0
+    invalid = {reason: count for reason, count in validation.items() if count}
+    if invalid:
+        logger.warning(f"Excluding {len(documents) - int(valid.sum())} chunks with invalid embeddings: {invalid}")
+
+    parent_texts = {doc.id: doc.text for doc in source_documents} if source_documents else {}
+    parent_cursors: Dict[str, int] = {}
+
+    conn = sqlite3.connect(os.path.join(store_dir, META_FILE))
+    try:
+        conn.execute(
+            """
+            CREATE TABLE chunks (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT,
+                parent_doc_id TEXT,
+                chunk_order INTEGER,
+                file_path TEXT,
+                type TEXT,
+                is_code INTEGER,
+                is_implementation INTEGER,
+                title TEXT,
+                token_count INTEGER,
+                num_tokens INTEGER,
+                text_offset INTEGER NOT NULL,
+                text_length INTEGER NOT NULL,
+                char_start INTEGER,
+                char_end INTEGER,
+                line_start INTEGER,
+                line_end INTEGER,
+                has_vector INTEGER NOT NULL,
+                meta_json TEXT
+            )
+            """
+        )
+
+        rows = []
+        offset = 0
+        with open(os.path.join(store_dir, CHUNKS_FILE), "wb") as chunks_file:
+            for i, doc in enumerate(documents):
+                has_vector = bool(valid[i])
+                text = doc.text or ""
+                encoded = text.encode("utf-8")
+                chunks_file.write(encoded)
+
+                meta_data = dict(doc.meta_data or {})
+                extra_meta = {k: v for k, v in meta_data.items() if k not in _COLUMN_META_KEYS}
+
+                location = None
+                parent_id = str(doc.parent_doc_id) if doc.parent_doc_id is not None else None
+                if parent_id in parent_texts:
+                    location = _locate_chunk(parent_texts[parent_id], text, parent_cursors.get(parent_id, 0))
+                    if location:
+                        parent_cursors[parent_id] = location[0] + 1
+
+                rows.append((
+                    i,
+                    doc.id,
+                    parent_id,
+                    doc.order,
+                    meta_data.get("file_path"),
+                    meta_data.get("type"),
+                    int(bool(meta_data.get("is_code", False))),
+                    int(bool(meta_data.get("is_implementation", False))),
+                    meta_data.get("title"),
+                    meta_data.get("token_count"),
+                    doc.estimated_num_tokens,
+                    offset,
+                    len(encoded),
+                    location[0] if location else None,
+                    location[1] if location else None,
+                    location[2] if location else None,
+                    location[3] if location else None,
+                    int(has_vector),
+                    json.dumps(extra_meta) if extra_meta else None,
+                ))
+                offset += len(encoded)
+
+        conn.executemany(f"INSERT INTO chunks ({_CHUNK_COLUMNS}) VALUES ({', '.join('?' * 19)})", rows)
+        conn.execute("CREATE INDEX idx_chunks_file_path ON chunks (file_path)")
+        # Chunks of a file are written consecutively, so each file maps to an id range
+        conn.execute(
+            "CREATE TABLE file_ranges (file_path TEXT, is_code INTEGER, start_id INTEGER, end_id INTEGER)"
+        )
+        conn.executemany(
+            "INSERT INTO file_ranges VALUES (?, ?, ?, ?)",
+            _file_ranges((row[0], row[4], row[6]) for row in rows),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    np.save(os.path.join(store_dir, VECTORS_FILE), vectors)
+
+    manifest = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "num_chunks": len(documents),
+        "dimensions": dimensions,
+        "num_with_vectors": int(valid.sum()),
+        "invalid_vectors": validation,
+        # Ties derived artifacts (e.g. the FAISS index) to the exact vectors they were built from
+        "vectors_checksum": hashlib.sha256(vectors.tobytes()).hexdigest(),
+    }
+    if manifest_extra:
+        manifest.update(manifest_extra)
+    with atomic_write(os.path.join(store_dir, MANIFEST_FILE)) as f:
+        json.dump(manifest, f, indent=2)
+
+
+def migrate_pickle_to_index_store(pickle_path: str, store_dir: str,
+                                  expected_dimensions: Optional[int] = None,
+                                  manifest_extra: Optional[Dict[str, Any]] = None) -> Optional["IndexStore"]:
+    """
+    Convert a legacy LocalDB pickle into an index store.
+
+    Args:
+        pickle_path: Path to the `{repo}.pkl` LocalDB state file.
+        store_dir: Directory to write the store into.
+        expected_dimensions: If given, only migrate when the pickle's embeddings have
+            this dimension; pickles don't record which embedder produced them.
+        manifest_extra: Optional extra fields recorded in the store manifest.
+
+    Returns:
+        IndexStore or None if the pickle holds no transformed documents or is incompatible.
+    """
+    from adalflow.core.db import LocalDB
+
+    logger.info(f"Migrating legacy database {pickle_path} to index store {store_dir}")
+    db = LocalDB.load_state(pickle_path)
+    if db is None:
+        return None
+    documents = db.get_transformed_data(key="split_and_embed")
+    if not documents:
+        logger.warning(f"Legacy database {pickle_path} has no transformed documents, skipping migration")
+        return None
+    if expected_dimensions:
+        length_counts = Counter(_vector_length(getattr(doc, "vector", None)) for doc in documents)
+        legacy_dimensions = length_counts.most_common(1)[0][0]
+        if legacy_dimensions != expected_dimensions:
+            logger.warning(
+                f"Legacy database {pickle_path} has {legacy_dimensions}-dim embeddings, "
+                f"expected {expected_dimensions}; not migrating"
+            )
+            return None
+    return write_index_store(documents, store_dir, source_documents=db.items, manifest_extra=manifest_extra)
+
+
+class StoreDocumentList(Sequence):
+    """Read-only sequence of Documents backed by an IndexStore, materialized on access."""
+
+    def __init__(self, store: "IndexStore"):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._store.get_documents(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+        return self._store.get_document(index)
+
+    def __iter__(self) -> Iterator[Document]:
+        batch_size = 512
+        for start in range(0, len(self), batch_size):
+            yield from self._store.get_documents(range(start, min(start + batch_size, len(self))))
+
+
+class IndexStore:
+    """
+    Read access to a columnar index store.
+
+    Vectors and chunk texts are memory-mapped; metadata is queried from SQLite per request.
+    """
+
+    def __init__(self, store_dir: str, manifest: Dict[str, Any]):
+        self.store_dir = store_dir
+        self.manifest = manifest
+        self.vectors: np.ndarray = np.load(os.path.join(store_dir, VECTORS_FILE), mmap_mode="r")
+        expected_shape = (int(manifest.get("num_chunks", 0)), int(manifest.get("dimensions", 0)))
+        if self.vectors.shape != expected_shape:
+            raise ValueError(
+                f"Index store {store_dir} has vectors of shape {self.vectors.shape}, expected {expected_shape}"
+            )
+        self._valid_mask: Optional[np.ndarray] = None
+        self._file_ranges: Optional[List[tuple]] = None
+        self._conn = sqlite3.connect(
+            f"file:{os.path.join(store_dir, META_FILE)}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._chunks_file = None
+        self._chunks_mmap = None
+        self._mmap_lock = threading.Lock()
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        """Return True if a complete store exists at store_dir."""
+        return bool(store_dir) and os.path.exists(os.path.join(store_dir, MANIFEST_FILE))
+
+    @classmethod
+    def open(cls, store_dir: str) -> "IndexStore":
+        """
+        Open an existing index store.
+
+        Raises:
+            FileNotFoundError: If the store is missing or incomplete.
+            ValueError: If the store was written with an unsupported format version or
+                its vectors don't match the manifest.
+        """
+        manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No index store found at {store_dir}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported index store format {manifest.get('format_version')} at {store_dir}"
+            )
+        return cls(store_dir, manifest)
+
+    def __len__(self) -> int:
+        return int(self.manifest.get("num_chunks", 0))
+
+    @property
+    def closed(self) -> bool:
+        return self._conn is None
+
+    @property
+    def dimensions(self) -> int:
+        return int(self.manifest.get("dimensions", 0))
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self.manifest.get("fingerprint")
+
+    @property
+    def vectors_checksum(self) -> Optional[str]:
+        return self.manifest.get("vectors_checksum")
+
+    def valid_mask(self) -> np.ndarray:
+        """
+        Return a boolean mask of the chunks with a valid embedding.
+
+        Rows were validated when the store was written and invalid ones zeroed, so a
+        single vectorized check over the matrix recovers the mask. Computed once per store.
+        """
+        if self._valid_mask is None:
+            vectors = self.vectors
+            with np.errstate(invalid="ignore", over="ignore"):
+                sq_norms = np.einsum("ij,ij->i", vectors, vectors, dtype=np.float64)
+            mask = np.isfinite(sq_norms) & (sq_norms > 0)
+            expected = int(self.manifest.get("num_with_vectors", mask.sum()))
+            if int(mask.sum()) != expected:
+                # Stores written before build-time validation may still hold NaN rows
+                logger.warning(
+                    f"Index store {self.store_dir} has {int(mask.sum())} valid vectors, "
+                    f"manifest records {expected}; using the valid ones"
+                )
+            self._valid_mask = mask
+        return self._valid_mask
+
+    def vector_ids(self) -> np.ndarray:
+        """Return the ids of all chunks that have a valid embedding, in ascending order."""
+        return np.flatnonzero(self.valid_mask()).astype(np.int64)
+
+    def file_ranges(self) -> List[tuple]:
+        """Return (file_path, is_code, start_id, end_id) for every file, in id order."""
+        if self._file_ranges is None:
+            has_table = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_ranges'"
+            ).fetchone()
+            if has_table:
+                rows = self._conn.execute(
+                    "SELECT file_path, is_code, start_id, end_id FROM file_ranges ORDER BY start_id"
+                ).fetchall()
+            else:
+                # Stores written before file ranges were recorded
+                rows = _file_ranges(self._conn.execute("SELECT id, file_path, is_code FROM chunks ORDER BY id"))
+            self._file_ranges = rows
+        return self._file_ranges
+
+    def filter_ids(self, chunk_filter: ChunkFilter) -> np.ndarray:
+        """
+        Return the ids of the chunks matching a filter, in ascending order.
+
+        Predicates are evaluated once per file against the precomputed id ranges.
+        """
+        spans = [
+            np.arange(start, end, dtype=np.int64)
+            for file_path, is_code, start, end in self.file_ranges()
+            if chunk_filter.matches(file_path, is_code)
+        ]
+        return np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+
+    def _chunk_bytes(self) -> mmap.mmap:
+        if self._chunks_mmap is None:
+            # Stores are shared across request threads via the retriever cache
+            with self._mmap_lock:
+                if self._chunks_mmap is None:
+                    path = os.path.join(self.store_dir, CHUNKS_FILE)
+                    # mmap cannot map empty files
+                    if os.path.getsize(path) == 0:
+                        self._chunks_mmap = b""
+                    else:
+                        self._chunks_file = open(path, "rb")
+                        self._chunks_mmap = mmap.mmap(self._chunks_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._chunks_mmap
+
+    def _row_to_document(self, row: tuple, include_vector: bool = True) -> Document:
+        (idx, doc_id, parent_doc_id, chunk_order, file_path, type_, is_code, is_implementation,
+         title, token_count, num_tokens, text_offset, text_length, char_start, char_end,
+         line_start, line_end, has_vector, meta_json) = row
+
+        text = bytes(self._chunk_bytes()[text_offset:text_offset + text_length]).decode("utf-8")
+        meta_data = {
+            "file_path": file_path,
+            "type": type_,
+            "is_code": bool(is_code),
+            "is_implementation": bool(is_implementation),
+            "title": title,
+            "token_count": token_count,
+        }
+        if line_start is not None:
+            meta_data.update({
+                "char_start": char_start,
+                "char_end": char_end,
+                "line_start": line_start,
+                "line_end": line_end,
+            })
+        if meta_json:
+            meta_data.update(json.loads(meta_json))
+
+        return Document(
+            text=text,
+            meta_data=meta_data,
+            vector=self.vectors[idx].tolist() if has_vector and include_vector else [],
+            id=doc_id,
+            order=chunk_order,
+            parent_doc_id=parent_doc_id,
+            # Pass the stored count so Document doesn't re-tokenize the text
+            estimated_num_tokens=num_tokens if num_tokens is not None else 0,
+        )
+
+    def get_document(self, index: int) -> Document:
+        """Materialize a single chunk as a Document."""
+        row = self._conn.execute(f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE id = ?", (int(index),)).fetchone()
+        if row is None:
+            raise IndexError(f"Chunk {index} not found in {self.store_dir}")
+        return self._row_to_document(row)
+
+    def get_documents(self, indices: Sequence[int], include_vectors: bool = True) -> List[Document]:
+        """
+        Materialize the given chunks as Documents, preserving the requested order.
+
+        Args:
+            indices: Chunk ids to load.
+            include_vectors: Whether to copy each chunk's embedding into the Document.
+                Context building only needs text and metadata, so callers can skip it.
+
+        Returns:
+            List[Document]: The chunks that exist, in the order requested.
+        """
+        indices = [int(i) for i in indices]
+        if not indices:
+            return []
+        rows_by_id = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(indices), 900):
+            batch = indices[start:start + 900]
+            placeholders = ", ".join("?" * len(batch))
+            for row in self._conn.execute(
+                f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE id IN ({placeholders})", batch
+            ):
+                rows_by_id[row[0]] = row
+        return [self._row_to_document(rows_by_id[i], include_vectors) for i in indices if i in rows_by_id]
+
+    def documents(self) -> StoreDocumentList:
+        """Return a lazy, list-like view over all chunks."""
+        return StoreDocumentList(self)
+
+    def close(self):
+        """Release the SQLite connection and file mappings."""
+        if isinstance(self._chunks_mmap, mmap.mmap):
+            self._chunks_mmap.close()
+        self._chunks_mmap = None
+        if self._chunks_file is not None:
+            self._chunks_file.close()
+            self._chunks_file = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ChunkCache:
+    """
+    Small thread-safe LRU of materialized chunks in front of an IndexStore.
+
+    Retrieval only needs the vector index; chunk text and metadata are read from the
+    store for the retrieved ids, and the most recently used chunks are kept in memory.
+    Cached Documents carry no vectors.
+    """
+
+    def __init__(self, store: IndexStore, capacity: int = 512):
+        self.store = store
+        self.capacity = max(0, int(capacity))
+        self._cache: "OrderedDict[int, Document]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get_documents(self, indices: Sequence[int]) -> List[Document]:
+        """
+        Return the chunks for the given ids, loading cache misses from the store.
+
+        Args:
+            indices: Chunk ids, e.g. a retriever's doc_indices.
+
+        Returns:
+            List[Document]: The chunks in the requested order.
+        """
+        indices = [int(i) for i in indices]
+        found: Dict[int, Document] = {}
+        with self._lock:
+            for i in indices:
+                doc = self._cache.get(i)
+                if doc is not None:
+                    self._cache.move_to_end(i)
+                    found[i] = doc
+
+        # Chunk ids are contiguous, so every in-range id exists and results line up with `missing`
+        missing = [i for i in dict.fromkeys(indices) if i not in found and 0 <= i < len(self.store)]
+        if missing:
+            loaded = self.store.get_documents(missing, include_vectors=False)
+            with self._lock:
+                for i, doc in zip(missing, loaded):
+                    found[i] = doc
+                    if self.capacity:
+                        self._cache[i] = doc
+                        self._cache.move_to_end(i)
+                while len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+
+        return [found[i] for i in indices if i in found]
+
+    def clear(self):
+        """Drop all cached chunks."""
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,207 @@
+"""
+Persisted BM25 inverted index for an IndexStore.
+
+Identifier-heavy questions ("where is `prepare_db_index` called?") are poorly served
+by embedding search alone. The lexical index is an SQLite FTS5 table over
+code-aware tokens of every chunk, built once when the store is written and saved
+next to it as `lexical.sqlite`. FTS5 ranks matches with BM25.
+
+Tokens keep whole identifiers and also their snake_case and camelCase parts, so
+`prepare_db_index`, `prepareDbIndex` and "db index" all match each other.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from adalflow.core.types import RetrieverOutput
+
+from api.atomic_io import atomic_replace, file_lock
+from api.index_store import IndexStore
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILE = "lexical.sqlite"
+
+# Constant from the reciprocal rank fusion paper (Cormack et al., 2009)
+RRF_K = 60
+# Above this many id ranges, filter matches in Python instead of in the SQL query
+_MAX_RANGE_TERMS = 400
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+|[^\W\d_]+")
+_SUBWORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """
+    Split text into lowercase search tokens, keeping identifiers and their parts.
+
+    "parseHTTPResponse_v2" yields parsehttpresponse_v2, parse, http, response, v, 2.
+    """
+    for word in _WORD_RE.findall(text or ""):
+        yield word.lower()
+        parts = [part.lower() for piece in word.split("_") for part in _SUBWORD_RE.findall(piece)]
+        if len(parts) > 1:
+            yield from parts
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Build an FTS5 query matching any of the query's tokens."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def build_lexical_index(store: IndexStore) -> None:
+    """
+    Build the BM25 index over a store's chunks and save it next to the store.
+
+    Args:
+        store: The index store to build from.
+    """
+    index_path = os.path.join(store.store_dir, LEXICAL_INDEX_FILE)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # Tokens are pre-split, so FTS5 only needs to split on spaces and keep underscores
+        conn.execute("CREATE VIRTUAL TABLE lexical USING fts5(tokens, tokenize=\"unicode61 tokenchars '_'\")")
+        conn.execute("CREATE TABLE lexical_meta (num_chunks INTEGER NOT NULL)")
+        batch_size = 1000
+        for start in range(0, len(store), batch_size):
+            doc_ids = range(start, min(start + batch_size, len(store)))
+            docs = store.get_documents(doc_ids, include_vectors=False)
+            conn.executemany(
+                "INSERT INTO lexical (rowid, tokens) VALUES (?, ?)",
+                [(doc_id, " ".join(tokenize(doc.text))) for doc_id, doc in zip(doc_ids, docs)],
+            )
+        conn.execute("INSERT INTO lexical_meta (num_chunks) VALUES (?)", (len(store),))
+        conn.execute("INSERT INTO lexical (lexical) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        conn.close()
+    atomic_replace(tmp_path, index_path)
+    logger.info(f"Built lexical index over {len(store)} chunks in {store.store_dir}")
+
+
+class LexicalIndex:
+    """BM25 search over a store's persisted lexical index."""
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+        row = self._conn.execute("SELECT num_chunks FROM lexical_meta").fetchone()
+        self.num_chunks = int(row[0]) if row else 0
+
+    def search(self, query: str, top_k: int, ids: Optional[np.ndarray] = None) -> RetrieverOutput:
+        """
+        Return the top_k chunks by BM25 score.
+
+        Scores are BM25 relevance (higher is better) and are not normalized.
+
+        Args:
+            query: The query text.
+            top_k: Number of chunks to return.
+            ids: Optional ascending chunk ids to restrict the search to, e.g. from
+                IndexStore.filter_ids().
+        """
+        expression = _match_expression(query)
+        if expression is None or (ids is not None and len(ids) == 0):
+            return RetrieverOutput(doc_indices=[], doc_scores=[], query=query)
+        if ids is None:
+            rows = self._conn.execute(
+                "SELECT rowid, bm25(lexical) FROM lexical WHERE lexical MATCH ? ORDER BY bm25(lexical) LIMIT ?",
+                (expression, top_k),
+            ).fetchall()
+        else:
+            rows = self._search_ids(expression, top_k, ids)
+        # FTS5's bm25() is negated so that ascending order ranks best first
+        return RetrieverOutput(
+            doc_indices=[int(rowid) for rowid, _ in rows],
+            doc_scores=[round(-score, 3) for _, score in rows],
+            query=query,
+        )
+
+    def _search_ids(self, expression: str, top_k: int, ids: np.ndarray) -> List[tuple]:
+        # Filtered ids come from whole files, so they form few contiguous ranges
+        breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+        ranges = [(int(run[0]), int(run[-1])) for run in np.split(ids, breaks)]
+        if len(ranges) <= _MAX_RANGE_TERMS:
+            clause = " OR ".join("rowid BETWEEN ? AND ?" for _ in ranges)
+            params = [bound for pair in ranges for bound in pair]
+            return self._conn.execute(
+                f"SELECT rowid, bm25(lexical) FROM lexical WHERE lexical MATCH ? AND ({clause}) "
+                f"ORDER BY bm25(lexical) LIMIT ?",
+                (expression, *params, top_k),
+            ).fetchall()
+        allowed = set(ids.tolist())
+        rows = self._conn.execute(
+            "SELECT rowid, bm25(lexical) FROM lexical WHERE lexical MATCH ? ORDER BY bm25(lexical)",
+            (expression,),
+        )
+        return [row for row in rows if row[0] in allowed][:top_k]
+
+    def close(self):
+        self._conn.close()
+
+
+def load_lexical_index(store: IndexStore) -> LexicalIndex:
+    """
+    Open the store's lexical index, building it first if it is missing or stale.
+
+    Args:
+        store: The index store the lexical index belongs to.
+
+    Returns:
+        LexicalIndex: The ready index.
+    """
+    index_path = os.path.join(store.store_dir, LEXICAL_INDEX_FILE)
+    if not os.path.exists(index_path):
+        # One worker builds; the others wait for it and open the result
+        with file_lock(index_path):
+            if not os.path.exists(index_path):
+                logger.info(f"No lexical index in {store.store_dir}, building one")
+                build_lexical_index(store)
+    index = LexicalIndex(index_path)
+    if index.num_chunks != len(store):
+        index.close()
+        with file_lock(index_path):
+            index = LexicalIndex(index_path)
+            if index.num_chunks != len(store):
+                logger.warning(f"Lexical index in {store.store_dir} does not match the store, rebuilding")
+                index.close()
+                build_lexical_index(store)
+                index = LexicalIndex(index_path)
+    return index
+
+
+def reciprocal_rank_fusion(outputs: Sequence[RetrieverOutput], top_k: int, k: int = RRF_K) -> RetrieverOutput:
+    """
+    Fuse several rankings of the same query with reciprocal rank fusion.
+
+    Each chunk scores sum(1 / (k + rank)) over the rankings it appears in, so chunks
+    ranked well by both vector and BM25 search come first without calibrating scores.
+
+    Args:
+        outputs: Retriever outputs for the same query.
+        top_k: Number of chunks to keep.
+        k: RRF damping constant.
+
+    Returns:
+        RetrieverOutput: The fused ranking.
+    """
+    scores: Dict[int, float] = {}
+    for output in outputs:
+        for rank, doc_index in enumerate(output.doc_indices, start=1):
+            scores[doc_index] = scores.get(doc_index, 0.0) + 1.0 / (k + rank)
+    ranked: List[tuple] = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+    return RetrieverOutput(
+        doc_indices=[doc_index for doc_index, _ in ranked],
+        doc_scores=[round(score, 6) for _, score in ranked],
+        query=outputs[0].query if outputs else None,
+    )
@@ -91,7 +91,12 @@ if __name__ == "__main__":
     # Import the app here to ensure environment variables are set first
     from api.api import app
 
-    logger.info(f"Starting Streaming API on port {port}")
+    # Worker processes share index pages through the page cache; reload mode runs a single worker
+    workers = 1 if is_development else max(1, int(os.environ.get("DEEPWIKI_WORKERS", 1)))
+    # Workers read the effective count back, e.g. to tell whether answers can be resumed
+    os.environ["DEEPWIKI_WORKERS"] = str(workers)
+
+    logger.info(f"Starting Streaming API on port {port} with {workers} worker(s)")
 
     # Run the FastAPI app with uvicorn
     uvicorn.run(
@@ -100,4 +105,5 @@ if __name__ == "__main__":
         port=port,
         reload=is_development,
         reload_excludes=["**/logs/*", "**/__pycache__/*", "**/*.pyc"] if is_development else None,
+        workers=workers,
     )
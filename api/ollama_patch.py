@@ -8,12 +8,21 @@ from adalflow.core.component import DataComponent
 import requests
 import os
 
+from api.query_cache import TTLCache
+from api.cancellation import check_cancelled
+from api.http_pool import get_requests_session
+
 # Configure logging
 from api.logging_config import setup_logging
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Seconds a successful model availability check is trusted before asking Ollama again
+MODEL_CHECK_TTL_SECONDS = 300
+
+_available_models = TTLCache(max_entries=64, ttl_seconds=MODEL_CHECK_TTL_SECONDS)
+
 class OllamaModelNotFoundError(Exception):
     """Custom exception for when Ollama model is not found"""
     pass
@@ -21,6 +30,10 @@ class OllamaModelNotFoundError(Exception):
 def check_ollama_model_exists(model_name: str, ollama_host: str = None) -> bool:
     """
     Check if an Ollama model exists before attempting to use it.
+
+    Positive answers are cached for MODEL_CHECK_TTL_SECONDS, so per-request checks
+    do not each call `/api/tags`. Negative answers are not cached, so a model pulled
+    after a failed check is picked up right away.
     
     Args:
         model_name: Name of the model to check
@@ -31,13 +44,16 @@ def check_ollama_model_exists(model_name: str, ollama_host: str = None) -> bool:
     """
     if ollama_host is None:
         ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-    
+
+    if _available_models.get((ollama_host, model_name)):
+        return True
+
     try:
         # Remove /api prefix if present and add it back
         if ollama_host.endswith('/api'):
             ollama_host = ollama_host[:-4]
         
-        response = requests.get(f"{ollama_host}/api/tags", timeout=5)
+        response = get_requests_session().get(f"{ollama_host}/api/tags", timeout=5)
         if response.status_code == 200:
             models_data = response.json()
             available_models = [model.get('name', '').split(':')[0] for model in models_data.get('models', [])]
@@ -46,6 +62,7 @@ def check_ollama_model_exists(model_name: str, ollama_host: str = None) -> bool:
             is_available = model_base_name in available_models
             if is_available:
                 logger.info(f"Ollama model '{model_name}' is available")
+                _available_models.put((ollama_host, model_name), True)
             else:
                 logger.warning(f"Ollama model '{model_name}' is not available. Available models: {available_models}")
             return is_available
@@ -76,6 +93,8 @@ class OllamaDocumentProcessor(DataComponent):
         expected_embedding_size = None
 
         for i, doc in enumerate(tqdm(output, desc="Processing documents for Ollama embeddings")):
+            # Outside the try below, which skips documents that fail
+            check_cancelled("embedding")
             try:
                 # Get embedding for a single document
                 result = self.embedder(input=doc.text)
@@ -50,6 +50,8 @@ from adalflow.core.types import (
 )
 from adalflow.components.model_client.utils import parse_embedding_response
 
+from api.http_pool import get_async_http_client, get_sync_http_client, loop_async_client
+
 log = logging.getLogger(__name__)
 T = TypeVar("T")
 
@@ -204,7 +206,7 @@ class OpenAIClient(ModelClient):
             raise ValueError(
                 f"Environment variable {self._env_api_key_name} must be set"
             )
-        return OpenAI(api_key=api_key, base_url=self.base_url)
+        return OpenAI(api_key=api_key, base_url=self.base_url, http_client=get_sync_http_client())
 
     def init_async_client(self):
         api_key = self._api_key or os.getenv(self._env_api_key_name)
@@ -212,7 +214,7 @@ class OpenAIClient(ModelClient):
             raise ValueError(
                 f"Environment variable {self._env_api_key_name} must be set"
             )
-        return AsyncOpenAI(api_key=api_key, base_url=self.base_url)
+        return AsyncOpenAI(api_key=api_key, base_url=self.base_url, http_client=get_async_http_client())
 
     # def _parse_chat_completion(self, completion: ChatCompletion) -> "GeneratorOutput":
     #     # TODO: raw output it is better to save the whole completion as a source of truth instead of just the message
@@ -516,26 +518,25 @@ class OpenAIClient(ModelClient):
         
         # store the api kwargs in the client
         self._api_kwargs = api_kwargs
-        if self.async_client is None:
-            self.async_client = self.init_async_client()
+        self.async_client = async_client = loop_async_client(self.async_client, self.init_async_client)
         if model_type == ModelType.EMBEDDER:
-            return await self.async_client.embeddings.create(**api_kwargs)
+            return await async_client.embeddings.create(**api_kwargs)
         elif model_type == ModelType.LLM:
-            return await self.async_client.chat.completions.create(**api_kwargs)
+            return await async_client.chat.completions.create(**api_kwargs)
         elif model_type == ModelType.IMAGE_GENERATION:
             # Determine which image API to call based on the presence of image/mask
             if "image" in api_kwargs:
                 if "mask" in api_kwargs:
                     # Image edit
-                    response = await self.async_client.images.edit(**api_kwargs)
+                    response = await async_client.images.edit(**api_kwargs)
                 else:
                     # Image variation
-                    response = await self.async_client.images.create_variation(
+                    response = await async_client.images.create_variation(
                         **api_kwargs
                     )
             else:
                 # Image generation
-                response = await self.async_client.images.generate(**api_kwargs)
+                response = await async_client.images.generate(**api_kwargs)
             return response.data
         else:
             raise ValueError(f"model_type {model_type} is not supported")
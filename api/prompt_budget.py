@@ -0,0 +1,152 @@
+"""
+Sizing chat prompts to the model's context window before the model is called.
+
+A chat prompt has fixed parts (system prompt, question) and variable parts
+(file content, conversation history, retrieved context). The model's context
+window, less the answer's `max_tokens` and a safety margin, is the prompt
+limit. The variable parts are fitted into what the fixed parts leave, always
+in the same order:
+
+    file content  - at most FILE_CONTENT_SHARE of the room, cut at the end
+    history       - at most HISTORY_SHARE of what is left; older turns are
+                    folded into the summary, then the summary is cut
+    context       - the rest, up to the model's context_token_budget
+
+The prompt is then sent once. Retrying without context after a token-limit
+error remains as a safety net for tokenizer differences.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import tiktoken
+
+from api.config import configs, get_context_token_budget, get_context_window
+from api.data_pipeline import count_tokens
+from api.session_store import PromptHistory, Session, fit_history, summarize_turns, SUMMARY_BUDGET_FRACTION
+
+logger = logging.getLogger(__name__)
+
+# Answer tokens reserved for a model without "max_tokens" in its config
+DEFAULT_OUTPUT_TOKENS = 2048
+# Room left for differences between our token count and the provider's, and for section tags
+PROMPT_SAFETY_MARGIN_TOKENS = 256
+# Largest share of the room after the fixed parts that file content may take
+FILE_CONTENT_SHARE = 0.5
+# Largest share of the room left after file content that history may take
+HISTORY_SHARE = 0.5
+# Retrieval is skipped when less room than this would be left for its context
+MIN_CONTEXT_TOKENS = 200
+
+TRUNCATION_MARKER = "\n... [truncated]"
+
+
+@dataclass
+class PromptBudget:
+    """How the variable parts of one prompt were fitted."""
+    limit: int
+    file_content: str
+    history: PromptHistory
+    context_tokens: int
+
+
+def output_token_reserve(provider: str, model: Optional[str] = None) -> int:
+    """Answer tokens to budget for a model: its "max_tokens" in generator.json, or a default."""
+    provider_config = configs.get("providers", {}).get(provider, {})
+    model = model or provider_config.get("default_model")
+    model_config = provider_config.get("models", {}).get(model, {})
+    return int(model_config.get("max_tokens", DEFAULT_OUTPUT_TOKENS))
+
+
+def prompt_token_limit(provider: str, model: Optional[str] = None) -> int:
+    """The most tokens a prompt for this model may use, leaving room for the answer."""
+    return max(0, get_context_window(provider, model) - output_token_reserve(provider, model)
+               - PROMPT_SAFETY_MARGIN_TOKENS)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, marking the cut."""
+    if max_tokens <= 0:
+        return ""
+    encoding = tiktoken.get_encoding("cl100k_base")
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    keep = max_tokens - len(encoding.encode(TRUNCATION_MARKER))
+    if keep <= 0:
+        return ""
+    return encoding.decode(tokens[:keep]) + TRUNCATION_MARKER
+
+
+def format_history(history: PromptHistory) -> str:
+    """The conversation history section of a prompt."""
+    text = f"<summary>\n{history.summary}\n</summary>\n" if history.summary else ""
+    for turn in history.recent_turns:
+        text += f"<turn>\n<user>{turn.user_query}</user>\n<assistant>{turn.assistant_response}</assistant>\n</turn>\n"
+    return text
+
+
+def trim_history(history: PromptHistory, max_tokens: int) -> PromptHistory:
+    """
+    Fit history into max_tokens as formatted for the prompt.
+
+    Older turns are folded into the summary first. If the newest turn alone is
+    too long, only the summary is kept, cut to the budget.
+    """
+    if count_tokens(format_history(history)) <= max_tokens:
+        return history
+    session = Session("", list(history.recent_turns), summary=history.summary)
+    fit_history(session, max_tokens)
+    summary_budget = int(max_tokens * SUMMARY_BUDGET_FRACTION)
+    # fit_history counts raw turns; fold more if the tags push the section over
+    while (session.summarized_turns < len(session.turns) and count_tokens(
+            format_history(PromptHistory(session.summary, session.turns[session.summarized_turns:]))) > max_tokens):
+        session.summary = summarize_turns(session.summary, [session.turns[session.summarized_turns]], summary_budget)
+        session.summarized_turns += 1
+    trimmed = PromptHistory(session.summary, session.turns[session.summarized_turns:])
+    if count_tokens(format_history(trimmed)) > max_tokens:
+        trimmed = PromptHistory(truncate_to_tokens(session.summary, max_tokens - 10), [])
+        if count_tokens(format_history(trimmed)) > max_tokens:
+            trimmed = PromptHistory("", [])
+    return trimmed
+
+
+def plan_prompt(provider: str, model: Optional[str], fixed_text: str, history: PromptHistory,
+                file_content: str = "") -> PromptBudget:
+    """
+    Fit file content, history and retrieved context into the model's prompt limit.
+
+    Args:
+        provider: The provider name.
+        model: The model name, or None for the provider's default.
+        fixed_text: The parts of the prompt that are always sent whole (system prompt, question).
+        history: The conversation history, already within the history budget.
+        file_content: Content of the file the question is about, if any.
+
+    Returns:
+        PromptBudget: The fitted file content and history, and the token budget for context.
+    """
+    limit = prompt_token_limit(provider, model)
+    room = max(0, limit - count_tokens(fixed_text))
+
+    if file_content:
+        file_limit = int(room * FILE_CONTENT_SHARE)
+        if count_tokens(file_content) > file_limit:
+            logger.info(f"File content cut to {file_limit} tokens to fit the {limit}-token prompt limit")
+            file_content = truncate_to_tokens(file_content, file_limit)
+        room -= count_tokens(file_content)
+
+    history_limit = int(room * HISTORY_SHARE)
+    trimmed = trim_history(history, history_limit)
+    if trimmed is not history:
+        logger.info(f"Conversation history trimmed to {history_limit} tokens to fit the {limit}-token prompt limit")
+    room -= count_tokens(format_history(trimmed))
+
+    context_tokens = max(0, min(get_context_token_budget(provider, model), room))
+    return PromptBudget(limit=limit, file_content=file_content, history=trimmed, context_tokens=context_tokens)
+
+
+def leaves_room_for_context(provider: str, model: Optional[str], query_tokens: int) -> bool:
+    """Whether a question is short enough that retrieved context could still fit next to it."""
+    return prompt_token_limit(provider, model) - query_tokens >= MIN_CONTEXT_TOKENS
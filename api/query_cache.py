@@ -0,0 +1,140 @@
+"""
+Caches for query embeddings and retrieval results.
+
+Identical queries are common: wiki pages regenerated per language, "continue
+research" iterations and popular questions asked by different users. Two
+TTL-bounded LRU caches avoid repeating the work:
+
+    embeddings  (embedder fingerprint, query text) -> normalized query vector
+    results     (index version, query text, top_k) -> (doc_indices, doc_scores)
+
+Embeddings are shared across repositories that use the same embedder; results are
+tied to the exact vectors of one store, so a rebuilt store never serves stale hits.
+Sizes and TTLs come from `retriever.query_cache` in embedder.json.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from api.config import configs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MAX_ENTRIES = 10000
+DEFAULT_EMBEDDING_TTL_SECONDS = 24 * 3600
+DEFAULT_RESULT_MAX_ENTRIES = 5000
+DEFAULT_RESULT_TTL_SECONDS = 3600
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed time."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def embedder_fingerprint(index_key: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Identify the embedder that produced a store's vectors.
+
+    Args:
+        index_key: The `index_key` recorded in the store manifest.
+
+    Returns:
+        str or None if the store doesn't record its embedder.
+    """
+    if not index_key:
+        return None
+    key = {name: index_key.get(name) for name in ("embedder_type", "embedder_client", "model", "dimensions")}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class QueryCache:
+    """Query embedding and retrieval result caches for all retrievers in the process."""
+
+    def __init__(self, cache_config: Optional[Dict[str, Any]] = None):
+        if cache_config is None:
+            cache_config = configs.get("retriever", {}).get("query_cache", {})
+        self.embeddings = TTLCache(
+            cache_config.get("embedding_max_entries", DEFAULT_EMBEDDING_MAX_ENTRIES),
+            cache_config.get("embedding_ttl_seconds", DEFAULT_EMBEDDING_TTL_SECONDS),
+        )
+        self.results = TTLCache(
+            cache_config.get("result_max_entries", DEFAULT_RESULT_MAX_ENTRIES),
+            cache_config.get("result_ttl_seconds", DEFAULT_RESULT_TTL_SECONDS),
+        )
+
+    def clear(self) -> None:
+        self.embeddings.clear()
+        self.results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
+
+
+_query_cache: Optional[QueryCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryCache:
+    """Return the process-wide QueryCache."""
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = QueryCache()
+    return _query_cache
@@ -2,12 +2,11 @@ import logging
 import weakref
 import re
 from dataclasses import dataclass
-from typing import Any, List, Tuple, Dict
+from typing import Any, List, Optional, Tuple, Dict
 from uuid import uuid4
 
 import adalflow as adal
 
-from api.tools.embedder import get_embedder
 from api.prompts import RAG_SYSTEM_PROMPT as system_prompt, RAG_TEMPLATE
 
 # Create our own implementation of the conversation classes
@@ -38,9 +37,16 @@ class CustomConversation:
         self.dialog_turns.append(dialog_turn)
 
 # Import other adalflow components
-from adalflow.components.retriever.faiss_retriever import FAISSRetriever
+from adalflow.core.types import RetrieverOutput
+from api.cancellation import RequestCancelled, check_cancelled
+from api.client_pool import get_model_client, get_pooled_embedder, get_pooled_generator
 from api.config import configs
 from api.data_pipeline import DatabaseManager
+from api.index_store import ChunkFilter
+from api.lexical_index import reciprocal_rank_fusion
+from api.query_cache import get_query_cache
+from api.retriever_cache import get_retriever_cache
+from api.vector_index import StoreRetriever
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -120,7 +126,7 @@ class Memory(adal.core.component.DataComponent):
 
             # Safely append the dialog turn
             self.current_conversation.dialog_turns.append(dialog_turn)
-            logger.info(f"Successfully added dialog turn, now have {len(self.current_conversation.dialog_turns)} turns")
+            logger.debug(f"Successfully added dialog turn, now have {len(self.current_conversation.dialog_turns)} turns")
             return True
 
         except Exception as e:
@@ -188,7 +194,7 @@ class RAG(adal.Component):
 
         # Initialize components
         self.memory = Memory()
-        self.embedder = get_embedder(embedder_type=self.embedder_type)
+        self.embedder = get_pooled_embedder(self.embedder_type)
 
         self_weakref = weakref.ref(self)
         # Patch: ensure query embedding is always single string for Ollama
@@ -207,6 +213,10 @@ class RAG(adal.Component):
 
         self.initialize_db_manager()
 
+        self.generator = get_pooled_generator(self.provider, self.model, self._build_generator)
+
+    def _build_generator(self) -> adal.Generator:
+        """Build the answer generator for this RAG's provider and model."""
         # Set up the output parser
         data_parser = adal.DataClassParser(data_class=RAGAnswer, return_data_class=True)
 
@@ -229,15 +239,15 @@ IMPORTANT FORMATTING RULES:
         generator_config = get_model_config(self.provider, self.model)
 
         # Set up the main generator
-        self.generator = adal.Generator(
+        return adal.Generator(
             template=RAG_TEMPLATE,
             prompt_kwargs={
                 "output_format_str": format_instructions,
-                "conversation_history": self.memory(),
+                "conversation_history": {},
                 "system_prompt": system_prompt,
                 "contexts": None,
             },
-            model_client=generator_config["model_client"](),
+            model_client=get_model_client(generator_config["model_client"]),
             model_kwargs=generator_config["model_kwargs"],
             output_processors=data_parser,
         )
@@ -245,102 +255,11 @@ IMPORTANT FORMATTING RULES:
 
     def initialize_db_manager(self):
         """Initialize the database manager with local storage"""
+        self.close()
         self.db_manager = DatabaseManager()
-        self.transformed_docs = []
-
-    def _validate_and_filter_embeddings(self, documents: List) -> List:
-        """
-        Validate embeddings and filter out documents with invalid or mismatched embedding sizes.
-
-        Args:
-            documents: List of documents with embeddings
-
-        Returns:
-            List of documents with valid embeddings of consistent size
-        """
-        if not documents:
-            logger.warning("No documents provided for embedding validation")
-            return []
-
-        valid_documents = []
-        embedding_sizes = {}
-
-        # First pass: collect all embedding sizes and count occurrences
-        for i, doc in enumerate(documents):
-            if not hasattr(doc, 'vector') or doc.vector is None:
-                logger.warning(f"Document {i} has no embedding vector, skipping")
-                continue
-
-            try:
-                if isinstance(doc.vector, list):
-                    embedding_size = len(doc.vector)
-                elif hasattr(doc.vector, 'shape'):
-                    embedding_size = doc.vector.shape[0] if len(doc.vector.shape) == 1 else doc.vector.shape[-1]
-                elif hasattr(doc.vector, '__len__'):
-                    embedding_size = len(doc.vector)
-                else:
-                    logger.warning(f"Document {i} has invalid embedding vector type: {type(doc.vector)}, skipping")
-                    continue
-
-                if embedding_size == 0:
-                    logger.warning(f"Document {i} has empty embedding vector, skipping")
-                    continue
-
-                embedding_sizes[embedding_size] = embedding_sizes.get(embedding_size, 0) + 1
-
-            except Exception as e:
-                logger.warning(f"Error checking embedding size for document {i}: {str(e)}, skipping")
-                continue
-
-        if not embedding_sizes:
-            logger.error("No valid embeddings found in any documents")
-            return []
-
-        # Find the most common embedding size (this should be the correct one)
-        target_size = max(embedding_sizes.keys(), key=lambda k: embedding_sizes[k])
-        logger.info(f"Target embedding size: {target_size} (found in {embedding_sizes[target_size]} documents)")
-
-        # Log all embedding sizes found
-        for size, count in embedding_sizes.items():
-            if size != target_size:
-                logger.warning(f"Found {count} documents with incorrect embedding size {size}, will be filtered out")
-
-        # Second pass: filter documents with the target embedding size
-        for i, doc in enumerate(documents):
-            if not hasattr(doc, 'vector') or doc.vector is None:
-                continue
-
-            try:
-                if isinstance(doc.vector, list):
-                    embedding_size = len(doc.vector)
-                elif hasattr(doc.vector, 'shape'):
-                    embedding_size = doc.vector.shape[0] if len(doc.vector.shape) == 1 else doc.vector.shape[-1]
-                elif hasattr(doc.vector, '__len__'):
-                    embedding_size = len(doc.vector)
-                else:
-                    continue
-
-                if embedding_size == target_size:
-                    valid_documents.append(doc)
-                else:
-                    # Log which document is being filtered out
-                    file_path = getattr(doc, 'meta_data', {}).get('file_path', f'document_{i}')
-                    logger.warning(f"Filtering out document '{file_path}' due to embedding size mismatch: {embedding_size} != {target_size}")
-
-            except Exception as e:
-                file_path = getattr(doc, 'meta_data', {}).get('file_path', f'document_{i}')
-                logger.warning(f"Error validating embedding for document '{file_path}': {str(e)}, skipping")
-                continue
-
-        logger.info(f"Embedding validation complete: {len(valid_documents)}/{len(documents)} documents have valid embeddings")
-
-        if len(valid_documents) == 0:
-            logger.error("No documents with valid embeddings remain after filtering")
-        elif len(valid_documents) < len(documents):
-            filtered_count = len(documents) - len(valid_documents)
-            logger.warning(f"Filtered out {filtered_count} documents due to embedding issues")
-
-        return valid_documents
+        self.store = None
+        self.chunk_cache = None
+        self.lexical_index = None
 
     def prepare_retriever(self, repo_url_or_path: str, type: str = "github", access_token: str = None,
                       excluded_dirs: List[str] = None, excluded_files: List[str] = None,
@@ -359,7 +278,8 @@ IMPORTANT FORMATTING RULES:
         """
         self.initialize_db_manager()
         self.repo_url_or_path = repo_url_or_path
-        self.transformed_docs = self.db_manager.prepare_database(
+        # Only the store handle is kept; chunk text is read on demand for retrieved ids
+        self.db_manager.prepare_database(
             repo_url_or_path,
             type,
             access_token,
@@ -369,71 +289,128 @@ IMPORTANT FORMATTING RULES:
             included_dirs=included_dirs,
             included_files=included_files
         )
-        logger.info(f"Loaded {len(self.transformed_docs)} documents for retrieval")
-
-        # Validate and filter embeddings to ensure consistent sizes
-        self.transformed_docs = self._validate_and_filter_embeddings(self.transformed_docs)
+        store = self.db_manager.db
+        num_documents = len(store) if store is not None else 0
+        logger.info(f"Loaded {num_documents} documents for retrieval")
 
-        if not self.transformed_docs:
+        # Embeddings were validated once when the store was written (dimension, NaN, zero norm)
+        num_with_vectors = store.manifest.get("num_with_vectors", 0) if store is not None else 0
+        if not num_with_vectors:
             raise ValueError("No valid documents with embeddings found. Cannot create retriever.")
+        if num_with_vectors < num_documents:
+            logger.warning(f"{num_documents - num_with_vectors} documents have no valid embedding and are excluded from retrieval")
 
-        logger.info(f"Using {len(self.transformed_docs)} documents with valid embeddings for retrieval")
+        logger.info(f"Using {num_with_vectors} documents with valid embeddings for retrieval")
 
         try:
             # Use the appropriate embedder for retrieval
             retrieve_embedder = self.query_embedder if self.is_ollama_embedder else self.embedder
-            self.retriever = FAISSRetriever(
-                **configs["retriever"],
+            # The store, its memory-mapped FAISS index and hot chunks are shared across requests;
+            # this instance holds them open until close()
+            cached = get_retriever_cache().acquire(store.store_dir, store=store)
+            self._cache_entry = cached
+            self.retriever = StoreRetriever(
+                cached.store,
                 embedder=retrieve_embedder,
-                documents=self.transformed_docs,
-                document_map_func=lambda doc: doc.vector,
+                top_k=configs["retriever"]["top_k"],
+                index=cached.index,
+                query_cache=get_query_cache(),
             )
-            logger.info("FAISS retriever created successfully")
+            self.store = cached.store
+            self.chunk_cache = cached.chunk_cache
+            self.lexical_index = cached.lexical_index
+            logger.info("FAISS retriever loaded successfully")
         except Exception as e:
-            logger.error(f"Error creating FAISS retriever: {str(e)}")
-            # Try to provide more specific error information
-            if "All embeddings should be of the same size" in str(e):
-                logger.error("Embedding size validation failed. This suggests there are still inconsistent embedding sizes.")
-                # Log embedding sizes for debugging
-                sizes = []
-                for i, doc in enumerate(self.transformed_docs[:10]):  # Check first 10 docs
-                    if hasattr(doc, 'vector') and doc.vector is not None:
-                        try:
-                            if isinstance(doc.vector, list):
-                                size = len(doc.vector)
-                            elif hasattr(doc.vector, 'shape'):
-                                size = doc.vector.shape[0] if len(doc.vector.shape) == 1 else doc.vector.shape[-1]
-                            elif hasattr(doc.vector, '__len__'):
-                                size = len(doc.vector)
-                            else:
-                                size = "unknown"
-                            sizes.append(f"doc_{i}: {size}")
-                        except:
-                            sizes.append(f"doc_{i}: error")
-                logger.error(f"Sample embedding sizes: {', '.join(sizes)}")
+            logger.error(f"Error loading FAISS retriever: {str(e)}")
             raise
 
-    def call(self, query: str, language: str = "en") -> Tuple[List]:
+    def close(self):
+        """Let go of the cached retriever, so the cache can close it once it is evicted."""
+        entry, self._cache_entry = getattr(self, "_cache_entry", None), None
+        if entry is not None:
+            get_retriever_cache().release(entry)
+
+    def _retrieve(self, queries: List[str], chunk_filter: Optional[ChunkFilter] = None) -> List[RetrieverOutput]:
+        """
+        Retrieve chunk ids for queries according to `retriever.mode`.
+
+        "vector" searches the FAISS index, "lexical" searches the BM25 index without
+        embedding the queries, and "hybrid" fuses both rankings with reciprocal rank fusion.
+        A chunk_filter restricts every mode to the matching chunks.
+        """
+        # Retrieval for a client that already left is skipped
+        check_cancelled("retrieval")
+        mode = configs["retriever"].get("mode", "hybrid")
+        top_k = configs["retriever"]["top_k"]
+
+        def vector_outputs() -> List[RetrieverOutput]:
+            # All queries are embedded in one call and searched together, except with
+            # Ollama, whose embedder takes a single string
+            if self.is_ollama_embedder:
+                outputs = []
+                for query in queries:
+                    check_cancelled("retrieval")
+                    outputs.append(self.retriever(query, chunk_filter=chunk_filter)[0])
+                return outputs
+            return self.retriever(queries, chunk_filter=chunk_filter)
+
+        if mode == "vector" or self.lexical_index is None:
+            return vector_outputs()
+        ids = self.store.filter_ids(chunk_filter) if chunk_filter is not None else None
+        lexical_outputs = [self.lexical_index.search(query, top_k, ids=ids) for query in queries]
+        if mode == "lexical":
+            return lexical_outputs
+        return [
+            reciprocal_rank_fusion([vector_output, lexical_output], top_k)
+            for vector_output, lexical_output in zip(vector_outputs(), lexical_outputs)
+        ]
+
+    def batch_call(self, queries: List[str], language: str = "en",
+                   chunk_filter: Optional[ChunkFilter] = None) -> List[RetrieverOutput]:
+        """
+        Retrieve context for many queries at once, e.g. every page of a wiki.
+
+        Queries are embedded in a single batched call and searched in a single
+        multi-query FAISS search.
+
+        Args:
+            queries: The queries, e.g. one page content prompt per wiki page.
+            chunk_filter: Optional metadata predicates restricting retrieval.
+
+        Returns:
+            List[RetrieverOutput]: One output per query, in input order, with documents filled in.
+        """
+        if not queries:
+            return []
+        outputs = self._retrieve(list(queries), chunk_filter)
+        for output in outputs:
+            output.documents = self.chunk_cache.get_documents(output.doc_indices)
+        return outputs
+
+    def call(self, query: str, language: str = "en", chunk_filter: Optional[ChunkFilter] = None) -> Tuple[List]:
         """
         Process a query using RAG.
 
         Args:
             query: The user's query
+            chunk_filter: Optional metadata predicates (file, path prefix, is_code, extension)
+                restricting retrieval to part of the repository
 
         Returns:
             Tuple of (RAGAnswer, retrieved_documents)
         """
         try:
-            retrieved_documents = self.retriever(query)
+            retrieved_documents = self._retrieve([query], chunk_filter)
 
-            # Fill in the documents
-            retrieved_documents[0].documents = [
-                self.transformed_docs[doc_index]
-                for doc_index in retrieved_documents[0].doc_indices
-            ]
+            # Fill in the documents, reading only the retrieved chunks from the store
+            retrieved_documents[0].documents = self.chunk_cache.get_documents(
+                retrieved_documents[0].doc_indices
+            )
 
             return retrieved_documents
 
+        except RequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error in RAG call: {str(e)}")
 
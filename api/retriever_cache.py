@@ -0,0 +1,247 @@
+"""
+Process-wide cache of ready-to-query retrievers.
+
+Each entry holds an open IndexStore, its memory-mapped FAISS index, its BM25
+lexical index and the chunk LRU in front of it, keyed by the store directory (which already encodes the repo
+and the index fingerprint). Entries are evicted LRU-first once their estimated
+memory exceeds DEEPWIKI_RETRIEVER_CACHE_MAX_MB, and are dropped when the store on
+disk is rebuilt. A dropped entry's store and lexical index are closed as soon as
+no request holds the entry (see acquire and release), so their file handles do
+not keep deleted store files on disk.
+
+With several API workers, each has its own cache, but the vectors, chunk texts,
+FAISS index and lexical index are all mapped read-only from the store's files.
+Their pages sit once in the page cache however many workers map them. The
+files themselves coordinate the workers: builds hold a file lock, and a store
+rebuilt by one worker is seen by the others through its manifest's inode and
+mtime.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import faiss
+
+from api.config import configs
+from api.index_store import MANIFEST_FILE, ChunkCache, IndexStore
+from api.lexical_index import LexicalIndex, load_lexical_index
+from api.vector_index import load_faiss_index
+
+logger = logging.getLogger(__name__)
+
+CACHE_BUDGET_ENV = "DEEPWIKI_RETRIEVER_CACHE_MAX_MB"
+DEFAULT_CACHE_BUDGET_MB = 1024
+
+
+@dataclass
+class RetrieverCacheEntry:
+    store: IndexStore
+    index: faiss.Index
+    chunk_cache: ChunkCache
+    version: Tuple[int, int]
+    size_bytes: int
+    lexical_index: Optional[LexicalIndex] = None
+    # Holders that acquired the entry, and whether the cache has let go of it
+    users: int = 0
+    dropped: bool = False
+
+    def close(self) -> None:
+        """Close the store and lexical index; the FAISS index is unmapped when it is collected."""
+        self.chunk_cache.clear()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        self.store.close()
+
+
+def _store_version(store_dir: str) -> Optional[Tuple[int, int]]:
+    """
+    Identify the store generation on disk.
+
+    Rebuilt stores are swapped in as a new directory, so the manifest's inode and
+    mtime change whenever the contents do.
+    """
+    try:
+        stat = os.stat(os.path.join(store_dir, MANIFEST_FILE))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _estimate_size(store: IndexStore, index: faiss.Index) -> int:
+    """
+    Rough resident size of an entry: the index vectors plus a full chunk cache.
+
+    The vectors are mapped and shared between workers, but still count against
+    each worker's budget, which bounds how much one worker keeps mapped.
+    """
+    chunk_cache_size = configs.get("retriever", {}).get("chunk_cache_size", 512)
+    avg_chunk_bytes = 4096
+    return int(index.ntotal) * int(index.d) * 4 + chunk_cache_size * avg_chunk_bytes
+
+
+def _budget_from_env() -> int:
+    raw = os.environ.get(CACHE_BUDGET_ENV, "").strip()
+    try:
+        megabytes = float(raw) if raw else DEFAULT_CACHE_BUDGET_MB
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {CACHE_BUDGET_ENV}: {raw!r}")
+        megabytes = DEFAULT_CACHE_BUDGET_MB
+    return int(megabytes * 1024 * 1024)
+
+
+class RetrieverCache:
+    """Thread-safe LRU of RetrieverCacheEntry objects under a memory budget."""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = _budget_from_env() if max_bytes is None else max_bytes
+        self._entries: "OrderedDict[str, RetrieverCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One loader per store at a time, so concurrent cold requests load it once;
+        # each lock is kept only while loads of its store are waiting on it
+        self._load_locks: Dict[str, Tuple[threading.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def get(self, store_dir: str) -> Optional[RetrieverCacheEntry]:
+        """Return the cached entry for a store if it is still current."""
+        key = os.path.abspath(store_dir)
+        version = _store_version(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version:
+                logger.info(f"Index store {key} changed on disk, dropping cached retriever")
+                self._drop(self._entries.pop(key))
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def load(self, store_dir: str, store: Optional[IndexStore] = None) -> RetrieverCacheEntry:
+        """
+        Return the cached entry for a store, loading and caching it on a miss.
+
+        Args:
+            store_dir: The index store directory.
+            store: An already opened store for store_dir, reused on a miss.
+
+        Returns:
+            RetrieverCacheEntry: The ready entry.
+        """
+        key = os.path.abspath(store_dir)
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            load_lock, waiters = self._load_locks.get(key, (threading.Lock(), 0))
+            self._load_locks[key] = (load_lock, waiters + 1)
+        try:
+            with load_lock:
+                return self._load(key, store)
+        finally:
+            with self._lock:
+                load_lock, waiters = self._load_locks[key]
+                if waiters > 1:
+                    self._load_locks[key] = (load_lock, waiters - 1)
+                else:
+                    del self._load_locks[key]
+
+    def _load(self, key: str, store: Optional[IndexStore]) -> RetrieverCacheEntry:
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        version = _store_version(key)
+        # A store handed in by a caller may belong to an entry that was dropped and closed since
+        if store is None or store.closed:
+            store = IndexStore.open(key)
+        retriever_config = configs.get("retriever", {})
+        index = load_faiss_index(store)
+        lexical_index = load_lexical_index(store) if retriever_config.get("mode", "hybrid") != "vector" else None
+        chunk_cache = ChunkCache(store, capacity=retriever_config.get("chunk_cache_size", 512))
+        entry = RetrieverCacheEntry(store, index, chunk_cache, version, _estimate_size(store, index),
+                                    lexical_index=lexical_index)
+        self._put(key, entry)
+        logger.info(f"Cached retriever for {key} (~{entry.size_bytes / (1024 * 1024):.1f} MB)")
+        return entry
+
+    def acquire(self, store_dir: str, store: Optional[IndexStore] = None) -> RetrieverCacheEntry:
+        """
+        Like load, but the entry stays open until release(entry), even if it is dropped meanwhile.
+
+        Args:
+            store_dir: The index store directory.
+            store: An already opened store for store_dir, reused on a miss.
+
+        Returns:
+            RetrieverCacheEntry: The ready entry.
+        """
+        while True:
+            entry = self.load(store_dir, store)
+            with self._lock:
+                # Dropped (and closed, if unused) between loading and counting this holder
+                if not entry.dropped:
+                    entry.users += 1
+                    return entry
+
+    def release(self, entry: RetrieverCacheEntry) -> None:
+        """Let go of an acquired entry; a dropped entry is closed once nobody holds it."""
+        with self._lock:
+            entry.users -= 1
+            if entry.dropped and entry.users == 0:
+                entry.close()
+
+    def _drop(self, entry: RetrieverCacheEntry) -> None:
+        """Mark an entry that left the cache, closing it unless a holder still uses it. Call under _lock."""
+        entry.dropped = True
+        if entry.users == 0:
+            entry.close()
+
+    def _put(self, key: str, entry: RetrieverCacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            total = sum(e.size_bytes for e in self._entries.values())
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while total > self.max_bytes and len(self._entries) > 1:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                total -= evicted.size_bytes
+                self._drop(evicted)
+                logger.info(f"Evicted cached retriever for {evicted_key}")
+
+    def invalidate(self, store_dir: str) -> None:
+        """Drop the cached entry for a store, e.g. after it was rebuilt."""
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(store_dir), None)
+            if entry is not None:
+                self._drop(entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                self._drop(entry)
+            self._entries.clear()
+
+
+_retriever_cache: Optional[RetrieverCache] = None
+_retriever_cache_lock = threading.Lock()
+
+
+def get_retriever_cache() -> RetrieverCache:
+    """Return the process-wide RetrieverCache."""
+    global _retriever_cache
+    if _retriever_cache is None:
+        with _retriever_cache_lock:
+            if _retriever_cache is None:
+                _retriever_cache = RetrieverCache()
+    return _retriever_cache
@@ -0,0 +1,350 @@
+"""
+Server-side conversation sessions for the chat endpoints.
+
+Without a session the client sends the whole conversation with every request and
+the server renders all of it into the prompt. With a `session_id` the client sends
+only the new message: earlier turns are kept here, in an LRU of recently used
+sessions backed by an SQLite file (`sessions.sqlite` under the adalflow root), so
+sessions survive restarts and are shared between worker processes.
+
+Prompt history is capped by a token budget. The most recent turns are kept
+verbatim; older turns are folded into a rolling summary, which is persisted with
+the session so each turn is summarized only once.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from adalflow.utils import get_adalflow_default_root_path
+
+from api.config import configs
+from api.data_pipeline import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SESSION_DB_FILE = "sessions.sqlite"
+DEFAULT_HISTORY_TOKEN_BUDGET = 4000
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_SESSION_TTL_SECONDS = 7 * 24 * 3600
+
+# Share of the history budget reserved for the rolling summary
+SUMMARY_BUDGET_FRACTION = 0.25
+# Characters kept from each side of a summarized turn
+_SUMMARY_QUERY_CHARS = 200
+_SUMMARY_ANSWER_CHARS = 300
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+@dataclass
+class Turn:
+    """One user query and the assistant's answer."""
+    user_query: str
+    assistant_response: str
+    tokens: int = 0
+
+    def __post_init__(self):
+        if not self.tokens:
+            self.tokens = count_tokens(f"{self.user_query}\n{self.assistant_response}")
+
+
+@dataclass
+class Session:
+    """A conversation; turns[:summarized_turns] are covered by `summary`."""
+    session_id: str
+    turns: List[Turn] = field(default_factory=list)
+    summary: str = ""
+    summarized_turns: int = 0
+    updated_at: float = 0.0
+
+
+@dataclass
+class PromptHistory:
+    """The part of a conversation that goes into the prompt."""
+    summary: str
+    recent_turns: List[Turn]
+
+
+def _clip(text: str, max_chars: int) -> str:
+    """Shorten text to its first sentences within max_chars."""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    sentences = _SENTENCE_END_RE.split(text[:max_chars])
+    if len(sentences) > 1:
+        return " ".join(sentences[:-1])
+    return text[:max_chars].rstrip() + "..."
+
+
+def summarize_turns(summary: str, turns: Sequence[Turn], max_tokens: int) -> str:
+    """
+    Fold turns into a running summary.
+
+    The summary is extractive: one line per turn with the start of the question and
+    of the answer. When it outgrows max_tokens the oldest lines are dropped, except
+    the first, which usually states the topic of the conversation.
+
+    Args:
+        summary: The summary of the turns before these.
+        turns: Turns to add, oldest first.
+        max_tokens: Token budget for the summary.
+
+    Returns:
+        str: The new summary.
+    """
+    lines = summary.splitlines() if summary else []
+    for turn in turns:
+        lines.append(f"- User asked: {_clip(turn.user_query, _SUMMARY_QUERY_CHARS)} "
+                     f"Answer: {_clip(turn.assistant_response, _SUMMARY_ANSWER_CHARS)}")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        del lines[1]
+    return "\n".join(lines)
+
+
+def fit_history(session: Session, max_tokens: int,
+                summarizer: Callable[[str, Sequence[Turn], int], str] = summarize_turns) -> bool:
+    """
+    Fold the turns that no longer fit the budget into the session's summary.
+
+    The newest turns are kept verbatim within max_tokens minus the summary's share;
+    older ones not yet summarized are passed to `summarizer`. The newest turn is
+    always kept, even if it alone exceeds the budget.
+
+    Args:
+        session: The session to compact in place.
+        max_tokens: Token budget for summary plus recent turns.
+        summarizer: Function (summary, turns, max_tokens) -> summary.
+
+    Returns:
+        bool: True if the summary changed.
+    """
+    summary_budget = int(max_tokens * SUMMARY_BUDGET_FRACTION)
+    budget = max_tokens - summary_budget
+    first_recent = len(session.turns)
+    while first_recent > session.summarized_turns:
+        tokens = session.turns[first_recent - 1].tokens
+        if tokens > budget and first_recent < len(session.turns):
+            break
+        budget -= tokens
+        first_recent -= 1
+    if first_recent == session.summarized_turns:
+        return False
+    folded = session.turns[session.summarized_turns:first_recent]
+    session.summary = summarizer(session.summary, folded, summary_budget)
+    session.summarized_turns = first_recent
+    logger.debug(f"Summarized {len(folded)} turns of session {session.session_id}")
+    return True
+
+
+def turns_from_messages(messages: Sequence[Any]) -> List[Turn]:
+    """Pair up user/assistant messages (objects with role and content), as the chat endpoints send them."""
+    turns = []
+    for i in range(0, len(messages) - 1, 2):
+        user_msg, assistant_msg = messages[i], messages[i + 1]
+        if user_msg.role == "user" and assistant_msg.role == "assistant":
+            turns.append(Turn(user_msg.content, assistant_msg.content))
+    return turns
+
+
+def get_history_token_budget() -> int:
+    """Token budget for conversation history in chat prompts (`history_token_budget` in generator.json)."""
+    return configs.get("history_token_budget") or DEFAULT_HISTORY_TOKEN_BUDGET
+
+
+class SessionStore:
+    """Conversation sessions in a bounded in-memory LRU, persisted to SQLite."""
+
+    def __init__(self, db_path: Optional[str] = None, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS):
+        self.db_path = db_path or os.path.join(get_adalflow_default_root_path(), SESSION_DB_FILE)
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                summarized_turns INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id TEXT NOT NULL,
+                turn_index INTEGER NOT NULL,
+                user_query TEXT NOT NULL,
+                assistant_response TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (session_id, turn_index)
+            );
+        """)
+        self.purge_expired()
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        row = self._conn.execute(
+            "SELECT summary, summarized_turns, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        turns = [Turn(user_query, assistant_response, tokens) for user_query, assistant_response, tokens in
+                 self._conn.execute("SELECT user_query, assistant_response, tokens FROM turns "
+                                    "WHERE session_id = ? ORDER BY turn_index", (session_id,))]
+        return Session(session_id, turns, row[0], row[1], row[2])
+
+    def _remember(self, session: Session) -> None:
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Session:
+        """
+        Return the session, loading it from disk if it is not in memory.
+
+        A cached session is reloaded if another process has updated it since, and an
+        unknown or expired id starts an empty session.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            row = self._conn.execute(
+                "SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[0] < time.time() - self.ttl_seconds:
+                session = Session(session_id)
+            elif session is None or session.updated_at != row[0]:
+                session = self._load(session_id)
+            self._remember(session)
+            return session
+
+    def _save_header(self, session: Session) -> None:
+        self._conn.execute(
+            "INSERT INTO sessions (session_id, summary, summarized_turns, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, "
+            "summarized_turns = excluded.summarized_turns, updated_at = excluded.updated_at",
+            (session.session_id, session.summary, session.summarized_turns, session.updated_at),
+        )
+
+    def append_turns(self, session_id: str, turns: Sequence[Turn]) -> Session:
+        """
+        Append turns to a session and persist them.
+
+        Args:
+            session_id: The conversation id.
+            turns: Turns to append, oldest first.
+
+        Returns:
+            Session: The updated session.
+        """
+        session = self.get(session_id)
+        with self._lock:
+            with self._conn:
+                if session.updated_at == 0.0:
+                    # Clear what is left of an expired session under the same id
+                    self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                start = len(session.turns)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO turns (session_id, turn_index, user_query, assistant_response, tokens) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, start + i, t.user_query, t.assistant_response, t.tokens) for i, t in enumerate(turns)],
+                )
+                session.turns.extend(turns)
+                session.updated_at = time.time()
+                self._save_header(session)
+        return session
+
+    def append_turn(self, session_id: str, user_query: str, assistant_response: str) -> Session:
+        """Append one completed exchange to a session."""
+        return self.append_turns(session_id, [Turn(user_query, assistant_response)])
+
+    def prompt_history(self, session: Session, max_tokens: Optional[int] = None) -> PromptHistory:
+        """
+        Return the summary and recent turns of a session that fit the history budget,
+        persisting the summary if older turns had to be folded into it.
+        """
+        max_tokens = max_tokens or get_history_token_budget()
+        with self._lock:
+            if fit_history(session, max_tokens) and session.updated_at:
+                with self._conn:
+                    self._save_header(session)
+            return PromptHistory(session.summary, session.turns[session.summarized_turns:])
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session."""
+        with self._lock, self._conn:
+            self._sessions.pop(session_id, None)
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self) -> int:
+        """Delete sessions idle for longer than the TTL; returns how many were deleted."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock, self._conn:
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            for session_id in expired:
+                self._sessions.pop(session_id, None)
+                self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        if expired:
+            logger.info(f"Purged {len(expired)} expired chat sessions")
+        return len(expired)
+
+    def close(self):
+        self._conn.close()
+
+
+def stateless_history(messages: Sequence[Any], max_tokens: Optional[int] = None) -> PromptHistory:
+    """Apply the history budget to a conversation sent in full by the client."""
+    session = Session("", turns_from_messages(messages))
+    fit_history(session, max_tokens or get_history_token_budget())
+    return PromptHistory(session.summary, session.turns[session.summarized_turns:])
+
+
+def resolve_history(messages: Sequence[Any], session_id: Optional[str] = None) -> Tuple[List[Turn], PromptHistory]:
+    """
+    Return the earlier turns of a chat request's conversation and the part of them
+    that fits the prompt.
+
+    With a session id the turns come from the session store; a client that still
+    sends the full conversation seeds a new session from it. Without one the turns
+    are paired from `messages`.
+
+    Args:
+        messages: The request's messages, the new user message last.
+        session_id: Optional conversation id.
+
+    Returns:
+        Tuple[List[Turn], PromptHistory]: All earlier turns, and the summary and recent
+        turns to render.
+    """
+    if not session_id:
+        turns = turns_from_messages(messages[:-1])
+        return turns, stateless_history(messages[:-1])
+    store = get_session_store()
+    session = store.get(session_id)
+    if not session.turns and len(messages) > 1:
+        session = store.append_turns(session_id, turns_from_messages(messages[:-1]))
+    return list(session.turns), store.prompt_history(session)
+
+
+_session_store: Optional[SessionStore] = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide SessionStore."""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = SessionStore()
+    return _session_store
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import List, Optional
@@ -5,20 +6,34 @@ from urllib.parse import unquote
 
 import google.generativeai as genai
 from adalflow.components.model_client.ollama_client import OllamaClient
-from adalflow.core.types import ModelType
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 
+from api.admission import (
+    AdmissionRejected,
+    estimate_request_tokens,
+    get_admission_controller,
+    retry_after_header,
+)
+from api.cancellation import CancelToken, is_own_cancellation, set_cancel_token, watch_http_disconnect
 from api.config import get_model_config, configs, OPENROUTER_API_KEY, OPENAI_API_KEY, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+from api.context_builder import build_context
 from api.data_pipeline import count_tokens, get_file_content
+from api.executors import run_cpu, run_io
 from api.openai_client import OpenAIClient
 from api.openrouter_client import OpenRouterClient
 from api.bedrock_client import BedrockClient
 from api.azureai_client import AzureAIClient
 from api.github_copilot_client import GitHubCopilotClient
+from api.index_store import ChunkFilter
+from api.client_pool import get_model_client
+from api.prompt_budget import format_history, leaves_room_for_context, output_token_reserve, plan_prompt
 from api.rag import RAG
+from api.session_store import get_session_store, resolve_history
+from api.stream_buffer import StreamBuffer, get_stream_registry, resumable_streams_enabled
+from api.streaming import is_token_limit_error, provider_error_message, stream_completion
 from api.prompts import (
     DEEP_RESEARCH_FIRST_ITERATION_PROMPT,
     DEEP_RESEARCH_FINAL_ITERATION_PROMPT,
@@ -72,25 +87,56 @@ class ChatCompletionRequest(BaseModel):
     excluded_files: Optional[str] = Field(None, description="Comma-separated list of file patterns to exclude from processing")
     included_dirs: Optional[str] = Field(None, description="Comma-separated list of directories to include exclusively")
     included_files: Optional[str] = Field(None, description="Comma-separated list of file patterns to include exclusively")
+    session_id: Optional[str] = Field(None, description="Conversation id; earlier turns are kept server-side and only the new message needs to be sent")
+    resumable: bool = Field(False, description="Keep the answer server-side and send its id in X-Stream-Id, to resume it after a dropped connection")
+
+class _AnswerStreamingResponse(StreamingResponse):
+    """StreamingResponse of an answer nobody can resume; the answer stops when the response ends."""
+
+    def __init__(self, stream: StreamBuffer, **kwargs):
+        super().__init__(stream.read(), **kwargs)
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.stream.cancel()
 
 @app.post("/chat/completions/stream")
-async def chat_completions_stream(request: ChatCompletionRequest):
+async def chat_completions_stream(request: ChatCompletionRequest, http_request: Request):
     """Stream a chat completion response directly using Google Generative AI"""
+    # A client that goes away while the retriever is prepared cancels that work;
+    # a resumable answer already being generated waits a while for the client to resume it
+    cancel_token = CancelToken()
+    set_cancel_token(cancel_token)
+    disconnect_watcher = watch_http_disconnect(http_request, cancel_token)
+    ticket = None
+    request_rag = None
     try:
         # Check if request contains very large input
         input_too_large = False
+        input_tokens = 0
         if request.messages and len(request.messages) > 0:
             last_message = request.messages[-1]
             if hasattr(last_message, 'content') and last_message.content:
                 tokens = count_tokens(last_message.content, request.provider == "ollama")
+                input_tokens = tokens
                 logger.info(f"Request size: {tokens} tokens")
-                if tokens > 8000:
-                    logger.warning(f"Request exceeds recommended token limit ({tokens} > 7500)")
+                if not leaves_room_for_context(request.provider, request.model, tokens):
+                    logger.warning(f"Request of {tokens} tokens leaves no room for retrieved context, skipping retrieval")
                     input_too_large = True
 
+        # Wait for a slot with the provider, or turn the request away if too many are waiting
+        try:
+            ticket = await get_admission_controller().admit(
+                request.provider, estimate_request_tokens(request.provider, request.model, input_tokens))
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+
         # Create a new RAG instance for this request
         try:
-            request_rag = RAG(provider=request.provider, model=request.model)
+            request_rag = await run_io(RAG, provider=request.provider, model=request.model)
 
             # Extract custom file filter parameters if provided
             excluded_dirs = None
@@ -111,7 +157,9 @@ async def chat_completions_stream(request: ChatCompletionRequest):
                 included_files = [unquote(file_pattern) for file_pattern in request.included_files.split('\n') if file_pattern.strip()]
                 logger.info(f"Using custom included files: {included_files}")
 
-            request_rag.prepare_retriever(request.repo_url, request.type, request.token, excluded_dirs, excluded_files, included_dirs, included_files)
+            # Cloning, reading and embedding a repository blocks; keep it off the event loop
+            await run_io(request_rag.prepare_retriever, request.repo_url, request.type, request.token,
+                         excluded_dirs, excluded_files, included_dirs, included_files)
             logger.info(f"Retriever prepared for {request.repo_url}")
         except ValueError as e:
             if "No valid documents with embeddings found" in str(e):
@@ -136,17 +184,16 @@ async def chat_completions_stream(request: ChatCompletionRequest):
         if last_message.role != "user":
             raise HTTPException(status_code=400, detail="Last message must be from the user")
 
-        # Process previous messages to build conversation history
-        for i in range(0, len(request.messages) - 1, 2):
-            if i + 1 < len(request.messages):
-                user_msg = request.messages[i]
-                assistant_msg = request.messages[i + 1]
-
-                if user_msg.role == "user" and assistant_msg.role == "assistant":
-                    request_rag.memory.add_dialog_turn(
-                        user_query=user_msg.content,
-                        assistant_response=assistant_msg.content
-                    )
+        # Build conversation history from the session, or from the messages sent by the client
+        user_message = last_message.content
+        earlier_turns, history = await run_io(resolve_history, request.messages, request.session_id)
+        if request.session_id:
+            # Expand the stored turns so Deep Research detection sees the whole conversation
+            request.messages = [
+                ChatMessage(role=role, content=content)
+                for turn in earlier_turns
+                for role, content in (("user", turn.user_query), ("assistant", turn.assistant_response))
+            ] + [last_message]
 
         # Check if this is a Deep Research request
         is_deep_research = False
@@ -187,46 +234,36 @@ async def chat_completions_stream(request: ChatCompletionRequest):
         # Only retrieve documents if input is not too large
         context_text = ""
         retrieved_documents = None
+        retrieved_chunks = []
 
         if not input_too_large:
             try:
-                # If filePath exists, modify the query for RAG to focus on the file
-                rag_query = query
+                # If filePath exists, search only that file's chunks
+                chunk_filter = None
                 if request.filePath:
-                    # Use the file path to get relevant context about the file
-                    rag_query = f"Contexts related to {request.filePath}"
-                    logger.info(f"Modified RAG query to focus on file: {request.filePath}")
+                    chunk_filter = ChunkFilter(file_path=request.filePath)
+                    logger.info(f"Restricting RAG retrieval to file: {request.filePath}")
 
                 # Try to perform RAG retrieval
                 try:
                     # This will use the actual RAG implementation
-                    retrieved_documents = request_rag(rag_query, language=request.language)
+                    retrieved_documents = await run_cpu(request_rag, query, language=request.language, chunk_filter=chunk_filter)
+
+                    # The file may not be indexed (e.g. excluded by filters); search the whole repo for it instead
+                    if chunk_filter is not None and not (
+                        retrieved_documents and getattr(retrieved_documents[0], 'documents', None)
+                    ):
+                        logger.info(f"No indexed chunks for {request.filePath}, searching the whole repository")
+                        retrieved_documents = await run_cpu(request_rag, f"Contexts related to {request.filePath}",
+                                                                  language=request.language)
 
                     if retrieved_documents and retrieved_documents[0].documents:
                         # Format context for the prompt in a more structured way
                         documents = retrieved_documents[0].documents
                         logger.info(f"Retrieved {len(documents)} documents")
 
-                        # Group documents by file path
-                        docs_by_file = {}
-                        for doc in documents:
-                            file_path = doc.meta_data.get('file_path', 'unknown')
-                            if file_path not in docs_by_file:
-                                docs_by_file[file_path] = []
-                            docs_by_file[file_path].append(doc)
-
-                        # Format context text with file path grouping
-                        context_parts = []
-                        for file_path, docs in docs_by_file.items():
-                            # Add file header with metadata
-                            header = f"## File Path: {file_path}\n\n"
-                            # Add document content
-                            content = "\n\n".join([doc.text for doc in docs])
-
-                            context_parts.append(f"{header}{content}")
-
-                        # Join all parts with clear separation
-                        context_text = "\n\n" + "-" * 10 + "\n\n".join(context_parts)
+                        # Formatted once the rest of the prompt has been sized
+                        retrieved_chunks = documents
                     else:
                         logger.warning("No documents retrieved from RAG")
                 except Exception as e:
@@ -292,17 +329,22 @@ async def chat_completions_stream(request: ChatCompletionRequest):
         file_content = ""
         if request.filePath:
             try:
-                file_content = get_file_content(request.repo_url, request.filePath, request.type, request.token)
+                file_content = await run_io(get_file_content, request.repo_url, request.filePath, request.type, request.token)
                 logger.info(f"Successfully retrieved content for file: {request.filePath}")
             except Exception as e:
                 logger.error(f"Error retrieving file content: {str(e)}")
                 # Continue without file content if there's an error
 
-        # Format conversation history
-        conversation_history = ""
-        for turn_id, turn in request_rag.memory().items():
-            if not isinstance(turn_id, int) and hasattr(turn, 'user_query') and hasattr(turn, 'assistant_response'):
-                conversation_history += f"<turn>\n<user>{turn.user_query.query_str}</user>\n<assistant>{turn.assistant_response.response_str}</assistant>\n</turn>\n"
+        # Fit file content, history and retrieved context into the model's context window,
+        # so the prompt is sent once instead of failing and being retried without context
+        budget = plan_prompt(request.provider, request.model,
+                             f"/no_think {system_prompt}\n\n<query>\n{query}\n</query>\n\nAssistant: ",
+                             history, file_content)
+        file_content = budget.file_content
+        conversation_history = format_history(budget.history)
+        if retrieved_chunks:
+            # Merge overlapping chunks per file within the room that is left
+            context_text = build_context(retrieved_chunks, max_tokens=budget.context_tokens)
 
         # Create the prompt with context
         prompt = f"/no_think {system_prompt}\n\n"
@@ -327,6 +369,12 @@ async def chat_completions_stream(request: ChatCompletionRequest):
 
         prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
 
+        prompt_tokens = count_tokens(prompt, request.provider == "ollama")
+        if prompt_tokens > budget.limit:
+            logger.warning(f"Prompt of {prompt_tokens} tokens exceeds the {budget.limit}-token limit")
+        # Charge the provider's token budget for the actual prompt instead of the estimate
+        ticket.settle(prompt_tokens + output_token_reserve(request.provider, request.model))
+
         model_config = get_model_config(request.provider, request.model)["model_kwargs"]
 
         # Log iFlow provider usage
@@ -339,11 +387,9 @@ async def chat_completions_stream(request: ChatCompletionRequest):
         if request.provider == "iflow":
             logger.info(f"🌟 Processing iFlow Request with model: {request.model}")
             
-            # Use OpenAIClient configured for iFlow
+            # Use the pooled OpenAIClient configured for iFlow
             model_client_config = get_model_config(request.provider, request.model)
-            # For iFlow, model_client is a factory function, so we need to call it
-            model_client_factory = model_client_config["model_client"]
-            model = model_client_factory()  # Call the factory to get the actual client instance
+            model = get_model_client(model_client_config["client_class"], **model_client_config["initialize_kwargs"])
             
             # iFlow supported parameters (OpenAI-compatible subset)
             supported_params = ["temperature", "top_p", "max_tokens", "frequency_penalty", "presence_penalty"]
@@ -382,19 +428,11 @@ async def chat_completions_stream(request: ChatCompletionRequest):
             
             model_kwargs = final_kwargs
             logger.info(f"🔒 iFlow Final Model Kwargs (double-filtered): {model_kwargs}")
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
-            
-            logger.info(f"📤 iFlow API kwargs prepared successfully")
             
         elif request.provider == "ollama":
             prompt += " /no_think"
 
-            model = OllamaClient()
+            model = get_model_client(OllamaClient)
             model_kwargs = {
                 "model": model_config["model"],
                 "stream": True,
@@ -404,12 +442,6 @@ async def chat_completions_stream(request: ChatCompletionRequest):
                     "num_ctx": model_config["num_ctx"]
                 }
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "openrouter":
             logger.info(f"Using OpenRouter with model: {request.model}")
 
@@ -418,7 +450,7 @@ async def chat_completions_stream(request: ChatCompletionRequest):
                 logger.warning("OPENROUTER_API_KEY not configured, but continuing with request")
                 # We'll let the OpenRouterClient handle this and return a friendly error message
 
-            model = OpenRouterClient()
+            model = get_model_client(OpenRouterClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
@@ -427,12 +459,6 @@ async def chat_completions_stream(request: ChatCompletionRequest):
             # Only add top_p if it exists in the model config
             if "top_p" in model_config:
                 model_kwargs["top_p"] = model_config["top_p"]
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "openai":
             logger.info(f"Using Openai protocol with model: {request.model}")
 
@@ -442,7 +468,7 @@ async def chat_completions_stream(request: ChatCompletionRequest):
                 # We'll let the OpenAIClient handle this and return an error message
 
             # Initialize Openai client
-            model = OpenAIClient()
+            model = get_model_client(OpenAIClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
@@ -451,12 +477,6 @@ async def chat_completions_stream(request: ChatCompletionRequest):
             # Only add top_p if it exists in the model config
             if "top_p" in model_config:
                 model_kwargs["top_p"] = model_config["top_p"]
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "bedrock":
             logger.info(f"Using AWS Bedrock with model: {request.model}")
 
@@ -466,35 +486,23 @@ async def chat_completions_stream(request: ChatCompletionRequest):
                 # We'll let the BedrockClient handle this and return an error message
 
             # Initialize Bedrock client
-            model = BedrockClient()
+            model = get_model_client(BedrockClient)
             model_kwargs = {
                 "model": request.model,
                 "temperature": model_config["temperature"],
                 "top_p": model_config["top_p"]
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "azure":
             logger.info(f"Using Azure AI with model: {request.model}")
 
             # Initialize Azure AI client
-            model = AzureAIClient()
+            model = get_model_client(AzureAIClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
                 "temperature": model_config["temperature"],
                 "top_p": model_config["top_p"]
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "github_copilot":
             logger.info(f"Using GitHub Copilot with model: {request.model}")
 
@@ -502,7 +510,7 @@ async def chat_completions_stream(request: ChatCompletionRequest):
             logger.info("GitHub Copilot ready - uses automatic OAuth2 authentication")
 
             # Initialize GitHub Copilot client
-            model = GitHubCopilotClient()
+            model = get_model_client(GitHubCopilotClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
@@ -514,14 +522,9 @@ async def chat_completions_stream(request: ChatCompletionRequest):
             # Only add max_tokens if it exists in the model config
             if "max_tokens" in model_config:
                 model_kwargs["max_tokens"] = model_config["max_tokens"]
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         else:
             # Initialize Google Generative AI model
+            model_kwargs = None
             model = genai.GenerativeModel(
                 model_name=model_config["model"],
                 generation_config={
@@ -531,367 +534,92 @@ async def chat_completions_stream(request: ChatCompletionRequest):
                 }
             )
 
-        # Create a streaming response
-        async def response_stream():
+        # Generate the answer into a stream, which a resumable request can resume after reconnecting
+        async def generate(stream: StreamBuffer):
             try:
-                if request.provider == "iflow":
-                    try:
-                        logger.info("🔄 Making iFlow API call...")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        logger.info("📡 iFlow API call successful, streaming response...")
-                        
-                        # Handle streaming response from iFlow (OpenAI-compatible)
-                        async for chunk in response:
-                            logger.debug(f"🔸 iFlow raw chunk: {chunk}")
-                            choices = getattr(chunk, "choices", [])
-                            if len(choices) > 0:
-                                delta = getattr(choices[0], "delta", None)
-                                if delta is not None:
-                                    text = getattr(delta, "content", None)
-                                    if text is not None:
-                                        logger.info(f"🔸 iFlow yielding text: '{text}' (type: {type(text)}, length: {len(text)})")
-                                        yield text
-                                    else:
-                                        logger.warning(f"🔸 iFlow delta has no content: {delta}")
-                                else:
-                                    logger.warning(f"🔸 iFlow choice has no delta: {choices[0]}")
-                            else:
-                                logger.warning(f"🔸 iFlow chunk has no choices: {chunk}")
-                                
-                            # Check for finish reason
-                            if len(choices) > 0 and hasattr(choices[0], 'finish_reason'):
-                                finish_reason = choices[0].finish_reason
-                                if finish_reason:
-                                    logger.info(f"🔸 iFlow finish reason: {finish_reason}")
-                        
-                        logger.info("✅ iFlow response streaming completed")
-                        
-                    except Exception as e_iflow:
-                        logger.error(f"❌ Error with iFlow API: {str(e_iflow)}")
-                        yield f"\nError with iFlow API: {str(e_iflow)}\n\nPlease check that you have set the IFLOW_API_KEY environment variable with a valid API key."
-                        
-                elif request.provider == "ollama":
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from Ollama
-                    async for chunk in response:
-                        text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                        if text and not text.startswith('model=') and not text.startswith('created_at='):
-                            text = text.replace('<think>', '').replace('</think>', '')
-                            yield text
-                elif request.provider == "openrouter":
-                    try:
-                        # Get the response and handle it properly using the previously created api_kwargs
-                        logger.info("Making OpenRouter API call")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        # Handle streaming response from OpenRouter
-                        async for chunk in response:
-                            yield chunk
-                    except Exception as e_openrouter:
-                        logger.error(f"Error with OpenRouter API: {str(e_openrouter)}")
-                        yield f"\nError with OpenRouter API: {str(e_openrouter)}\n\nPlease check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."
-                elif request.provider == "openai":
-                    try:
-                        # Get the response and handle it properly using the previously created api_kwargs
-                        logger.info("Making Openai API call")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        # Handle streaming response from Openai
-                        async for chunk in response:
-                           choices = getattr(chunk, "choices", [])
-                           if len(choices) > 0:
-                               delta = getattr(choices[0], "delta", None)
-                               if delta is not None:
-                                    text = getattr(delta, "content", None)
-                                    if text is not None:
-                                        yield text
-                    except Exception as e_openai:
-                        logger.error(f"Error with Openai API: {str(e_openai)}")
-                        yield f"\nError with Openai API: {str(e_openai)}\n\nPlease check that you have set the OPENAI_API_KEY environment variable with a valid API key."
-                elif request.provider == "bedrock":
-                    try:
-                        # Get the response and handle it properly using the previously created api_kwargs
-                        logger.info("Making AWS Bedrock API call")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        # Handle response from Bedrock (not streaming yet)
-                        if isinstance(response, str):
-                            yield response
-                        else:
-                            # Try to extract text from the response
-                            yield str(response)
-                    except Exception as e_bedrock:
-                        logger.error(f"Error with AWS Bedrock API: {str(e_bedrock)}")
-                        yield f"\nError with AWS Bedrock API: {str(e_bedrock)}\n\nPlease check that you have set the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables with valid credentials."
-                elif request.provider == "azure":
-                    try:
-                        # Get the response and handle it properly using the previously created api_kwargs
-                        logger.info("Making Azure AI API call")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        # Handle streaming response from Azure AI
-                        async for chunk in response:
-                            choices = getattr(chunk, "choices", [])
-                            if len(choices) > 0:
-                                delta = getattr(choices[0], "delta", None)
-                                if delta is not None:
-                                    text = getattr(delta, "content", None)
-                                    if text is not None:
-                                        yield text
-                    except Exception as e_azure:
-                        logger.error(f"Error with Azure AI API: {str(e_azure)}")
-                        yield f"\nError with Azure AI API: {str(e_azure)}\n\nPlease check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."
-                elif request.provider == "github_copilot":
-                    try:
-                        # Get the response and handle it properly using the previously created api_kwargs
-                        logger.info("Making GitHub Copilot API call")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        # Handle streaming response from GitHub Copilot
-                        async for chunk in response:
-                            if chunk:  # GitHub Copilot returns text chunks directly
-                                yield chunk
-                    except Exception as e_github:
-                        logger.error(f"Error with GitHub Copilot API: {str(e_github)}")
-                        yield f"\nError with GitHub Copilot API: {str(e_github)}\n\nGitHub Copilot uses OAuth2 authentication. If you're seeing authentication errors, you may need to set up OAuth2 or provide a GITHUB_TOKEN environment variable with Copilot access."
-                else:
-                    # Generate streaming response
-                    response = model.generate_content(prompt, stream=True)
-                    # Stream the response
-                    for chunk in response:
-                        if hasattr(chunk, 'text'):
-                            yield chunk.text
-
-            except Exception as e_outer:
-                logger.error(f"Error in streaming response: {str(e_outer)}")
-                error_message = str(e_outer)
-
-                # Check for token limit errors
-                if "maximum context length" in error_message or "token limit" in error_message or "too many tokens" in error_message:
-                    # If we hit a token limit error, try again without context
-                    logger.warning("Token limit exceeded, retrying without context")
+                try:
+                    async for text in stream_completion(request.provider, model, prompt, model_kwargs):
+                        stream.append(text)
+
+                except Exception as e_outer:
+                    logger.error(f"Error in streaming response: {str(e_outer)}")
+
+                    # Check for token limit errors
+                    if is_token_limit_error(e_outer):
+                        # If we hit a token limit error, try again without context
+                        logger.warning("Token limit exceeded, retrying without context")
+                        try:
+                            # Create a simplified prompt without context
+                            simplified_prompt = f"/no_think {system_prompt}\n\n"
+                            if conversation_history:
+                                simplified_prompt += f"<conversation_history>\n{conversation_history}</conversation_history>\n\n"
+
+                            # Include file content in the fallback prompt if it was retrieved
+                            if request.filePath and file_content:
+                                simplified_prompt += f"<currentFileContent path=\"{request.filePath}\">\n{file_content}\n</currentFileContent>\n\n"
+
+                            simplified_prompt += "<note>Answering without retrieval augmentation due to input size constraints.</note>\n\n"
+                            simplified_prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
+
+                            if request.provider == "ollama":
+                                simplified_prompt += " /no_think"
+
+                            async for text in stream_completion(request.provider, model, simplified_prompt, model_kwargs):
+                                stream.append(text)
+                        except Exception as e2:
+                            logger.error(f"Error in fallback streaming response: {str(e2)}")
+                            stream.append("\nI apologize, but your request is too large for me to process. Please try a shorter query or break it into smaller parts.")
+                    else:
+                        # For other errors, return the error message
+                        stream.append(provider_error_message(request.provider, e_outer))
+            finally:
+                generation_ticket.release()
+                if request.session_id:
+                    # Keep the exchange server-side so the client can send only its next message
                     try:
-                        # Create a simplified prompt without context
-                        simplified_prompt = f"/no_think {system_prompt}\n\n"
-                        if conversation_history:
-                            simplified_prompt += f"<conversation_history>\n{conversation_history}</conversation_history>\n\n"
-
-                        # Include file content in the fallback prompt if it was retrieved
-                        if request.filePath and file_content:
-                            simplified_prompt += f"<currentFileContent path=\"{request.filePath}\">\n{file_content}\n</currentFileContent>\n\n"
-
-                        simplified_prompt += "<note>Answering without retrieval augmentation due to input size constraints.</note>\n\n"
-                        simplified_prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
-
-                        if request.provider == "iflow":
-                            try:
-                                logger.info("🔄 Making iFlow fallback API call (token limit exceeded)...")
-                                
-                                # Use the same filtered model_kwargs for fallback
-                                fallback_model_kwargs = {
-                                    "model": request.model,
-                                    "stream": True,
-                                }
-                                
-                                # Apply the same parameter filtering for fallback
-                                supported_params = ["temperature", "top_p", "max_tokens", "frequency_penalty", "presence_penalty"]
-                                for param in supported_params:
-                                    if param in model_config:
-                                        fallback_model_kwargs[param] = model_config[param]
-                                
-                                # Double-check fallback parameters too
-                                final_fallback_kwargs = {}
-                                allowed_keys = ["model", "stream"] + supported_params
-                                for key, value in fallback_model_kwargs.items():
-                                    if key in allowed_keys:
-                                        final_fallback_kwargs[key] = value
-                                    else:
-                                        logger.warning(f"⚠️ iFlow Fallback: Removing unexpected parameter: {key}")
-                                
-                                fallback_model_kwargs = final_fallback_kwargs
-                                logger.info(f"🔒 iFlow Fallback Model Kwargs (double-filtered): {fallback_model_kwargs}")
-                                
-                                # Create new api_kwargs with the simplified prompt
-                                fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                    input=simplified_prompt,
-                                    model_kwargs=fallback_model_kwargs,
-                                    model_type=ModelType.LLM
-                                )
-
-                                # Get the response using the simplified prompt
-                                fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                                # Handle streaming fallback response from iFlow
-                                async for chunk in fallback_response:
-                                    choices = getattr(chunk, "choices", [])
-                                    if len(choices) > 0:
-                                        delta = getattr(choices[0], "delta", None)
-                                        if delta is not None:
-                                            text = getattr(delta, "content", None)
-                                            if text is not None:
-                                                yield text
-                                                
-                                logger.info("✅ iFlow fallback response completed")
-                                
-                            except Exception as e_iflow_fallback:
-                                logger.error(f"❌ Error with iFlow API fallback: {str(e_iflow_fallback)}")
-                                yield f"\nError with iFlow API fallback: {str(e_iflow_fallback)}\n\nPlease check that you have set the IFLOW_API_KEY environment variable with a valid API key."
-                                
-                        elif request.provider == "ollama":
-                            simplified_prompt += " /no_think"
-
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback_response from Ollama
-                            async for chunk in fallback_response:
-                                text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                                if text and not text.startswith('model=') and not text.startswith('created_at='):
-                                    text = text.replace('<think>', '').replace('</think>', '')
-                                    yield text
-                        elif request.provider == "openrouter":
-                            try:
-                                # Create new api_kwargs with the simplified prompt
-                                fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                    input=simplified_prompt,
-                                    model_kwargs=model_kwargs,
-                                    model_type=ModelType.LLM
-                                )
-
-                                # Get the response using the simplified prompt
-                                logger.info("Making fallback OpenRouter API call")
-                                fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                                # Handle streaming fallback_response from OpenRouter
-                                async for chunk in fallback_response:
-                                    yield chunk
-                            except Exception as e_fallback:
-                                logger.error(f"Error with OpenRouter API fallback: {str(e_fallback)}")
-                                yield f"\nError with OpenRouter API fallback: {str(e_fallback)}\n\nPlease check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."
-                        elif request.provider == "openai":
-                            try:
-                                # Create new api_kwargs with the simplified prompt
-                                fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                    input=simplified_prompt,
-                                    model_kwargs=model_kwargs,
-                                    model_type=ModelType.LLM
-                                )
-
-                                # Get the response using the simplified prompt
-                                logger.info("Making fallback Openai API call")
-                                fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                                # Handle streaming fallback_response from Openai
-                                async for chunk in fallback_response:
-                                    text = chunk if isinstance(chunk, str) else getattr(chunk, 'text', str(chunk))
-                                    yield text
-                            except Exception as e_fallback:
-                                logger.error(f"Error with Openai API fallback: {str(e_fallback)}")
-                                yield f"\nError with Openai API fallback: {str(e_fallback)}\n\nPlease check that you have set the OPENAI_API_KEY environment variable with a valid API key."
-                        elif request.provider == "bedrock":
-                            try:
-                                # Create new api_kwargs with the simplified prompt
-                                fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                    input=simplified_prompt,
-                                    model_kwargs=model_kwargs,
-                                    model_type=ModelType.LLM
-                                )
-
-                                # Get the response using the simplified prompt
-                                logger.info("Making fallback AWS Bedrock API call")
-                                fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                                # Handle response from Bedrock
-                                if isinstance(fallback_response, str):
-                                    yield fallback_response
-                                else:
-                                    # Try to extract text from the response
-                                    yield str(fallback_response)
-                            except Exception as e_fallback:
-                                logger.error(f"Error with AWS Bedrock API fallback: {str(e_fallback)}")
-                                yield f"\nError with AWS Bedrock API fallback: {str(e_fallback)}\n\nPlease check that you have set the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables with valid credentials."
-                        elif request.provider == "azure":
-                            try:
-                                # Create new api_kwargs with the simplified prompt
-                                fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                    input=simplified_prompt,
-                                    model_kwargs=model_kwargs,
-                                    model_type=ModelType.LLM
-                                )
-
-                                # Get the response using the simplified prompt
-                                logger.info("Making fallback Azure AI API call")
-                                fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                                # Handle streaming fallback response from Azure AI
-                                async for chunk in fallback_response:
-                                    choices = getattr(chunk, "choices", [])
-                                    if len(choices) > 0:
-                                        delta = getattr(choices[0], "delta", None)
-                                        if delta is not None:
-                                            text = getattr(delta, "content", None)
-                                            if text is not None:
-                                                yield text
-                            except Exception as e_fallback:
-                                logger.error(f"Error with Azure AI API fallback: {str(e_fallback)}")
-                                yield f"\nError with Azure AI API fallback: {str(e_fallback)}\n\nPlease check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."
-                        elif request.provider == "github_copilot":
-                            try:
-                                # Create new api_kwargs with the simplified prompt
-                                fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                    input=simplified_prompt,
-                                    model_kwargs=model_kwargs,
-                                    model_type=ModelType.LLM
-                                )
-
-                                # Get the response using the simplified prompt
-                                logger.info("Making fallback GitHub Copilot API call")
-                                fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                                # Handle streaming fallback response from GitHub Copilot
-                                async for chunk in fallback_response:
-                                    if chunk:  # GitHub Copilot returns text chunks directly
-                                        yield chunk
-                            except Exception as e_fallback:
-                                logger.error(f"Error with GitHub Copilot API fallback: {str(e_fallback)}")
-                                yield f"\nError with GitHub Copilot API fallback: {str(e_fallback)}\n\nGitHub Copilot uses OAuth2 authentication. If you're seeing authentication errors, you may need to set up OAuth2 or provide a GITHUB_TOKEN environment variable with Copilot access."
-                        else:
-                            # Initialize Google Generative AI model
-                            model_config = get_model_config(request.provider, request.model)
-                            fallback_model = genai.GenerativeModel(
-                                model_name=model_config["model"],
-                                generation_config={
-                                    "temperature": model_config["model_kwargs"].get("temperature", 0.7),
-                                    "top_p": model_config["model_kwargs"].get("top_p", 0.8),
-                                    "top_k": model_config["model_kwargs"].get("top_k", 40)
-                                }
-                            )
-
-                            # Get streaming response using simplified prompt
-                            fallback_response = fallback_model.generate_content(simplified_prompt, stream=True)
-                            # Stream the fallback response
-                            for chunk in fallback_response:
-                                if hasattr(chunk, 'text'):
-                                    yield chunk.text
-                    except Exception as e2:
-                        logger.error(f"Error in fallback streaming response: {str(e2)}")
-                        yield f"\nI apologize, but your request is too large for me to process. Please try a shorter query or break it into smaller parts."
-                else:
-                    # For other errors, return the error message
-                    yield f"\nError: {error_message}"
-
-        # Return streaming response
-        return StreamingResponse(response_stream(), media_type="text/event-stream")
-
+                        await run_io(get_session_store().append_turn, request.session_id, user_message, stream.text)
+                    except Exception as e:
+                        logger.error(f"Could not save turn of session {request.session_id}: {str(e)}")
+
+        # The generation task releases the admission slot when the answer is complete
+        generation_ticket, ticket = ticket, None
+        # With several workers a resume could reach one without the buffer, so no id is sent
+        resumable = request.resumable and resumable_streams_enabled()
+        stream = get_stream_registry().start(generate, resumable=resumable)
+        if not resumable:
+            return _AnswerStreamingResponse(stream, media_type="text/event-stream")
+        return StreamingResponse(stream.read(), media_type="text/event-stream",
+                                 headers={"X-Stream-Id": stream.stream_id})
+
+    except asyncio.CancelledError as e:
+        if not is_own_cancellation(e, cancel_token):
+            raise
+        logger.info("Chat request cancelled after the client disconnected")
+        # Nobody is listening; 499 is the conventional "client closed request" status
+        return Response(status_code=499)
     except HTTPException:
         raise
     except Exception as e_handler:
         error_msg = f"Error in streaming chat completion: {str(e_handler)}"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
+    finally:
+        if ticket is not None:
+            ticket.release()
+        # Retrieval is done; the cached retriever may be closed once evicted
+        if request_rag is not None:
+            request_rag.close()
+        disconnect_watcher.cancel()
+
+@app.get("/chat/completions/stream/{stream_id}")
+async def resume_chat_stream(stream_id: str, offset: int = 0):
+    """Resume a chat completion from the X-Stream-Id of its response, after `offset` characters"""
+    stream = get_stream_registry().get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} has expired or does not exist")
+    logger.info(f"Resuming stream {stream_id} at offset {offset}")
+    return StreamingResponse(stream.read(offset), media_type="text/event-stream",
+                             headers={"X-Stream-Id": stream_id})
 
 @app.get("/")
 async def root():
@@ -0,0 +1,416 @@
+"""
+Disk-budget-aware tracking and garbage collection of per-repository artifacts.
+
+Everything DeepWiki writes under ~/.adalflow is attributed to a repository:
+    repos/{repo_name}/                          cloned repository        (kind "repo")
+    databases/{repo_name}/{fingerprint}/        index store + FAISS index (kind "index")
+    databases/{repo_name}.pkl                   legacy LocalDB pickle     (kind "index")
+    wikicache/deepwiki_cache_{type}_{repo_name}_{lang}.json   wiki cache  (kind "wiki")
+
+Sizes and last-access times are kept in a small SQLite table next to those
+directories. Clones and derived artifacts (indexes and wiki caches) have separate
+budgets, so evicting an index never forces a re-clone and vice versa.
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from adalflow.utils import get_adalflow_default_root_path
+
+from api.atomic_io import file_lock
+
+logger = logging.getLogger(__name__)
+
+KIND_REPO = "repo"
+KIND_INDEX = "index"
+KIND_WIKI = "wiki"
+DERIVED_KINDS = (KIND_INDEX, KIND_WIKI)
+
+WIKI_CACHE_PREFIX = "deepwiki_cache_"
+WIKI_CACHE_SUFFIX = ".json"
+
+# Budgets in megabytes; unset or 0 means unlimited
+REPOS_BUDGET_ENV = "DEEPWIKI_STORAGE_REPOS_MAX_MB"
+DERIVED_BUDGET_ENV = "DEEPWIKI_STORAGE_DERIVED_MAX_MB"
+GC_INTERVAL_ENV = "DEEPWIKI_STORAGE_GC_INTERVAL"
+DEFAULT_GC_INTERVAL = 3600
+
+# Artifacts used this recently are never evicted, so in-flight builds and chats are safe
+DEFAULT_MIN_IDLE_SECONDS = 600
+
+
+@dataclass
+class Artifact:
+    kind: str
+    repo_name: str
+    path: str
+    size_bytes: int
+    last_access: float
+
+
+def budget_from_env(name: str) -> Optional[int]:
+    """Read a budget in megabytes from the environment and return it in bytes, or None if unset."""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return None
+    try:
+        megabytes = float(raw)
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {raw!r}")
+        return None
+    return int(megabytes * 1024 * 1024) if megabytes > 0 else None
+
+
+def parse_wiki_cache_filename(filename: str) -> Optional[str]:
+    """
+    Extract the repo name from a wiki cache filename.
+
+    Filenames are `deepwiki_cache_{type}_{owner}_{repo}_{language}.json`; the repo
+    type and language never contain underscores, so the middle part is exact.
+
+    Returns:
+        The `{owner}_{repo}` name, or None if the file is not a wiki cache.
+    """
+    if not (filename.startswith(WIKI_CACHE_PREFIX) and filename.endswith(WIKI_CACHE_SUFFIX)):
+        return None
+    parts = filename[len(WIKI_CACHE_PREFIX):-len(WIKI_CACHE_SUFFIX)].split("_")
+    if len(parts) < 3:
+        return None
+    return "_".join(parts[1:-1])
+
+
+def _path_size(path: str) -> int:
+    """Return the total size of a file or directory tree, without following symlinks."""
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return os.lstat(path).st_size
+    except OSError:
+        return 0
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _path_mtime(path: str) -> float:
+    try:
+        return os.lstat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+def _visible(names: Iterable[str]) -> List[str]:
+    return [name for name in names if not name.startswith(".")]
+
+
+def _remove_path(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+class StorageManager:
+    """Tracks per-repo artifacts under the adalflow root and evicts them under disk budgets."""
+
+    def __init__(self, root_path: Optional[str] = None):
+        self.root_path = root_path or get_adalflow_default_root_path()
+        self.repos_dir = os.path.join(self.root_path, "repos")
+        self.databases_dir = os.path.join(self.root_path, "databases")
+        self.wikicache_dir = os.path.join(self.root_path, "wikicache")
+        self.db_path = os.path.join(self.root_path, "storage.sqlite")
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.root_path, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                path TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        return conn
+
+    def touch(self, kind: str, repo_name: str, path: str) -> None:
+        """
+        Record that an artifact was just used.
+
+        Never raises: access tracking must not break the request that triggered it.
+        """
+        path = os.path.abspath(path)
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        """
+                        INSERT INTO artifacts (path, kind, repo_name, size_bytes, last_access)
+                        VALUES (?, ?, ?, 0, ?)
+                        ON CONFLICT(path) DO UPDATE SET last_access = excluded.last_access
+                        """,
+                        (path, kind, repo_name, time.time()),
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+        except Exception as e:
+            logger.warning(f"Could not record access to {path}: {e}")
+
+    def discover(self) -> List[Artifact]:
+        """Find all artifacts currently on disk, with their sizes and on-disk mtimes."""
+        found = []
+        # Hidden entries are in-progress writes or directories being replaced (see atomic_io)
+        if os.path.isdir(self.repos_dir):
+            for name in _visible(os.listdir(self.repos_dir)):
+                path = os.path.join(self.repos_dir, name)
+                if os.path.isdir(path):
+                    found.append((KIND_REPO, name, path))
+        if os.path.isdir(self.databases_dir):
+            for name in _visible(os.listdir(self.databases_dir)):
+                path = os.path.join(self.databases_dir, name)
+                if name.endswith(".pkl") and os.path.isfile(path):
+                    found.append((KIND_INDEX, name[:-len(".pkl")], path))
+                elif os.path.isdir(path):
+                    for fingerprint in _visible(os.listdir(path)):
+                        store_path = os.path.join(path, fingerprint)
+                        if os.path.isdir(store_path):
+                            found.append((KIND_INDEX, name, store_path))
+        if os.path.isdir(self.wikicache_dir):
+            for name in os.listdir(self.wikicache_dir):
+                repo_name = parse_wiki_cache_filename(name)
+                if repo_name:
+                    found.append((KIND_WIKI, repo_name, os.path.join(self.wikicache_dir, name)))
+
+        return [
+            Artifact(kind, repo_name, os.path.abspath(path), _path_size(path), _path_mtime(path))
+            for kind, repo_name, path in found
+        ]
+
+    def scan(self) -> List[Artifact]:
+        """
+        Reconcile the tracking table with what is on disk.
+
+        New artifacts are tracked with their mtime as last access, sizes are refreshed,
+        and rows for artifacts that no longer exist are dropped.
+
+        Returns:
+            List[Artifact]: All artifacts on disk with their recorded last access.
+        """
+        on_disk = self.discover()
+        with self._lock:
+            conn = self._connect()
+            try:
+                tracked = {
+                    row[0]: row[1]
+                    for row in conn.execute("SELECT path, last_access FROM artifacts")
+                }
+                for artifact in on_disk:
+                    artifact.last_access = max(tracked.get(artifact.path, 0.0), artifact.last_access)
+                conn.executemany(
+                    """
+                    INSERT INTO artifacts (path, kind, repo_name, size_bytes, last_access)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET
+                        kind = excluded.kind,
+                        repo_name = excluded.repo_name,
+                        size_bytes = excluded.size_bytes,
+                        last_access = excluded.last_access
+                    """,
+                    [(a.path, a.kind, a.repo_name, a.size_bytes, a.last_access) for a in on_disk],
+                )
+                stale = set(tracked) - {a.path for a in on_disk}
+                conn.executemany("DELETE FROM artifacts WHERE path = ?", [(p,) for p in stale])
+                conn.commit()
+            finally:
+                conn.close()
+        return on_disk
+
+    def recent(self, kind: str, limit: Optional[int] = None) -> List[Artifact]:
+        """
+        Return tracked artifacts of a kind that are still on disk, most recently used first.
+
+        Args:
+            kind: The artifact kind, e.g. KIND_INDEX.
+            limit: Return at most this many.
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT kind, repo_name, path, size_bytes, last_access FROM artifacts "
+                    "WHERE kind = ? ORDER BY last_access DESC",
+                    (kind,),
+                ).fetchall()
+            finally:
+                conn.close()
+        artifacts = [Artifact(*row) for row in rows if os.path.exists(row[2])]
+        return artifacts if limit is None else artifacts[:limit]
+
+    def usage(self, artifacts: Optional[Iterable[Artifact]] = None) -> Dict[str, int]:
+        """Return the total bytes used per artifact kind."""
+        totals = {KIND_REPO: 0, KIND_INDEX: 0, KIND_WIKI: 0}
+        for artifact in artifacts if artifacts is not None else self.scan():
+            totals[artifact.kind] = totals.get(artifact.kind, 0) + artifact.size_bytes
+        return totals
+
+    def _evict(self, artifacts: List[Artifact], budget: int, now: float,
+               min_idle_seconds: float, dry_run: bool) -> List[Artifact]:
+        """Evict least recently used artifacts until their total size fits the budget."""
+        total = sum(a.size_bytes for a in artifacts)
+        evicted = []
+        for artifact in sorted(artifacts, key=lambda a: a.last_access):
+            if total <= budget:
+                break
+            if now - artifact.last_access < min_idle_seconds:
+                continue
+            if not dry_run:
+                try:
+                    # Skip artifacts that are being built or cloned right now
+                    with file_lock(artifact.path, blocking=False):
+                        _remove_path(artifact.path)
+                except BlockingIOError:
+                    logger.info(f"Skipping eviction of {artifact.path}: in use")
+                    continue
+                except OSError as e:
+                    logger.warning(f"Could not evict {artifact.path}: {e}")
+                    continue
+                self._forget([artifact.path])
+            logger.info(
+                f"{'Would evict' if dry_run else 'Evicted'} {artifact.kind} {artifact.path} "
+                f"({artifact.size_bytes} bytes, last used {time.ctime(artifact.last_access)})"
+            )
+            total -= artifact.size_bytes
+            evicted.append(artifact)
+        if total > budget:
+            logger.warning(f"Storage still over budget after eviction: {total} > {budget} bytes")
+        return evicted
+
+    def _forget(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.executemany("DELETE FROM artifacts WHERE path = ?", [(p,) for p in paths])
+                conn.commit()
+            finally:
+                conn.close()
+
+    def collect(self, repos_budget: Optional[int] = None, derived_budget: Optional[int] = None,
+                min_idle_seconds: float = DEFAULT_MIN_IDLE_SECONDS, dry_run: bool = False) -> List[Artifact]:
+        """
+        Enforce the disk budgets with LRU eviction.
+
+        Args:
+            repos_budget: Max bytes for cloned repositories, or None for unlimited.
+            derived_budget: Max bytes for indexes and wiki caches together, or None for unlimited.
+            min_idle_seconds: Artifacts used more recently than this are never evicted.
+            dry_run: Only report what would be evicted.
+
+        Returns:
+            List[Artifact]: The artifacts that were (or would be) evicted.
+        """
+        artifacts = self.scan()
+        now = time.time()
+        evicted = []
+        if repos_budget is not None:
+            repos = [a for a in artifacts if a.kind == KIND_REPO]
+            evicted += self._evict(repos, repos_budget, now, min_idle_seconds, dry_run)
+        if derived_budget is not None:
+            derived = [a for a in artifacts if a.kind in DERIVED_KINDS]
+            evicted += self._evict(derived, derived_budget, now, min_idle_seconds, dry_run)
+        return evicted
+
+    def collect_from_env(self, dry_run: bool = False) -> List[Artifact]:
+        """Run collect() with the budgets configured in the environment."""
+        return self.collect(
+            repos_budget=budget_from_env(REPOS_BUDGET_ENV),
+            derived_budget=budget_from_env(DERIVED_BUDGET_ENV),
+            dry_run=dry_run,
+        )
+
+    def remove_repo(self, repo_name: str, kinds: Iterable[str] = (KIND_REPO, KIND_INDEX, KIND_WIKI)) -> List[str]:
+        """
+        Remove the artifacts of exactly one repository.
+
+        Args:
+            repo_name: The `{owner}_{repo}` name.
+            kinds: Which artifact kinds to remove.
+
+        Returns:
+            List[str]: The removed paths.
+        """
+        kinds = set(kinds)
+        removed = []
+        for artifact in self.discover():
+            if artifact.repo_name != repo_name or artifact.kind not in kinds:
+                continue
+            _remove_path(artifact.path)
+            removed.append(artifact.path)
+        # Drop the now-empty per-repo databases directory
+        repo_db_dir = os.path.join(self.databases_dir, repo_name)
+        if KIND_INDEX in kinds and os.path.isdir(repo_db_dir):
+            shutil.rmtree(repo_db_dir)
+            removed.append(os.path.abspath(repo_db_dir))
+        self._forget(removed)
+        return removed
+
+
+_storage_manager: Optional[StorageManager] = None
+
+
+def get_storage_manager() -> StorageManager:
+    """Return the process-wide StorageManager."""
+    global _storage_manager
+    if _storage_manager is None:
+        _storage_manager = StorageManager()
+    return _storage_manager
+
+
+def start_background_sweeper(interval: Optional[float] = None) -> Optional[threading.Thread]:
+    """
+    Periodically enforce the configured disk budgets in a daemon thread.
+
+    Does nothing if no budget is configured.
+
+    Returns:
+        The sweeper thread, or None if it was not started.
+    """
+    if budget_from_env(REPOS_BUDGET_ENV) is None and budget_from_env(DERIVED_BUDGET_ENV) is None:
+        logger.info("No storage budget configured, background storage sweeper disabled")
+        return None
+    if interval is None:
+        try:
+            interval = float(os.environ.get(GC_INTERVAL_ENV, DEFAULT_GC_INTERVAL))
+        except ValueError:
+            interval = DEFAULT_GC_INTERVAL
+
+    def sweep():
+        manager = get_storage_manager()
+        while True:
+            try:
+                evicted = manager.collect_from_env()
+                if evicted:
+                    logger.info(f"Storage sweeper evicted {len(evicted)} artifacts")
+            except Exception as e:
+                logger.error(f"Storage sweeper failed: {e}", exc_info=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="storage-sweeper", daemon=True)
+    thread.start()
+    logger.info(f"Started background storage sweeper (every {interval:.0f}s)")
+    return thread
@@ -0,0 +1,259 @@
+"""
+Server-side buffers that let a chat client resume an interrupted answer.
+
+A model answer is generated by a task of its own, into a StreamBuffer, rather
+than by the connection that asked for it. Connections read from the buffer.
+When a connection drops during a long wiki page or deep-research answer,
+generation keeps going. The client can reconnect with the stream's id and the
+number of characters it already received, and gets the rest: first what was
+buffered meanwhile, then the live text if generation is still running.
+
+Finished buffers are kept for STREAM_TTL_SECONDS. A stream that nobody reads
+for ORPHAN_GRACE_SECONDS while it is still generating is cancelled, so a
+client that is gone for good does not keep paying for its answer. Only clients
+that asked for a resumable answer get its id; any other answer is not
+registered and stops as soon as its connection does.
+
+Offsets count characters (Unicode code points) of the answer. Buffers live in
+the worker that generated them, and workers are not reached by sticky routing,
+so answers are only resumable when the API runs a single worker
+(DEEPWIKI_WORKERS=1).
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from api.cancellation import CancelToken, set_cancel_token
+
+logger = logging.getLogger(__name__)
+
+# How long a finished stream can still be resumed
+STREAM_TTL_SECONDS = 300.0
+# How long a running stream without readers waits for one before it is cancelled
+ORPHAN_GRACE_SECONDS = 60.0
+# Streams kept at most; the oldest finished ones are dropped first
+MAX_STREAMS = 1000
+
+WORKERS_ENV = "DEEPWIKI_WORKERS"
+
+
+def resumable_streams_enabled() -> bool:
+    """Whether answers can be resumed: a resume must reach the worker holding the buffer."""
+    raw = os.environ.get(WORKERS_ENV, "").strip()
+    try:
+        return not raw or int(raw) <= 1
+    except ValueError:
+        return True
+
+
+class StreamBuffer:
+    """The text of one answer, appended by its producer and read by any number of connections."""
+
+    def __init__(self, stream_id: str, orphan_grace: Optional[float] = ORPHAN_GRACE_SECONDS):
+        self.stream_id = stream_id
+        self.orphan_grace = orphan_grace
+        self.length = 0
+        self.done = False
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.readers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._parts: List[str] = []
+        self._starts: List[int] = []
+        self._changed = asyncio.Event()
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def append(self, text: str) -> None:
+        """Add text generated for the answer."""
+        if text and not self.done:
+            self._starts.append(self.length)
+            self._parts.append(text)
+            self.length += len(text)
+            self._notify()
+
+    def finish(self) -> None:
+        """Mark the answer complete; readers get the rest and stop."""
+        if not self.done:
+            self.done = True
+            self.finished_at = time.time()
+            self._cancel_orphan_timer()
+            self._notify()
+
+    def text_from(self, offset: int) -> str:
+        """The buffered text from a character offset on."""
+        offset = max(0, offset)
+        if offset >= self.length:
+            return ""
+        index = bisect.bisect_right(self._starts, offset) - 1
+        return self._parts[index][offset - self._starts[index]:] + "".join(self._parts[index + 1:])
+
+    async def read(self, offset: int = 0) -> AsyncIterator[str]:
+        """
+        Yield the answer from `offset` on, waiting for new text until the answer is complete.
+
+        Args:
+            offset: Characters the reader already has.
+        """
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                if offset < self.length:
+                    text = self.text_from(offset)
+                    offset = self.length
+                    yield text
+                    continue
+                if self.done:
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+    def _attach(self) -> None:
+        self.readers += 1
+        self._cancel_orphan_timer()
+
+    def _detach(self) -> None:
+        self.readers -= 1
+        self.watch_orphan()
+
+    def watch_orphan(self) -> None:
+        """Cancel the producer if nobody reads the stream within the grace period."""
+        if self.orphan_grace is None:
+            return
+        if self.readers == 0 and not self.done and self._orphan_timer is None:
+            self._orphan_timer = asyncio.get_running_loop().call_later(self.orphan_grace, self._abandon)
+
+    def cancel(self) -> None:
+        """Stop generating the answer, if it is still running."""
+        if not self.done and self.task is not None:
+            self.task.cancel()
+
+    def _cancel_orphan_timer(self) -> None:
+        if self._orphan_timer is not None:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+
+    def _abandon(self) -> None:
+        self._orphan_timer = None
+        if self.readers == 0 and not self.done and self.task is not None:
+            logger.info(f"Cancelling stream {self.stream_id}: no client resumed it within {self.orphan_grace:.0f}s")
+            self.task.cancel()
+
+
+class StreamRegistry:
+    """The resumable streams of this worker."""
+
+    def __init__(self, ttl: float = STREAM_TTL_SECONDS, orphan_grace: float = ORPHAN_GRACE_SECONDS,
+                 max_streams: int = MAX_STREAMS):
+        self.ttl = ttl
+        self.orphan_grace = orphan_grace
+        self.max_streams = max_streams
+        self._streams: "OrderedDict[str, StreamBuffer]" = OrderedDict()
+
+    def start(self, producer: Callable[[StreamBuffer], Awaitable[None]], resumable: bool = True) -> StreamBuffer:
+        """
+        Run `producer` as a task that appends an answer to a new stream.
+
+        Args:
+            producer: Coroutine function writing the answer with `stream.append`.
+            resumable: Register the stream so it can be resumed by id. A stream that is
+                not resumable keeps the connection's cancel token, and the caller cancels
+                it when the connection ends.
+
+        Returns:
+            StreamBuffer: The stream; read it with `stream.read()`.
+        """
+        if not resumable:
+            stream = StreamBuffer(uuid.uuid4().hex, orphan_grace=None)
+            stream.task = asyncio.get_running_loop().create_task(self._produce(stream, producer))
+            return stream
+        self.purge()
+        stream = StreamBuffer(uuid.uuid4().hex, self.orphan_grace)
+        self._streams[stream.stream_id] = stream
+        stream.task = asyncio.get_running_loop().create_task(self._produce(stream, producer, detach=True))
+        # Also covers a client that never starts reading
+        stream.watch_orphan()
+        return stream
+
+    async def _produce(self, stream: StreamBuffer, producer: Callable[[StreamBuffer], Awaitable[None]],
+                       detach: bool = False) -> None:
+        if detach:
+            # The task copied the connection's cancel token; a dropped connection must not stop the answer
+            set_cancel_token(CancelToken())
+        try:
+            await producer(stream)
+        except asyncio.CancelledError:
+            logger.info(f"Stream {stream.stream_id} cancelled after {stream.length} characters")
+        except Exception as e:
+            logger.error(f"Error generating stream {stream.stream_id}: {str(e)}")
+            stream.append(f"\nError: {str(e)}")
+        finally:
+            stream.finish()
+
+    def get(self, stream_id: str) -> Optional[StreamBuffer]:
+        """The stream with this id, or None if it never existed or has expired."""
+        self.purge()
+        return self._streams.get(stream_id)
+
+    def purge(self) -> None:
+        """Drop finished streams past their TTL, and the oldest finished ones beyond max_streams."""
+        now = time.time()
+        expired = [stream_id for stream_id, stream in self._streams.items()
+                   if stream.done and now - stream.finished_at > self.ttl]
+        for stream_id in expired:
+            del self._streams[stream_id]
+        if len(self._streams) > self.max_streams:
+            for stream_id in [stream_id for stream_id, stream in self._streams.items() if stream.done]:
+                del self._streams[stream_id]
+                if len(self._streams) <= self.max_streams:
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        running = sum(1 for stream in self._streams.values() if not stream.done)
+        return {
+            "streams": len(self._streams),
+            "running": running,
+            "buffered_chars": sum(stream.length for stream in self._streams.values()),
+        }
+
+
+def stream_event(stream_id: str) -> str:
+    """The websocket message telling a client the id to resume its answer with."""
+    return json.dumps({"type": "stream", "stream_id": stream_id})
+
+
+async def relay_stream(stream: StreamBuffer, websocket: Any, offset: int = 0) -> None:
+    """Send a stream to a websocket from `offset` on, until the answer is complete."""
+    async for text in stream.read(offset):
+        await websocket.send_text(text)
+
+
+_stream_registry: Optional[StreamRegistry] = None
+_stream_registry_lock = threading.Lock()
+
+
+def get_stream_registry() -> StreamRegistry:
+    """Return the process-wide stream registry."""
+    global _stream_registry
+    if _stream_registry is None:
+        with _stream_registry_lock:
+            if _stream_registry is None:
+                _stream_registry = StreamRegistry()
+    return _stream_registry
@@ -0,0 +1,256 @@
+"""
+Provider-agnostic streaming of model completions to chat clients.
+
+Each provider streams in its own shape: OpenAI-compatible chunks with
+`choices[0].delta.content`, plain strings (OpenRouter, GitHub Copilot), Ollama
+generate responses, Google's synchronous iterator, or one whole string
+(Bedrock). `stream_completion` calls the provider and yields plain text for all of
+them.
+
+Providers emit many tiny deltas. Forwarding each one as its own websocket frame
+or HTTP chunk costs a send per token and ties the upstream read to the client.
+Deltas are therefore coalesced: text is flushed when COALESCE_MAX_CHARS have
+accumulated or COALESCE_WINDOW_SECONDS after the first buffered delta,
+whichever comes first. The upstream is read into a bounded queue. A slow
+client gets fewer, larger frames. A client that stops reading fills the queue,
+and reading from the provider pauses. A client that disconnects closes the
+provider stream.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from adalflow.core.types import ModelType
+
+from api.cancellation import record_cancellation
+from api.executors import run_io
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW_SECONDS = 0.03
+COALESCE_MAX_CHARS = 4096
+# Deltas buffered between the provider and a slow client before reading pauses
+STREAM_QUEUE_SIZE = 256
+
+PROVIDER_ERROR_HINTS: Dict[str, str] = {
+    "openrouter": "Please check that you have set the OPENROUTER_API_KEY environment variable with a valid API key.",
+    "openai": "Please check that you have set the OPENAI_API_KEY environment variable with a valid API key.",
+    "iflow": "Please check that you have set the IFLOW_API_KEY environment variable with a valid API key.",
+    "bedrock": "Please check that you have set the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables with valid credentials.",
+    "azure": "Please check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values.",
+    "dashscope": "Please check that you have set the DASHSCOPE_API_KEY environment variable with a valid API key.",
+    "github_copilot": "GitHub Copilot uses automatic OAuth2 authentication. Please ensure you have access to GitHub Copilot.",
+}
+
+PROVIDER_NAMES: Dict[str, str] = {
+    "openrouter": "OpenRouter",
+    "openai": "Openai",
+    "iflow": "iFlow",
+    "bedrock": "AWS Bedrock",
+    "azure": "Azure AI",
+    "dashscope": "DashScope",
+    "github_copilot": "GitHub Copilot",
+    "ollama": "Ollama",
+    "google": "Google",
+}
+
+_END = object()
+
+
+def is_token_limit_error(error: BaseException) -> bool:
+    """Whether a provider error says the prompt was too long."""
+    message = str(error)
+    return "maximum context length" in message or "token limit" in message or "too many tokens" in message
+
+
+def provider_error_message(provider: str, error: BaseException) -> str:
+    """The message sent to the client when a provider call fails."""
+    hint = PROVIDER_ERROR_HINTS.get(provider)
+    if hint is None:
+        return f"\nError: {str(error)}"
+    return f"\nError with {PROVIDER_NAMES.get(provider, provider)} API: {str(error)}\n\n{hint}"
+
+
+def chunk_text(chunk: Any, provider: Optional[str] = None) -> Optional[str]:
+    """
+    Extract the text of one streamed chunk.
+
+    Args:
+        chunk: A chunk as yielded by the provider client.
+        provider: The provider name, for provider-specific cleanup.
+
+    Returns:
+        Optional[str]: The text, or None for chunks without any.
+    """
+    if chunk is None:
+        return None
+    if isinstance(chunk, str):
+        text = chunk
+    elif getattr(chunk, "choices", None) is not None:
+        # OpenAI-compatible chunk
+        choices = chunk.choices
+        delta = getattr(choices[0], "delta", None) if len(choices) > 0 else None
+        text = getattr(delta, "content", None) if delta is not None else None
+    elif provider == "ollama":
+        text = getattr(chunk, "response", None) or getattr(chunk, "text", None) or str(chunk)
+    else:
+        try:
+            text = getattr(chunk, "text", None)
+        except ValueError:
+            # Google raises for chunks without text parts, e.g. a final safety chunk
+            text = None
+    if provider == "ollama" and text:
+        if text.startswith("model=") or text.startswith("created_at="):
+            return None
+        text = text.replace("<think>", "").replace("</think>", "")
+    return text or None
+
+
+async def iter_chunks(response: Any) -> AsyncIterator[Any]:
+    """
+    Iterate a provider response without blocking the event loop.
+
+    Async iterators are iterated directly, synchronous iterators one chunk at a time
+    on the I/O pool, and a non-streaming response (e.g. a string) is yielded once.
+    """
+    if hasattr(response, "__aiter__"):
+        async for chunk in response:
+            yield chunk
+    elif hasattr(response, "__iter__") and not isinstance(response, (str, bytes, dict)):
+        iterator = iter(response)
+        while True:
+            chunk = await run_io(next, iterator, _END)
+            if chunk is _END:
+                break
+            yield chunk
+    else:
+        yield response
+
+
+async def coalesce(texts: AsyncIterator[str], window: float = COALESCE_WINDOW_SECONDS,
+                   max_chars: int = COALESCE_MAX_CHARS, queue_size: int = STREAM_QUEUE_SIZE) -> AsyncIterator[str]:
+    """
+    Merge text deltas into larger pieces.
+
+    A piece is yielded once it reaches max_chars or `window` seconds after its
+    first delta arrived. Deltas already waiting when the consumer asks for the
+    next piece are merged immediately. Errors from `texts` are raised after the
+    text received before them has been yielded.
+
+    Args:
+        texts: The text deltas.
+        window: Longest time a delta waits for more text, in seconds.
+        max_chars: Size at which a piece is yielded right away.
+        queue_size: Deltas buffered ahead of the consumer before `texts` is paused.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def produce():
+        try:
+            async for text in texts:
+                await queue.put(text)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await queue.put(e)
+        finally:
+            # Close the upstream now rather than when it is garbage collected
+            aclose = getattr(texts, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    producer = asyncio.get_running_loop().create_task(produce())
+    try:
+        done = False
+        while not done:
+            item = await queue.get()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            parts, size = [item], len(item)
+            deadline = time.monotonic() + window
+            error = None
+            while size < max_chars:
+                if queue.empty():
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                if item is _END:
+                    done = True
+                    break
+                if isinstance(item, BaseException):
+                    error = item
+                    break
+                parts.append(item)
+                size += len(item)
+            yield "".join(parts)
+            if error is not None:
+                raise error
+    finally:
+        producer.cancel()
+
+
+async def _completion_texts(provider: str, model: Any, prompt: str,
+                            model_kwargs: Optional[Dict[str, Any]]) -> AsyncIterator[str]:
+    if hasattr(model, "generate_content"):
+        # Google Generative AI: a blocking call returning a synchronous iterator
+        response = await run_io(model.generate_content, prompt, stream=True)
+    else:
+        api_kwargs = model.convert_inputs_to_api_kwargs(input=prompt, model_kwargs=model_kwargs,
+                                                        model_type=ModelType.LLM)
+        logger.info(f"Making {PROVIDER_NAMES.get(provider, provider)} API call")
+        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
+    try:
+        async for chunk in iter_chunks(response):
+            text = chunk_text(chunk, provider)
+            if text:
+                yield text
+    finally:
+        # Closing the provider stream early stops generation upstream instead of
+        # reading (and paying for) an answer nobody receives
+        await _close_response(response)
+
+
+async def _close_response(response: Any) -> None:
+    close = getattr(response, "aclose", None) or getattr(response, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:
+        logger.debug(f"Error closing provider stream: {str(e)}")
+
+
+async def stream_completion(provider: str, model: Any, prompt: str,
+                            model_kwargs: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Call a model with a prompt and yield its answer as coalesced text.
+
+    Args:
+        provider: The provider name from the request.
+        model: The model client, or a google.generativeai GenerativeModel.
+        prompt: The full prompt.
+        model_kwargs: Model arguments for the client; unused for Google.
+
+    Yields:
+        str: Pieces of the answer.
+    """
+    try:
+        async for text in coalesce(_completion_texts(provider, model, prompt, model_kwargs)):
+            yield text
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client went away mid-answer; coalesce closes the provider stream
+        record_cancellation("streams")
+        raise
@@ -1,6 +1,6 @@
 import adalflow as adal
 
-from api.config import configs, get_embedder_type
+from api.config import configs, get_embedder_type, get_embedder_config_by_type
 
 
 def get_embedder(is_local_ollama: bool = False, use_google_embedder: bool = False, embedder_type: str = None) -> adal.Embedder:
@@ -16,29 +16,14 @@ def get_embedder(is_local_ollama: bool = False, use_google_embedder: bool = Fals
     """
     # Determine which embedder config to use
     if embedder_type:
-        if embedder_type == 'ollama':
-            embedder_config = configs["embedder_ollama"]
-        elif embedder_type == 'google':
-            embedder_config = configs["embedder_google"]
-        elif embedder_type == 'github_copilot':
-            embedder_config = configs["embedder_github_copilot"]
-        else:  # default to openai
-            embedder_config = configs["embedder"]
+        embedder_config = get_embedder_config_by_type(embedder_type)
     elif is_local_ollama:
         embedder_config = configs["embedder_ollama"]
     elif use_google_embedder:
         embedder_config = configs["embedder_google"]
     else:
         # Auto-detect based on current configuration
-        current_type = get_embedder_type()
-        if current_type == 'ollama':
-            embedder_config = configs["embedder_ollama"]
-        elif current_type == 'google':
-            embedder_config = configs["embedder_google"]
-        elif current_type == 'github_copilot':
-            embedder_config = configs["embedder_github_copilot"]
-        else:
-            embedder_config = configs["embedder"]
+        embedder_config = get_embedder_config_by_type(get_embedder_type())
 
     # --- Initialize Embedder ---
     model_client_class = embedder_config["model_client"]
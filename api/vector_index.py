@@ -0,0 +1,468 @@
+"""
+Persisted FAISS index for an IndexStore.
+
+The index is built once, when the store is written, and saved next to it as
+`faiss.index`. A small `faiss.json` sidecar records the checksum of the vectors
+it was built from, the index type and build parameters, and the size and mtime
+of the index file it describes. The sidecar is written last, so an index file
+swapped in by a concurrent build is never read with the old sidecar. At query
+time the index is memory-mapped, so API workers share its pages, and only
+rebuilt if the sidecar no longer matches the index file, the store's manifest
+or the configured index type.
+
+Index types (`retriever.index_type` in embedder.json):
+    flat    exact inner-product search
+    hnsw    graph-based approximate search (hnsw_m, ef_construction, ef_search)
+    ivf     inverted-file approximate search (nlist, nprobe)
+    auto    flat for small corpora, hnsw and then ivf as the corpus grows
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import faiss
+import numpy as np
+from adalflow.core.types import RetrieverOutput
+
+from api.atomic_io import atomic_replace, atomic_write, file_lock
+from api.config import configs
+from api.index_store import ChunkFilter, IndexStore
+from api.query_cache import QueryCache, embedder_fingerprint
+
+logger = logging.getLogger(__name__)
+
+FAISS_INDEX_FILE = "faiss.index"
+FAISS_META_FILE = "faiss.json"
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+# Corpus sizes at which index_type "auto" switches to an approximate index
+AUTO_HNSW_MIN_VECTORS = 100_000
+AUTO_IVF_MIN_VECTORS = 1_000_000
+
+
+def _retriever_config() -> Dict[str, Any]:
+    return configs.get("retriever", {})
+
+
+def resolve_index_params(num_vectors: int, index_type: Optional[str] = None,
+                         retriever_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Resolve the index type and build parameters for a corpus.
+
+    Args:
+        num_vectors: Number of vectors to index.
+        index_type: Overrides `retriever.index_type`.
+        retriever_config: Overrides the `retriever` section of embedder.json.
+
+    Returns:
+        dict: Build parameters, recorded with the persisted index.
+    """
+    cfg = _retriever_config() if retriever_config is None else retriever_config
+    index_type = (index_type or cfg.get("index_type") or "auto").lower()
+    if index_type == "auto":
+        if num_vectors >= AUTO_IVF_MIN_VECTORS:
+            index_type = "ivf"
+        elif num_vectors >= AUTO_HNSW_MIN_VECTORS:
+            index_type = "hnsw"
+        else:
+            index_type = "flat"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown retriever index_type '{index_type}', expected one of {INDEX_TYPES} or 'auto'")
+
+    params: Dict[str, Any] = {"index_type": index_type}
+    if index_type == "hnsw":
+        params["hnsw_m"] = int(cfg.get("hnsw_m", 32))
+        params["ef_construction"] = int(cfg.get("ef_construction", 200))
+    elif index_type == "ivf":
+        # ~4*sqrt(n) lists, keeping at least 39 training points per list as FAISS recommends
+        nlist = cfg.get("nlist") or int(4 * np.sqrt(num_vectors))
+        params["nlist"] = int(max(1, min(nlist, num_vectors // 39 or 1)))
+    return params
+
+
+def apply_search_params(index: faiss.Index, retriever_config: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """Apply query-time parameters (ef_search, nprobe) from the retriever config to an index."""
+    cfg = _retriever_config() if retriever_config is None else retriever_config
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = int(cfg.get("ef_search", 64))
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = int(min(cfg.get("nprobe", 16), inner.nlist))
+    return index
+
+
+def _create_index(vectors: np.ndarray, ids: np.ndarray, params: Dict[str, Any]) -> faiss.Index:
+    """Create and fill an id-mapped inner-product index from normalized vectors."""
+    dimensions = vectors.shape[1]
+    index_type = params["index_type"]
+    if index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimensions, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = params["ef_construction"]
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dimensions)
+        inner = faiss.IndexIVFFlat(quantizer, dimensions, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+        # Train on a deterministic sample; more points than ~256 per list add little
+        rng = np.random.default_rng(0)
+        sample_size = min(len(vectors), params["nlist"] * 256)
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        inner.train(sample)
+    else:
+        inner = faiss.IndexFlatIP(dimensions)
+    index = faiss.IndexIDMap(inner)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def _normalized_vectors(store: IndexStore, ids: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(store.vectors[ids], dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _read_index_meta(store_dir: str) -> Optional[dict]:
+    meta_path = os.path.join(store_dir, FAISS_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read FAISS index metadata {meta_path}: {e}")
+        return None
+
+
+def _index_file_identity(index_path: str) -> Optional[dict]:
+    """Size and mtime of the index file, which change whenever a build replaces it."""
+    try:
+        stat = os.stat(index_path)
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_faiss_index(store: IndexStore, params: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """
+    Build a cosine-similarity FAISS index over the store's vectors and save it next to the store.
+
+    Index ids are the store's chunk ids, so search results map straight back to chunks.
+
+    Args:
+        store: The index store to build from.
+        params: Index type and build parameters; resolved from the config if not given.
+
+    Returns:
+        faiss.Index: The in-memory index that was written to disk.
+    """
+    ids = store.vector_ids()
+    if len(ids) == 0 or store.dimensions == 0:
+        raise ValueError(f"No valid embeddings in {store.store_dir}, cannot build a FAISS index")
+
+    params = params or resolve_index_params(len(ids))
+    start = time.perf_counter()
+    index = _create_index(_normalized_vectors(store, ids), ids, params)
+    build_seconds = time.perf_counter() - start
+
+    index_path = os.path.join(store.store_dir, FAISS_INDEX_FILE)
+    meta_path = os.path.join(store.store_dir, FAISS_META_FILE)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    atomic_replace(tmp_path, index_path)
+    # The sidecar goes last and names the index file it describes; until it is replaced,
+    # readers see an identity mismatch and wait for the build instead of mixing the two
+    with atomic_write(meta_path) as f:
+        json.dump({
+            "vectors_checksum": store.vectors_checksum,
+            "ntotal": int(index.ntotal),
+            "dimensions": store.dimensions,
+            "index_params": params,
+            "index_file": _index_file_identity(index_path),
+        }, f, indent=2)
+
+    logger.info(
+        f"Built {params['index_type']} FAISS index with {index.ntotal} vectors in {store.store_dir} "
+        f"({build_seconds:.1f}s)"
+    )
+    return index
+
+
+def _read_flags(index_type: str) -> int:
+    """
+    FAISS read flags that map the index file instead of copying it into the process.
+
+    Mapped pages live in the page cache, so every API worker that opens the same
+    index shares one copy. Flat and HNSW codes are mapped with IO_FLAG_MMAP_IFC,
+    IVF inverted lists with IO_FLAG_MMAP; the two cannot be combined.
+    """
+    if index_type == "ivf":
+        return faiss.IO_FLAG_MMAP
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def _stale_reason(store: IndexStore, index_path: str) -> Optional[tuple]:
+    """Why the persisted index cannot be used, with the parameters to rebuild it with, or None."""
+    meta = _read_index_meta(store.store_dir)
+    if meta is None or not os.path.exists(index_path):
+        return f"No persisted FAISS index in {store.store_dir}, building one", None
+    if meta.get("index_file") != _index_file_identity(index_path):
+        return f"FAISS index in {store.store_dir} does not match its metadata, rebuilding", None
+    if not store.vectors_checksum or meta.get("vectors_checksum") != store.vectors_checksum:
+        return f"FAISS index in {store.store_dir} does not match the stored vectors, rebuilding", None
+    wanted = resolve_index_params(int(meta.get("ntotal", 0)))
+    if meta.get("index_params", {"index_type": "flat"}) != wanted:
+        return f"Configured index {wanted} differs from the persisted one in {store.store_dir}, rebuilding", wanted
+    return None
+
+
+def load_faiss_index(store: IndexStore) -> faiss.Index:
+    """
+    Load the persisted FAISS index for a store, rebuilding it if it is missing or stale.
+
+    The index is memory-mapped, so all workers share its pages. A rebuild holds a
+    file lock, so only one worker builds while the others wait and map the result.
+
+    Args:
+        store: The index store the FAISS index belongs to.
+
+    Returns:
+        faiss.Index: The memory-mapped (or, if mapping fails, in-memory) index.
+    """
+    index_path = os.path.join(store.store_dir, FAISS_INDEX_FILE)
+    if _stale_reason(store, index_path) is not None:
+        with file_lock(index_path):
+            # Another worker may have rebuilt it while we waited
+            stale = _stale_reason(store, index_path)
+            if stale is not None:
+                reason, params = stale
+                logger.info(reason)
+                build_faiss_index(store, params)
+
+    index = _read_consistent_index(store, index_path)
+    if index is None:
+        logger.warning(f"FAISS index in {store.store_dir} is inconsistent with its metadata, rebuilding")
+        with file_lock(index_path):
+            # Another worker may have rebuilt it while we waited
+            if _stale_reason(store, index_path) is None:
+                index = _read_consistent_index(store, index_path)
+            if index is None:
+                index = build_faiss_index(store)
+    return apply_search_params(index)
+
+
+def _read_consistent_index(store: IndexStore, index_path: str) -> Optional[faiss.Index]:
+    """Read the persisted index, or return None if it does not match its sidecar and the store."""
+    meta = _read_index_meta(store.store_dir) or {}
+    index_type = meta.get("index_params", {}).get("index_type", "flat")
+    try:
+        index = faiss.read_index(index_path, _read_flags(index_type))
+    except RuntimeError as e:
+        logger.warning(f"Could not memory-map FAISS index {index_path} ({e}), reading it into memory")
+        try:
+            index = faiss.read_index(index_path)
+        except RuntimeError as e:
+            logger.warning(f"Could not read FAISS index {index_path}: {e}")
+            return None
+    # A build may have replaced the file between reading the sidecar and opening it
+    if meta.get("index_file") != _index_file_identity(index_path):
+        return None
+    if index.ntotal != meta.get("ntotal") or index.d != store.dimensions:
+        return None
+    return index
+
+
+def benchmark_index_types(store: IndexStore, index_types: Sequence[str] = INDEX_TYPES,
+                          num_queries: int = 200, top_k: int = 20, noise: float = 0.05,
+                          seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Compare index types on a store: build time, query latency and recall@k against flat search.
+
+    Queries are stored vectors with Gaussian noise added, so no embedder calls are needed.
+    Candidate indexes are built in memory only; nothing is written to disk.
+
+    Args:
+        store: The index store to benchmark.
+        index_types: Index types to compare.
+        num_queries: Number of queries to run against each index.
+        top_k: k for recall@k.
+        noise: Standard deviation of the noise added to sampled vectors.
+        seed: Random seed for query sampling.
+
+    Returns:
+        List[dict]: One result per index type with index_type, params, build_seconds,
+            p50_ms, p95_ms and recall.
+    """
+    ids = store.vector_ids()
+    if len(ids) == 0:
+        raise ValueError(f"No valid embeddings in {store.store_dir}")
+    vectors = _normalized_vectors(store, ids)
+    top_k = min(top_k, len(ids))
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(ids), min(num_queries, len(ids)), replace=False)
+    queries = vectors[sample] + rng.normal(0, noise, size=(len(sample), vectors.shape[1])).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    truth = None
+    results = []
+    for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+        params = resolve_index_params(len(ids), index_type=index_type)
+        start = time.perf_counter()
+        index = apply_search_params(_create_index(vectors, ids, params))
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, result_ids = index.search(query.reshape(1, -1), top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(result_ids[0])
+        if truth is None:
+            truth = found
+        recall = float(np.mean([
+            len(set(a.tolist()) & set(b.tolist())) / top_k for a, b in zip(found, truth)
+        ]))
+        if index_type in index_types:
+            results.append({
+                "index_type": index_type,
+                "params": params,
+                "build_seconds": build_seconds,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "recall": recall,
+            })
+    return results
+
+
+class StoreRetriever:
+    """
+    Retriever over a persisted FAISS index.
+
+    Mirrors adalflow's FAISSRetriever output: `doc_indices` are chunk ids in the store and
+    `doc_scores` are cosine similarities mapped to [0, 1].
+    """
+
+    def __init__(self, store: IndexStore, embedder, top_k: int = 20, index: Optional[faiss.Index] = None,
+                 query_cache: Optional[QueryCache] = None):
+        """
+        Args:
+            store: The index store to retrieve from.
+            embedder: Embedder called with a list of query strings.
+            top_k: Number of chunks to retrieve per query.
+            index: Optional pre-loaded FAISS index; loaded from the store if not given.
+            query_cache: Optional cache of query embeddings and results shared across retrievers.
+        """
+        self.store = store
+        self.embedder = embedder
+        self.top_k = top_k
+        self.index = index if index is not None else load_faiss_index(store)
+        self.query_cache = query_cache
+        self.embedder_fingerprint = embedder_fingerprint(store.manifest.get("index_key"))
+        # Rebuilding with another index type keeps the vectors checksum, so cached results record the index too
+        self.index_params = (_read_index_meta(store.store_dir) or {}).get("index_params", {})
+
+    def _result_key(self, query: str, top_k: int, chunk_filter: Optional[ChunkFilter]) -> tuple:
+        """Cache key of one query's results: the vectors, the index and its search params, and the query."""
+        inner = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap) else self.index
+        search_params = {"index_class": type(inner).__name__}
+        if isinstance(inner, faiss.IndexHNSW):
+            search_params["ef_search"] = int(inner.hnsw.efSearch)
+        elif isinstance(inner, faiss.IndexIVF):
+            search_params["nprobe"] = int(inner.nprobe)
+        index_signature = json.dumps(dict(self.index_params, **search_params), sort_keys=True)
+        return (self.store.vectors_checksum, index_signature, query, top_k, chunk_filter)
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        cache = self.query_cache if self.embedder_fingerprint else None
+        vectors: List[Optional[np.ndarray]] = [
+            cache.embeddings.get((self.embedder_fingerprint, q)) if cache else None for q in queries
+        ]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embeddings = self.embedder([queries[i] for i in missing])
+            embedded = np.array([data.embedding for data in embeddings.data], dtype=np.float32)
+            if embedded.ndim != 2 or embedded.shape[1] != self.index.d:
+                raise ValueError(
+                    f"Query embedding dimension {embedded.shape[-1] if embedded.ndim else 0} does not match the "
+                    f"index dimension {self.index.d}; the index was built with a different embedder"
+                )
+            faiss.normalize_L2(embedded)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                if cache:
+                    cache.embeddings.put((self.embedder_fingerprint, queries[i]), vector)
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+
+    def _search_subset(self, xq: np.ndarray, ids: np.ndarray, top_k: int) -> tuple:
+        """Exact inner-product search restricted to the given chunk ids, shaped like faiss search output."""
+        vectors = _normalized_vectors(self.store, ids)
+        similarities = xq @ vectors.T
+        k = min(top_k, len(ids))
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(xq))[:, None]
+        order = np.argsort(-similarities[rows, top], axis=1, kind="stable")
+        top = top[rows, order]
+        return similarities[rows, top], ids[top]
+
+    def __call__(self, input: Union[str, List[str]], top_k: Optional[int] = None,
+                 chunk_filter: Optional[ChunkFilter] = None) -> List[RetrieverOutput]:
+        """
+        Retrieve the top k chunks for one or more queries.
+
+        Args:
+            input: A query string or a list of query strings.
+            top_k: Overrides the default number of chunks to retrieve.
+            chunk_filter: Restricts the search to chunks matching these metadata predicates.
+                Matching chunks are scored exactly rather than through the ANN index.
+
+        Returns:
+            List[RetrieverOutput]: One output per query, in input order.
+        """
+        if self.index.ntotal == 0:
+            raise ValueError("Index is empty. Please prepare the retriever first")
+        queries = [input] if isinstance(input, str) else list(input)
+        output = [RetrieverOutput(doc_indices=[], doc_scores=[], query=query) for query in queries]
+        top_k = top_k or self.top_k
+
+        valid = [(i, q) for i, q in enumerate(queries) if q]
+        if len(valid) < len(queries):
+            logger.warning("Empty query found, skipping")
+
+        # Results are only reusable against the exact vectors they were computed from
+        cache = self.query_cache if self.store.vectors_checksum else None
+        pending = []
+        for position, query in valid:
+            cached = cache.results.get(self._result_key(query, top_k, chunk_filter)) if cache else None
+            if cached is None:
+                pending.append((position, query))
+            else:
+                output[position].doc_indices, output[position].doc_scores = list(cached[0]), list(cached[1])
+        if not pending:
+            return output
+
+        if chunk_filter is not None:
+            subset = np.intersect1d(self.store.filter_ids(chunk_filter), self.store.vector_ids(), assume_unique=True)
+            if len(subset) == 0:
+                logger.info(f"No indexed chunks match {chunk_filter}")
+                return output
+
+        xq = self._embed_queries([q for _, q in pending])
+        if chunk_filter is not None:
+            scores, ids = self._search_subset(xq, subset, top_k)
+        else:
+            scores, ids = self.index.search(xq, top_k)
+        # Convert cosine similarity [-1, 1] to [0, 1], as FAISSRetriever's "prob" metric does
+        scores = np.round((scores + 1) / 2, 3)
+
+        for (position, query), row_ids, row_scores in zip(pending, ids, scores):
+            keep = row_ids >= 0
+            output[position].doc_indices = row_ids[keep].tolist()
+            output[position].doc_scores = row_scores[keep].tolist()
+            if cache:
+                cache.results.put(
+                    self._result_key(query, top_k, chunk_filter),
+                    (tuple(output[position].doc_indices), tuple(output[position].doc_scores)),
+                )
+        return output
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import List, Optional, Dict, Any
@@ -9,14 +10,35 @@ from adalflow.core.types import ModelType
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException
 from pydantic import BaseModel, Field
 
+from api.admission import (
+    AdmissionRejected,
+    estimate_request_tokens,
+    get_admission_controller,
+    queue_event,
+)
+from api.cancellation import CancelToken, is_own_cancellation, set_cancel_token, watch_websocket_disconnect
 from api.config import get_model_config, configs, OPENROUTER_API_KEY, OPENAI_API_KEY
+from api.context_builder import build_context
 from api.data_pipeline import count_tokens, get_file_content
+from api.executors import run_cpu, run_io
 from api.openai_client import OpenAIClient
 from api.openrouter_client import OpenRouterClient
 from api.azureai_client import AzureAIClient
 from api.dashscope_client import DashscopeClient
 from api.github_copilot_client import GitHubCopilotClient
+from api.index_store import ChunkFilter
+from api.client_pool import get_model_client
+from api.prompt_budget import format_history, leaves_room_for_context, output_token_reserve, plan_prompt
 from api.rag import RAG
+from api.session_store import get_session_store, resolve_history
+from api.stream_buffer import (
+    StreamBuffer,
+    get_stream_registry,
+    relay_stream,
+    resumable_streams_enabled,
+    stream_event,
+)
+from api.streaming import is_token_limit_error, provider_error_message, stream_completion
 
 # Configure logging
 from api.logging_config import setup_logging
@@ -49,6 +71,10 @@ class ChatCompletionRequest(BaseModel):
     excluded_files: Optional[str] = Field(None, description="Comma-separated list of file patterns to exclude from processing")
     included_dirs: Optional[str] = Field(None, description="Comma-separated list of directories to include exclusively")
     included_files: Optional[str] = Field(None, description="Comma-separated list of file patterns to include exclusively")
+    session_id: Optional[str] = Field(None, description="Conversation id; earlier turns are kept server-side and only the new message needs to be sent")
+    queue_events: bool = Field(False, description="Send {\"type\": \"queue\", \"position\": n} messages while the request waits for admission")
+    resumable: bool = Field(False, description="Send {\"type\": \"stream\", \"stream_id\": id} before the answer, to resume it after a dropped connection")
+
 
 async def handle_websocket_chat(websocket: WebSocket):
     """
@@ -56,26 +82,66 @@ async def handle_websocket_chat(websocket: WebSocket):
     This replaces the HTTP streaming endpoint with a WebSocket connection.
     """
     await websocket.accept()
+    cancel_token = CancelToken()
+    disconnect_watcher = None
+    ticket = None
+    request_rag = None
 
     try:
         # Receive and parse the request data
         request_data = await websocket.receive_json()
+
+        # A client that goes away cancels retrieval, embedding and its answer; a
+        # resumable answer already being generated waits a while for the client to resume it.
+        # From here on only the watcher reads from the socket.
+        set_cancel_token(cancel_token)
+        disconnect_watcher = watch_websocket_disconnect(websocket, cancel_token)
+
+        # {"stream_id": ..., "offset": n} resumes an answer after a dropped connection
+        if "stream_id" in request_data:
+            stream = get_stream_registry().get(request_data["stream_id"])
+            if stream is None:
+                await websocket.send_text(f"Error: Stream {request_data['stream_id']} has expired or does not exist")
+            else:
+                logger.info(f"Resuming stream {stream.stream_id} at offset {request_data.get('offset', 0)}")
+                await relay_stream(stream, websocket, int(request_data.get("offset", 0)))
+            await websocket.close()
+            return
+
         request = ChatCompletionRequest(**request_data)
 
         # Check if request contains very large input
         input_too_large = False
+        input_tokens = 0
         if request.messages and len(request.messages) > 0:
             last_message = request.messages[-1]
             if hasattr(last_message, 'content') and last_message.content:
                 tokens = count_tokens(last_message.content, request.provider == "ollama")
+                input_tokens = tokens
                 logger.info(f"Request size: {tokens} tokens")
-                if tokens > 8000:
-                    logger.warning(f"Request exceeds recommended token limit ({tokens} > 7500)")
+                if not leaves_room_for_context(request.provider, request.model, tokens):
+                    logger.warning(f"Request of {tokens} tokens leaves no room for retrieved context, skipping retrieval")
                     input_too_large = True
 
+        # Wait for a slot with the provider, or turn the request away if too many are waiting
+        async def send_queue_position(position: int):
+            await websocket.send_text(queue_event(position))
+
+        try:
+            ticket = await get_admission_controller().admit(
+                request.provider,
+                estimate_request_tokens(request.provider, request.model, input_tokens),
+                on_position=send_queue_position if request.queue_events else None,
+            )
+        except AdmissionRejected as e:
+            await websocket.send_text(f"Error: {str(e)}")
+            # 1013: try again later
+            await websocket.close(code=1013)
+            return
+
         # Create a new RAG instance for this request
         try:
-            request_rag = RAG(provider=request.provider, model=request.model)
+            request_rag = await run_io(RAG, provider=request.provider, model=request.model)
 
             # Extract custom file filter parameters if provided
             excluded_dirs = None
@@ -96,7 +162,9 @@ async def handle_websocket_chat(websocket: WebSocket):
                 included_files = [unquote(file_pattern) for file_pattern in request.included_files.split('\n') if file_pattern.strip()]
                 logger.info(f"Using custom included files: {included_files}")
 
-            request_rag.prepare_retriever(request.repo_url, request.type, request.token, excluded_dirs, excluded_files, included_dirs, included_files)
+            # Cloning, reading and embedding a repository blocks; keep it off the event loop
+            await run_io(request_rag.prepare_retriever, request.repo_url, request.type, request.token,
+                         excluded_dirs, excluded_files, included_dirs, included_files)
             logger.info(f"Retriever prepared for {request.repo_url}")
         except ValueError as e:
             if "No valid documents with embeddings found" in str(e):
@@ -131,17 +199,16 @@ async def handle_websocket_chat(websocket: WebSocket):
             await websocket.close()
             return
 
-        # Process previous messages to build conversation history
-        for i in range(0, len(request.messages) - 1, 2):
-            if i + 1 < len(request.messages):
-                user_msg = request.messages[i]
-                assistant_msg = request.messages[i + 1]
-
-                if user_msg.role == "user" and assistant_msg.role == "assistant":
-                    request_rag.memory.add_dialog_turn(
-                        user_query=user_msg.content,
-                        assistant_response=assistant_msg.content
-                    )
+        # Build conversation history from the session, or from the messages sent by the client
+        user_message = last_message.content
+        earlier_turns, history = await run_io(resolve_history, request.messages, request.session_id)
+        if request.session_id:
+            # Expand the stored turns so Deep Research detection sees the whole conversation
+            request.messages = [
+                ChatMessage(role=role, content=content)
+                for turn in earlier_turns
+                for role, content in (("user", turn.user_query), ("assistant", turn.assistant_response))
+            ] + [last_message]
 
         # Check if this is a Deep Research request
         is_deep_research = False
@@ -182,20 +249,28 @@ async def handle_websocket_chat(websocket: WebSocket):
         # Only retrieve documents if input is not too large
         context_text = ""
         retrieved_documents = None
+        retrieved_chunks = []
 
         if not input_too_large:
             try:
-                # If filePath exists, modify the query for RAG to focus on the file
-                rag_query = query
+                # If filePath exists, search only that file's chunks
+                chunk_filter = None
                 if request.filePath:
-                    # Use the file path to get relevant context about the file
-                    rag_query = f"Contexts related to {request.filePath}"
-                    logger.info(f"Modified RAG query to focus on file: {request.filePath}")
+                    chunk_filter = ChunkFilter(file_path=request.filePath)
+                    logger.info(f"Restricting RAG retrieval to file: {request.filePath}")
 
                 # Try to perform RAG retrieval
                 try:
                     # This will use the actual RAG implementation
-                    retrieved_documents = request_rag(rag_query, language=request.language)
+                    retrieved_documents = await run_cpu(request_rag, query, language=request.language, chunk_filter=chunk_filter)
+
+                    # The file may not be indexed (e.g. excluded by filters); search the whole repo for it instead
+                    if chunk_filter is not None and not (
+                        retrieved_documents and getattr(retrieved_documents[0], 'documents', None)
+                    ):
+                        logger.info(f"No indexed chunks for {request.filePath}, searching the whole repository")
+                        retrieved_documents = await run_cpu(request_rag, f"Contexts related to {request.filePath}",
+                                                                  language=request.language)
 
                     # Check if we got a successful retrieval with documents
                     if (retrieved_documents and 
@@ -207,26 +282,8 @@ async def handle_websocket_chat(websocket: WebSocket):
                         documents = retrieved_documents[0].documents
                         logger.info(f"Retrieved {len(documents)} documents")
 
-                        # Group documents by file path
-                        docs_by_file = {}
-                        for doc in documents:
-                            file_path = doc.meta_data.get('file_path', 'unknown')
-                            if file_path not in docs_by_file:
-                                docs_by_file[file_path] = []
-                            docs_by_file[file_path].append(doc)
-
-                        # Format context text with file path grouping
-                        context_parts = []
-                        for file_path, docs in docs_by_file.items():
-                            # Add file header with metadata
-                            header = f"## File Path: {file_path}\n\n"
-                            # Add document content
-                            content = "\n\n".join([doc.text for doc in docs])
-
-                            context_parts.append(f"{header}{content}")
-
-                        # Join all parts with clear separation
-                        context_text = "\n\n" + "-" * 10 + "\n\n".join(context_parts)
+                        # Formatted once the rest of the prompt has been sized
+                        retrieved_chunks = documents
                     else:
                         logger.warning("No documents retrieved from RAG")
                 except Exception as e:
@@ -397,17 +454,22 @@ This file contains...
         file_content = ""
         if request.filePath:
             try:
-                file_content = get_file_content(request.repo_url, request.filePath, request.type, request.token)
+                file_content = await run_io(get_file_content, request.repo_url, request.filePath, request.type, request.token)
                 logger.info(f"Successfully retrieved content for file: {request.filePath}")
             except Exception as e:
                 logger.error(f"Error retrieving file content: {str(e)}")
                 # Continue without file content if there's an error
 
-        # Format conversation history
-        conversation_history = ""
-        for turn_id, turn in request_rag.memory().items():
-            if not isinstance(turn_id, int) and hasattr(turn, 'user_query') and hasattr(turn, 'assistant_response'):
-                conversation_history += f"<turn>\n<user>{turn.user_query.query_str}</user>\n<assistant>{turn.assistant_response.response_str}</assistant>\n</turn>\n"
+        # Fit file content, history and retrieved context into the model's context window,
+        # so the prompt is sent once instead of failing and being retried without context
+        budget = plan_prompt(request.provider, request.model,
+                             f"/no_think {system_prompt}\n\n<query>\n{query}\n</query>\n\nAssistant: ",
+                             history, file_content)
+        file_content = budget.file_content
+        conversation_history = format_history(budget.history)
+        if retrieved_chunks:
+            # Merge overlapping chunks per file within the room that is left
+            context_text = build_context(retrieved_chunks, max_tokens=budget.context_tokens)
 
         # Create the prompt with context
         prompt = f"/no_think {system_prompt}\n\n"
@@ -432,12 +494,18 @@ This file contains...
 
         prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
 
+        prompt_tokens = count_tokens(prompt, request.provider == "ollama")
+        if prompt_tokens > budget.limit:
+            logger.warning(f"Prompt of {prompt_tokens} tokens exceeds the {budget.limit}-token limit")
+        # Charge the provider's token budget for the actual prompt instead of the estimate
+        ticket.settle(prompt_tokens + output_token_reserve(request.provider, request.model))
+
         model_config = get_model_config(request.provider, request.model)["model_kwargs"]
 
         if request.provider == "ollama":
             prompt += " /no_think"
 
-            model = OllamaClient()
+            model = get_model_client(OllamaClient)
             model_kwargs = {
                 "model": model_config["model"],
                 "stream": True,
@@ -447,12 +515,6 @@ This file contains...
                     "num_ctx": model_config["num_ctx"]
                 }
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "openrouter":
             logger.info(f"Using OpenRouter with model: {request.model}")
 
@@ -461,7 +523,7 @@ This file contains...
                 logger.warning("OPENROUTER_API_KEY not configured, but continuing with request")
                 # We'll let the OpenRouterClient handle this and return a friendly error message
 
-            model = OpenRouterClient()
+            model = get_model_client(OpenRouterClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
@@ -470,12 +532,6 @@ This file contains...
             # Only add top_p if it exists in the model config
             if "top_p" in model_config:
                 model_kwargs["top_p"] = model_config["top_p"]
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "openai":
             logger.info(f"Using Openai protocol with model: {request.model}")
 
@@ -485,7 +541,7 @@ This file contains...
                 # We'll let the OpenAIClient handle this and return an error message
 
             # Initialize Openai client
-            model = OpenAIClient()
+            model = get_model_client(OpenAIClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
@@ -494,46 +550,28 @@ This file contains...
             # Only add top_p if it exists in the model config
             if "top_p" in model_config:
                 model_kwargs["top_p"] = model_config["top_p"]
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "azure":
             logger.info(f"Using Azure AI with model: {request.model}")
 
             # Initialize Azure AI client
-            model = AzureAIClient()
+            model = get_model_client(AzureAIClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
                 "temperature": model_config["temperature"],
                 "top_p": model_config["top_p"]
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "dashscope":
             logger.info(f"Using Dashscope with model: {request.model}")
 
             # Initialize Dashscope client
-            model = DashscopeClient()
+            model = get_model_client(DashscopeClient)
             model_kwargs = {
                 "model": request.model,
                 "stream": True,
                 "temperature": model_config["temperature"],
                 "top_p": model_config["top_p"]
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         elif request.provider == "github_copilot":
             logger.info(f"Using GitHub Copilot with model: {request.model}")
 
@@ -541,21 +579,16 @@ This file contains...
             logger.info("GitHub Copilot ready - uses automatic OAuth2 authentication")
 
             # Initialize GitHub Copilot client
-            model = GitHubCopilotClient()
+            model = get_model_client(GitHubCopilotClient)
             model_kwargs = {
                 "model": request.model or "gpt-4o",
                 "stream": True,
                 "temperature": model_config.get("temperature", 0.7),
                 "max_tokens": model_config.get("max_tokens", 4096)
             }
-
-            api_kwargs = model.convert_inputs_to_api_kwargs(
-                input=prompt,
-                model_kwargs=model_kwargs,
-                model_type=ModelType.LLM
-            )
         else:
             # Initialize Google Generative AI model
+            model_kwargs = None
             model = genai.GenerativeModel(
                 model_name=model_config["model"],
                 generation_config={
@@ -565,407 +598,97 @@ This file contains...
                 }
             )
 
-        # Process the response based on the provider
-        try:
-            if request.provider == "ollama":
-                # Get the response and handle it properly using the previously created api_kwargs
-                response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                # Handle streaming response from Ollama
-                async for chunk in response:
-                    text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                    if text and not text.startswith('model=') and not text.startswith('created_at='):
-                        text = text.replace('<think>', '').replace('</think>', '')
-                        await websocket.send_text(text)
-                # Explicitly close the WebSocket connection after the response is complete
-                await websocket.close()
-            elif request.provider == "openrouter":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making OpenRouter API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from OpenRouter
-                    async for chunk in response:
-                        await websocket.send_text(chunk)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_openrouter:
-                    logger.error(f"Error with OpenRouter API: {str(e_openrouter)}")
-                    error_msg = f"\nError with OpenRouter API: {str(e_openrouter)}\n\nPlease check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            elif request.provider == "openai":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making Openai API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from Openai
-                    async for chunk in response:
-                        choices = getattr(chunk, "choices", [])
-                        if len(choices) > 0:
-                            delta = getattr(choices[0], "delta", None)
-                            if delta is not None:
-                                text = getattr(delta, "content", None)
-                                if text is not None:
-                                    await websocket.send_text(text)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_openai:
-                    logger.error(f"Error with Openai API: {str(e_openai)}")
-                    error_msg = f"\nError with Openai API: {str(e_openai)}\n\nPlease check that you have set the OPENAI_API_KEY environment variable with a valid API key."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            elif request.provider == "azure":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making Azure AI API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from Azure AI
-                    async for chunk in response:
-                        choices = getattr(chunk, "choices", [])
-                        if len(choices) > 0:
-                            delta = getattr(choices[0], "delta", None)
-                            if delta is not None:
-                                text = getattr(delta, "content", None)
-                                if text is not None:
-                                    await websocket.send_text(text)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_azure:
-                    logger.error(f"Error with Azure AI API: {str(e_azure)}")
-                    error_msg = f"\nError with Azure AI API: {str(e_azure)}\n\nPlease check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            elif request.provider == "dashscope":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making DashScope API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from DashScope
-                    async for chunk in response:
-                        choices = getattr(chunk, "choices", [])
-                        if len(choices) > 0:
-                            delta = getattr(choices[0], "delta", None)
-                            if delta is not None:
-                                text = getattr(delta, "content", None)
-                                if text is not None:
-                                    await websocket.send_text(text)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_dashscope:
-                    logger.error(f"Error with DashScope API: {str(e_dashscope)}")
-                    error_msg = f"\nError with DashScope API: {str(e_dashscope)}\n\nPlease check that you have set the DASHSCOPE_API_KEY environment variable with a valid API key."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            elif request.provider == "github_copilot":
+        async def send_completion(stream: StreamBuffer, completion_prompt: str):
+            async for text in stream_completion(request.provider, model, completion_prompt, model_kwargs):
+                stream.append(text)
+
+        async def generate(stream: StreamBuffer):
+            # Runs apart from this connection, so the client can resume the answer after reconnecting
+            try:
                 try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making GitHub Copilot API call")
-                    
-                    # Check if this is a wiki structure request (non-streaming for complete XML)
-                    is_wiki_structure_request = (
-                        "wiki structure" in prompt.lower() or 
-                        "<wiki_structure>" in prompt or 
+                    # GitHub Copilot answers wiki structure requests in one piece so the XML can be repaired
+                    is_wiki_structure_request = request.provider == "github_copilot" and (
+                        "wiki structure" in prompt.lower() or
+                        "<wiki_structure>" in prompt or
                         "analyze this github repository" in prompt.lower() or
                         "create a wiki" in prompt.lower()
                     )
-                    
                     if is_wiki_structure_request:
                         logger.info("Detected wiki structure request - using non-streaming mode for complete XML response")
-                        # For wiki structure requests, use non-streaming to get complete response
-                        # then apply XML enhancement
-                        api_kwargs["stream"] = False
+                        api_kwargs = model.convert_inputs_to_api_kwargs(
+                            input=prompt,
+                            model_kwargs=dict(model_kwargs, stream=False),
+                            model_type=ModelType.LLM
+                        )
                         response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        
-                        # Parse the response using our enhanced parsing that includes XML handling
                         parsed_response = model.parse_chat_completion(response)
-                        
                         if parsed_response.error:
                             logger.error(f"Error parsing GitHub Copilot response: {parsed_response.error}")
-                            await websocket.send_text(f"Error: {parsed_response.error}")
+                            stream.append(f"Error: {parsed_response.error}")
                         else:
-                            # Send the complete enhanced response
-                            logger.info(f"Sending complete response with XML enhancement applied")
-                            await websocket.send_text(parsed_response.data)
+                            stream.append(parsed_response.data)
                     else:
-                        logger.info("Regular chat request - using streaming mode")
-                        # For regular chat, use streaming as before
-                        logger.info(f"Calling GitHub Copilot acall for streaming...")
-                        response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                        logger.info(f"✅ GitHub Copilot acall completed successfully")
-                        
-                        logger.info(f"GitHub Copilot streaming response type: {type(response)}")
-                        logger.info(f"Response object: {response}")
-                        
-                        # Track streaming progress
-                        chunk_count = 0
-                        content_chunks = []
-                        
-                        logger.info(f"Starting to iterate over streaming response...")
-                        
-                        # Handle streaming response from GitHub Copilot
-                        try:
-                            logger.info(f"About to start async iteration...")
-                            async for chunk in response:
-                                chunk_count += 1
-                                logger.info(f"Received chunk {chunk_count}: {type(chunk)}")
-                                
-                                # For GitHub Copilot, the streaming response comes from _handle_streaming_response
-                                # which yields content directly
-                                if isinstance(chunk, str):
-                                    # Direct content from our _handle_streaming_response method
-                                    logger.info(f"Direct content chunk {chunk_count}: {chunk[:100]}{'...' if len(chunk) > 100 else ''}")
-                                    content_chunks.append(chunk)
-                                    await websocket.send_text(chunk)
-                                else:
-                                    # Standard streaming chunk format
-                                    choices = getattr(chunk, "choices", [])
-                                    if len(choices) > 0:
-                                        delta = getattr(choices[0], "delta", None)
-                                        if delta is not None:
-                                            text = getattr(delta, "content", None)
-                                            if text is not None:
-                                                logger.info(f"Delta content chunk {chunk_count}: {text[:100]}{'...' if len(text) > 100 else ''}")
-                                                content_chunks.append(text)
-                                                await websocket.send_text(text)
-                                            else:
-                                                logger.info(f"Chunk {chunk_count} has no content in delta")
-                                        else:
-                                            logger.info(f"Chunk {chunk_count} has no delta")
-                                    else:
-                                        logger.info(f"Chunk {chunk_count} has no choices")
-                        except Exception as streaming_error:
-                            logger.error(f"❌ CRITICAL: Error during GitHub Copilot streaming: {streaming_error}")
-                            logger.error(f"   Stream response type: {type(response)}")
-                            logger.error(f"   Response object: {response}")
-                            logger.error(f"   Chunks received before error: {chunk_count}")
-                            import traceback
-                            logger.error(f"   Full traceback: {traceback.format_exc()}")
-                            
-                            # Try to send error to frontend
-                            try:
-                                await websocket.send_text(f"Streaming error: {str(streaming_error)}")
-                            except:
-                                logger.error("Could not send error to websocket")
-                            
-                            raise
-                        
-                        total_content = ''.join(content_chunks)
-                        logger.info(f"GitHub Copilot streaming completed: {chunk_count} chunks, {len(total_content)} total characters")
-                        
-                        if len(total_content) == 0:
-                            logger.warning("No content received from GitHub Copilot streaming response!")
-                            await websocket.send_text("Warning: No content generated by GitHub Copilot")
-                    
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_github:
-                    logger.error(f"Error with GitHub Copilot API: {str(e_github)}")
-                    error_msg = f"\nError with GitHub Copilot API: {str(e_github)}\n\nGitHub Copilot uses automatic OAuth2 authentication. Please ensure you have access to GitHub Copilot."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            else:
-                # Generate streaming response
-                response = model.generate_content(prompt, stream=True)
-                # Stream the response
-                for chunk in response:
-                    if hasattr(chunk, 'text'):
-                        await websocket.send_text(chunk.text)
-                # Explicitly close the WebSocket connection after the response is complete
-                await websocket.close()
-
-        except Exception as e_outer:
-            logger.error(f"Error in streaming response: {str(e_outer)}")
-            error_message = str(e_outer)
-
-            # Check for token limit errors
-            if "maximum context length" in error_message or "token limit" in error_message or "too many tokens" in error_message:
-                # If we hit a token limit error, try again without context
-                logger.warning("Token limit exceeded, retrying without context")
-                try:
-                    # Create a simplified prompt without context
-                    simplified_prompt = f"/no_think {system_prompt}\n\n"
-                    if conversation_history:
-                        simplified_prompt += f"<conversation_history>\n{conversation_history}</conversation_history>\n\n"
+                        await send_completion(stream, prompt)
 
-                    # Include file content in the fallback prompt if it was retrieved
-                    if request.filePath and file_content:
-                        simplified_prompt += f"<currentFileContent path=\"{request.filePath}\">\n{file_content}\n</currentFileContent>\n\n"
+                except Exception as e_outer:
+                    logger.error(f"Error in streaming response: {str(e_outer)}")
 
-                    simplified_prompt += "<note>Answering without retrieval augmentation due to input size constraints.</note>\n\n"
-                    simplified_prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
+                    # Check for token limit errors
+                    if is_token_limit_error(e_outer):
+                        # If we hit a token limit error, try again without context
+                        logger.warning("Token limit exceeded, retrying without context")
+                        try:
+                            # Create a simplified prompt without context
+                            simplified_prompt = f"/no_think {system_prompt}\n\n"
+                            if conversation_history:
+                                simplified_prompt += f"<conversation_history>\n{conversation_history}</conversation_history>\n\n"
 
-                    if request.provider == "ollama":
-                        simplified_prompt += " /no_think"
+                            # Include file content in the fallback prompt if it was retrieved
+                            if request.filePath and file_content:
+                                simplified_prompt += f"<currentFileContent path=\"{request.filePath}\">\n{file_content}\n</currentFileContent>\n\n"
 
-                        # Create new api_kwargs with the simplified prompt
-                        fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                            input=simplified_prompt,
-                            model_kwargs=model_kwargs,
-                            model_type=ModelType.LLM
-                        )
+                            simplified_prompt += "<note>Answering without retrieval augmentation due to input size constraints.</note>\n\n"
+                            simplified_prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
 
-                        # Get the response using the simplified prompt
-                        fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
+                            if request.provider == "ollama":
+                                simplified_prompt += " /no_think"
 
-                        # Handle streaming fallback_response from Ollama
-                        async for chunk in fallback_response:
-                            text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                            if text and not text.startswith('model=') and not text.startswith('created_at='):
-                                text = text.replace('<think>', '').replace('</think>', '')
-                                await websocket.send_text(text)
-                    elif request.provider == "openrouter":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback OpenRouter API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback_response from OpenRouter
-                            async for chunk in fallback_response:
-                                await websocket.send_text(chunk)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with OpenRouter API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with OpenRouter API fallback: {str(e_fallback)}\n\nPlease check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."
-                            await websocket.send_text(error_msg)
-                    elif request.provider == "openai":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback Openai API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback_response from Openai
-                            async for chunk in fallback_response:
-                                text = chunk if isinstance(chunk, str) else getattr(chunk, 'text', str(chunk))
-                                await websocket.send_text(text)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with Openai API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with Openai API fallback: {str(e_fallback)}\n\nPlease check that you have set the OPENAI_API_KEY environment variable with a valid API key."
-                            await websocket.send_text(error_msg)
-                    elif request.provider == "azure":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback Azure AI API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback response from Azure AI
-                            async for chunk in fallback_response:
-                                choices = getattr(chunk, "choices", [])
-                                if len(choices) > 0:
-                                    delta = getattr(choices[0], "delta", None)
-                                    if delta is not None:
-                                        text = getattr(delta, "content", None)
-                                        if text is not None:
-                                            await websocket.send_text(text)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with Azure AI API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with Azure AI API fallback: {str(e_fallback)}\n\nPlease check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."
-                            await websocket.send_text(error_msg)
-                    elif request.provider == "dashscope":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback DashScope API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback response from DashScope
-                            async for chunk in fallback_response:
-                                choices = getattr(chunk, "choices", [])
-                                if len(choices) > 0:
-                                    delta = getattr(choices[0], "delta", None)
-                                    if delta is not None:
-                                        text = getattr(delta, "content", None)
-                                        if text is not None:
-                                            await websocket.send_text(text)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with DashScope API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with DashScope API fallback: {str(e_fallback)}\n\nPlease check that you have set the DASHSCOPE_API_KEY environment variable with a valid API key."
-                            await websocket.send_text(error_msg)
-                    elif request.provider == "github_copilot":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback GitHub Copilot API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback response from GitHub Copilot
-                            async for chunk in fallback_response:
-                                choices = getattr(chunk, "choices", [])
-                                if len(choices) > 0:
-                                    delta = getattr(choices[0], "delta", None)
-                                    if delta is not None:
-                                        text = getattr(delta, "content", None)
-                                        if text is not None:
-                                            await websocket.send_text(text)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with GitHub Copilot API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with GitHub Copilot API fallback: {str(e_fallback)}\n\nGitHub Copilot uses automatic OAuth2 authentication. Please ensure you have access to GitHub Copilot."
-                            await websocket.send_text(error_msg)
+                            await send_completion(stream, simplified_prompt)
+                        except Exception as e2:
+                            logger.error(f"Error in fallback streaming response: {str(e2)}")
+                            stream.append(f"\nI apologize, but your request is too large for me to process. Please try a shorter query or break it into smaller parts.")
                     else:
-                        # Initialize Google Generative AI model
-                        model_config = get_model_config(request.provider, request.model)
-                        fallback_model = genai.GenerativeModel(
-                            model_name=model_config["model"],
-                            generation_config={
-                                "temperature": model_config["model_kwargs"].get("temperature", 0.7),
-                                "top_p": model_config["model_kwargs"].get("top_p", 0.8),
-                                "top_k": model_config["model_kwargs"].get("top_k", 40)
-                            }
-                        )
-
-                        # Get streaming response using simplified prompt
-                        fallback_response = fallback_model.generate_content(simplified_prompt, stream=True)
-                        # Stream the fallback response
-                        for chunk in fallback_response:
-                            if hasattr(chunk, 'text'):
-                                await websocket.send_text(chunk.text)
-                except Exception as e2:
-                    logger.error(f"Error in fallback streaming response: {str(e2)}")
-                    await websocket.send_text(f"\nI apologize, but your request is too large for me to process. Please try a shorter query or break it into smaller parts.")
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            else:
-                # For other errors, return the error message
-                await websocket.send_text(f"\nError: {error_message}")
-                # Close the WebSocket connection after sending the error message
-                await websocket.close()
-
+                        # For other errors, return the error message
+                        stream.append(provider_error_message(request.provider, e_outer))
+            finally:
+                generation_ticket.release()
+                if request.session_id:
+                    # Keep the exchange server-side so the client can send only its next message
+                    try:
+                        await run_io(get_session_store().append_turn, request.session_id, user_message, stream.text)
+                    except Exception as e:
+                        logger.error(f"Could not save turn of session {request.session_id}: {str(e)}")
+
+        # The generation task releases the admission slot when the answer is complete
+        generation_ticket, ticket = ticket, None
+        # With several workers a resume could reach one without the buffer, so no id is sent
+        resumable = request.resumable and resumable_streams_enabled()
+        stream = get_stream_registry().start(generate, resumable=resumable)
+        if resumable:
+            await websocket.send_text(stream_event(stream.stream_id))
+        try:
+            await relay_stream(stream, websocket)
+        finally:
+            # Without its id nobody can resume the answer, so it ends with the connection
+            if not resumable:
+                stream.cancel()
+        # Explicitly close the WebSocket connection after the response is complete
+        await websocket.close()
+
+    except asyncio.CancelledError as e:
+        if not is_own_cancellation(e, cancel_token):
+            raise
+        logger.info("WebSocket request cancelled after the client disconnected")
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
     except Exception as e:
@@ -975,3 +698,11 @@ This file contains...
             await websocket.close()
         except:
             pass
+    finally:
+        if ticket is not None:
+            ticket.release()
+        # Retrieval is done; the cached retriever may be closed once evicted
+        if request_rag is not None:
+            request_rag.close()
+        if disconnect_watcher is not None:
+            disconnect_watcher.cancel()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control of chat requests.
+"""
+import sys
+import asyncio
+import unittest
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Tests for TokenBucket."""
+
+    def test_refills_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(600, clock=clock)  # 10 tokens per second
+        bucket.adjust(600)
+        self.assertAlmostEqual(bucket.wait_time(100), 10.0)
+        clock.now = 5.0
+        self.assertAlmostEqual(bucket.available, 50.0)
+        clock.now = 1000.0
+        self.assertEqual(bucket.available, 600.0)
+
+    def test_refund_is_capped(self):
+        bucket = TokenBucket(600, clock=FakeClock())
+        bucket.adjust(-100)
+        self.assertEqual(bucket.available, 600.0)
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Tests for AdmissionController."""
+
+    def test_concurrency_limit_and_fifo_order(self):
+        controller = AdmissionController(default_limits={"max_concurrent": 2})
+        order, peak, active = [], [0], [0]
+
+        async def request(i):
+            async with await controller.admit("openai", 10):
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                order.append(i)
+                await asyncio.sleep(0.01)
+                active[0] -= 1
+
+        async def main():
+            await asyncio.gather(*(request(i) for i in range(6)))
+        asyncio.run(main())
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(order, list(range(6)))
+        self.assertEqual(controller.stats()["providers"]["openai"]["admitted"], 6)
+
+    def test_providers_are_limited_separately(self):
+        controller = AdmissionController(default_limits={"max_concurrent": 1},
+                                         provider_limits={"ollama": {"max_concurrent": 3}})
+
+        async def main():
+            tickets = [await controller.admit("ollama", 0) for _ in range(3)]
+            tickets.append(await controller.admit("openai", 0))
+            return controller.stats()["providers"]
+        providers = asyncio.run(main())
+        self.assertEqual(providers["ollama"]["active"], 3)
+        self.assertEqual(providers["openai"]["max_concurrent"], 1)
+
+    def test_full_queue_rejects_at_once(self):
+        controller = AdmissionController(max_queue=1, default_limits={"max_concurrent": 1})
+
+        async def main():
+            held = await controller.admit("openai", 0)
+            waiting = asyncio.ensure_future(controller.admit("openai", 0))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await controller.admit("openai", 0)
+            held.release()
+            (await waiting).release()
+            return rejected.exception
+        error = asyncio.run(main())
+        self.assertGreater(error.retry_after, 0)
+        self.assertEqual(controller.stats()["providers"]["openai"]["rejected"], 1)
+
+    def test_queue_positions_are_reported(self):
+        controller = AdmissionController(default_limits={"max_concurrent": 1})
+        positions = []
+
+        async def on_position(position):
+            positions.append(position)
+
+        async def main():
+            held = await controller.admit("openai", 0)
+            ahead = asyncio.ensure_future(controller.admit("openai", 0))
+            await asyncio.sleep(0)
+            behind = asyncio.ensure_future(controller.admit("openai", 0, on_position=on_position))
+            await asyncio.sleep(0.01)
+            held.release()
+            (await ahead).release()
+            (await behind).release()
+        asyncio.run(main())
+        self.assertEqual(positions[0], 2)
+
+    def test_token_budget_delays_admission(self):
+        controller = AdmissionController(default_limits={"max_concurrent": 10, "tokens_per_minute": 600})
+
+        async def main():
+            await controller.admit("openai", 600)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await controller.admit("openai", 2)  # refills at 10 tokens per second
+            return loop.time() - start
+        waited = asyncio.run(main())
+        self.assertGreater(waited, 0.1)
+        self.assertLess(waited, 1.0)
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        controller = AdmissionController(default_limits={"max_concurrent": 1})
+
+        async def main():
+            held = await controller.admit("openai", 0)
+            waiting = asyncio.ensure_future(controller.admit("openai", 0))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            await asyncio.sleep(0)
+            held.release()
+            return controller.stats()
+        stats = asyncio.run(main())
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["providers"]["openai"]["queued"], 0)
+        self.assertEqual(stats["providers"]["openai"]["active"], 0)
+
+    def test_queue_timeout(self):
+        controller = AdmissionController(queue_timeout=0.05, default_limits={"max_concurrent": 1})
+
+        async def main():
+            await controller.admit("openai", 0)
+            await controller.admit("openai", 0)
+        with self.assertRaises(AdmissionRejected):
+            asyncio.run(main())
+        self.assertEqual(controller.stats()["queued"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
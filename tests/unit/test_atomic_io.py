@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for atomic writes and cross-process file locks.
+"""
+import sys
+import os
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.atomic_io import atomic_write, file_lock, make_temp_dir, replace_directory
+
+
+def _append_under_lock(path, worker_id, rounds):
+    """Read-modify-write a shared JSON list; only correct if writers serialize."""
+    for _ in range(rounds):
+        with file_lock(path):
+            with open(path) as f:
+                items = json.load(f)
+            items.append(worker_id)
+            time.sleep(0.001)
+            with atomic_write(path) as f:
+                json.dump(items, f)
+
+
+class TestAtomicWrite(unittest.TestCase):
+    """Tests for atomic_write and replace_directory."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "cache.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_replaces_file(self):
+        with atomic_write(self.path) as f:
+            f.write("first")
+        with atomic_write(self.path) as f:
+            f.write("second")
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "second")
+
+    def test_failed_write_keeps_old_content(self):
+        """A crash mid-write leaves the previous file intact and no temp files behind."""
+        with atomic_write(self.path) as f:
+            f.write("good")
+        with self.assertRaises(RuntimeError):
+            with atomic_write(self.path) as f:
+                f.write("partial")
+                raise RuntimeError("boom")
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "good")
+        self.assertEqual(os.listdir(self.tmp_dir), ["cache.json"])
+
+    def test_replace_directory(self):
+        target = os.path.join(self.tmp_dir, "store")
+        os.makedirs(target)
+        with open(os.path.join(target, "old"), "w") as f:
+            f.write("old")
+        new_dir = make_temp_dir(target)
+        with open(os.path.join(new_dir, "new"), "w") as f:
+            f.write("new")
+        replace_directory(new_dir, target)
+        self.assertEqual(os.listdir(target), ["new"])
+        self.assertEqual(os.listdir(self.tmp_dir), ["store"])
+
+
+class TestFileLock(unittest.TestCase):
+    """Tests for file_lock."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "shared.json")
+        with open(self.path, "w") as f:
+            json.dump([], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_non_blocking_raises_when_held(self):
+        with file_lock(self.path):
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(1) as pool:
+                self.assertFalse(pool.apply(_try_lock, (self.path,)))
+        self.assertTrue(_try_lock(self.path))
+
+    def test_concurrent_writers_serialize(self):
+        """No update is lost when several processes write the same file."""
+        ctx = multiprocessing.get_context("spawn")
+        workers = [ctx.Process(target=_append_under_lock, args=(self.path, i, 10)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)), 40)
+
+
+def _try_lock(path):
+    try:
+        with file_lock(path, blocking=False):
+            return True
+    except BlockingIOError:
+        return False
+
+
+if __name__ == "__main__":
+    unittest.main()
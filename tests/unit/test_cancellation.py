@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Tests for cancelling request work when the client disconnects.
+"""
+import sys
+import asyncio
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from starlette.websockets import WebSocketState
+
+from api.cancellation import (
+    CancelToken,
+    RequestCancelled,
+    cancellation_stats,
+    check_cancelled,
+    is_own_cancellation,
+    set_cancel_token,
+    watch_websocket_disconnect,
+)
+from api.data_pipeline import CancellableBatchEmbedder
+from api.executors import BoundedExecutor
+from api.streaming import stream_completion
+
+
+class FakeWebSocket:
+    """Websocket whose client disconnects after `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.application_state = WebSocketState.CONNECTED
+
+    async def receive(self):
+        await asyncio.sleep(self.delay)
+        return {"type": "websocket.disconnect", "code": 1001}
+
+
+class TestCancelToken(unittest.TestCase):
+    """Tests for the token and checkpoints."""
+
+    def test_checkpoint_outside_a_request_does_nothing(self):
+        set_cancel_token(None)
+        check_cancelled("embedding")
+
+    def test_checkpoint_raises_and_counts(self):
+        token = CancelToken()
+        set_cancel_token(token)
+        try:
+            check_cancelled("retrieval")
+            token.cancel()
+            before = cancellation_stats()["retrieval"]
+            with self.assertRaises(RequestCancelled):
+                check_cancelled("retrieval")
+            self.assertEqual(cancellation_stats()["retrieval"], before + 1)
+        finally:
+            set_cancel_token(None)
+
+
+class TestExecutorCancellation(unittest.TestCase):
+    """Tests for cancellation of executor work."""
+
+    def setUp(self):
+        self.executor = BoundedExecutor("test", max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_token_reaches_worker_thread(self):
+        token = CancelToken()
+        token.cancel()
+
+        async def main():
+            set_cancel_token(token)
+            await self.executor.run(check_cancelled)
+        with self.assertRaises(RequestCancelled):
+            asyncio.run(main())
+
+    def test_queued_work_is_dropped(self):
+        release = threading.Event()
+        ran = []
+
+        async def main():
+            blocker = asyncio.ensure_future(self.executor.run(release.wait))
+            queued = asyncio.ensure_future(self.executor.run(ran.append, 1))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            await blocker
+        before = cancellation_stats()["queued"]
+        asyncio.run(main())
+        self.assertEqual(ran, [])
+        stats = self.executor.stats()
+        self.assertEqual((stats["queued"], stats["cancelled"], stats["completed"]), (0, 1, 1))
+        self.assertEqual(cancellation_stats()["queued"], before + 1)
+
+
+class TestEmbeddingCancellation(unittest.TestCase):
+    """Tests for stopping indexing between embedding batches."""
+
+    def test_stops_before_next_batch(self):
+        token = CancelToken()
+        calls = []
+
+        class FakeEmbedder:
+            def call(self, input, model_kwargs):
+                calls.append(input)
+                token.cancel()
+                return SimpleNamespace(data=[])
+
+        batch_embedder = CancellableBatchEmbedder(embedder=FakeEmbedder(), batch_size=2)
+        set_cancel_token(token)
+        try:
+            with self.assertRaises(RequestCancelled):
+                batch_embedder.call(["a", "b", "c", "d", "e"])
+        finally:
+            set_cancel_token(None)
+        self.assertEqual(calls, [["a", "b"]])
+
+
+class TestStreamCancellation(unittest.TestCase):
+    """Tests for closing the provider stream."""
+
+    def test_abandoned_stream_closes_upstream(self):
+        closed = []
+
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(0.001)
+                    yield "x"
+            finally:
+                closed.append(True)
+
+        class FakeClient:
+            def convert_inputs_to_api_kwargs(self, input, model_kwargs, model_type):
+                return {}
+
+            async def acall(self, api_kwargs, model_type):
+                return endless()
+
+        async def main():
+            stream = stream_completion("openai", FakeClient(), "prompt", {})
+            await stream.__anext__()
+            await stream.aclose()
+            await asyncio.sleep(0.05)
+        before = cancellation_stats()["streams"]
+        asyncio.run(main())
+        self.assertEqual(closed, [True])
+        self.assertEqual(cancellation_stats()["streams"], before + 1)
+
+
+class TestDisconnectWatcher(unittest.TestCase):
+    """Tests for the websocket disconnect watcher."""
+
+    def test_disconnect_cancels_handler(self):
+        token = CancelToken()
+
+        async def handler():
+            watcher = watch_websocket_disconnect(FakeWebSocket(0.02), token)
+            try:
+                await asyncio.sleep(5)
+                return "finished"
+            except asyncio.CancelledError as e:
+                if not is_own_cancellation(e, token):
+                    raise
+                return "cancelled"
+            finally:
+                watcher.cancel()
+        self.assertEqual(asyncio.run(handler()), "cancelled")
+        self.assertTrue(token.cancelled)
+
+    def test_close_by_server_is_not_a_cancellation(self):
+        token = CancelToken()
+        websocket = FakeWebSocket(0.01)
+        websocket.application_state = WebSocketState.DISCONNECTED
+
+        async def handler():
+            watcher = watch_websocket_disconnect(websocket, token)
+            await asyncio.sleep(0.05)
+            watcher.cancel()
+            return "finished"
+        self.assertEqual(asyncio.run(handler()), "finished")
+        self.assertFalse(token.cancelled)
+
+
+if __name__ == "__main__":
+    unittest.main()
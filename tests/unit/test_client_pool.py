@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for pooled model clients and cached Ollama model checks.
+"""
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api import client_pool
+from api import ollama_patch
+
+
+class FakeClient:
+    """Stand-in for a provider client that counts constructions."""
+    instances = 0
+
+    def __init__(self, **kwargs):
+        FakeClient.instances += 1
+        self.kwargs = kwargs
+
+
+class TestClientPool(unittest.TestCase):
+    """Tests for the client pool."""
+
+    def setUp(self):
+        client_pool.clear_client_pool()
+        FakeClient.instances = 0
+
+    def tearDown(self):
+        client_pool.clear_client_pool()
+
+    def test_clients_are_reused(self):
+        first = client_pool.get_model_client(FakeClient)
+        second = client_pool.get_model_client(FakeClient)
+        self.assertIs(first, second)
+        self.assertEqual(FakeClient.instances, 1)
+
+    def test_constructor_arguments_get_separate_instances(self):
+        a = client_pool.get_model_client(FakeClient, base_url="https://a")
+        b = client_pool.get_model_client(FakeClient, base_url="https://b")
+        self.assertIsNot(a, b)
+        self.assertIs(a, client_pool.get_model_client(FakeClient, base_url="https://a"))
+
+    def test_embedder_is_rebuilt_when_config_changes(self):
+        config = {"model_client": FakeClient, "model_kwargs": {"model": "m1"}}
+        with mock.patch("api.client_pool.get_embedder_config_by_type", return_value=config), \
+                mock.patch("api.client_pool.get_embedder", side_effect=lambda embedder_type: object()) as build:
+            first = client_pool.get_pooled_embedder("openai")
+            self.assertIs(first, client_pool.get_pooled_embedder("openai"))
+            config["model_kwargs"] = {"model": "m2"}
+            self.assertIsNot(first, client_pool.get_pooled_embedder("openai"))
+        self.assertEqual(build.call_count, 2)
+
+    def test_generator_pooled_per_provider_and_model(self):
+        factory = mock.Mock(side_effect=lambda: object())
+        a = client_pool.get_pooled_generator("openai", "gpt-4o", factory)
+        self.assertIs(a, client_pool.get_pooled_generator("openai", "gpt-4o", factory))
+        self.assertIsNot(a, client_pool.get_pooled_generator("openai", "gpt-4o-mini", factory))
+        self.assertEqual(factory.call_count, 2)
+
+    def test_generator_factory_can_use_the_pool(self):
+        generator = client_pool.get_pooled_generator(
+            "openai", "gpt-4o", lambda: SimpleNamespace(client=client_pool.get_model_client(FakeClient)))
+        self.assertIs(generator.client, client_pool.get_model_client(FakeClient))
+
+
+class TestOllamaModelCheck(unittest.TestCase):
+    """Tests for the cached Ollama model availability check."""
+
+    def setUp(self):
+        ollama_patch._available_models.clear()
+
+    def _response(self, names):
+        return SimpleNamespace(status_code=200, json=lambda: {"models": [{"name": n} for n in names]})
+
+    def test_available_model_is_cached(self):
+        with mock.patch("requests.Session.get", return_value=self._response(["nomic-embed-text:latest"])) as get:
+            self.assertTrue(ollama_patch.check_ollama_model_exists("nomic-embed-text", "http://ollama:11434"))
+            self.assertTrue(ollama_patch.check_ollama_model_exists("nomic-embed-text", "http://ollama:11434"))
+        self.assertEqual(get.call_count, 1)
+
+    def test_missing_model_is_checked_again(self):
+        with mock.patch("requests.Session.get", return_value=self._response([])) as get:
+            self.assertFalse(ollama_patch.check_ollama_model_exists("qwen3", "http://ollama:11434"))
+            self.assertFalse(ollama_patch.check_ollama_model_exists("qwen3", "http://ollama:11434"))
+        self.assertEqual(get.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budgeted context assembly.
+"""
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+
+from api.config import get_context_token_budget
+from api.context_builder import build_context, merge_chunks
+from api.data_pipeline import count_tokens
+from api.prompt_budget import TRUNCATION_MARKER
+
+FILE_TEXT = " ".join(f"word{i}" for i in range(200))
+
+
+def _chunk(start_word, end_word, file_path="a.py", with_offsets=True):
+    """A chunk covering words [start_word, end_word) of FILE_TEXT, like TextSplitter output."""
+    words = FILE_TEXT.split(" ")
+    prefix = " ".join(words[:start_word])
+    char_start = len(prefix) + 1 if start_word else 0
+    text = " ".join(words[start_word:end_word])
+    meta = {"file_path": file_path}
+    if with_offsets:
+        meta.update({"char_start": char_start, "char_end": char_start + len(text)})
+    return Document(text=text, meta_data=meta)
+
+
+def _words(start, end):
+    return " ".join(f"word{i}" for i in range(start, end))
+
+
+class TestMergeChunks(unittest.TestCase):
+    """Tests for merge_chunks."""
+
+    def test_overlapping_chunks_are_merged_by_offset(self):
+        spans = merge_chunks([_chunk(40, 100), _chunk(0, 50), _chunk(150, 200)])
+        self.assertEqual(spans, [_words(0, 100), _words(150, 200)])
+
+    def test_duplicate_and_contained_chunks(self):
+        spans = merge_chunks([_chunk(0, 50), _chunk(0, 50), _chunk(10, 20)])
+        self.assertEqual(spans, [_words(0, 50)])
+
+    def test_chunks_without_offsets_merge_on_text_overlap(self):
+        docs = [_chunk(0, 50, with_offsets=False), _chunk(40, 90, with_offsets=False),
+                _chunk(10, 20, with_offsets=False)]
+        self.assertEqual(merge_chunks(docs), [_words(0, 90)])
+
+
+class TestBuildContext(unittest.TestCase):
+    """Tests for build_context."""
+
+    def test_format_groups_by_file_in_rank_order(self):
+        docs = [_chunk(0, 10, "b.py"), _chunk(0, 10, "a.py"), _chunk(5, 15, "b.py")]
+        context = build_context(docs)
+        self.assertTrue(context.startswith("\n\n" + "-" * 10 + "## File Path: b.py\n\n" + _words(0, 15)))
+        self.assertIn("## File Path: a.py\n\n" + _words(0, 10), context)
+
+    def test_budget_keeps_best_ranked_files(self):
+        docs = [_chunk(0, 60, "first.py"), _chunk(0, 400, "second.py"), _chunk(0, 30, "third.py")]
+        max_tokens = count_tokens(build_context(docs[:1])) + 150
+        context = build_context(docs, max_tokens=max_tokens)
+        self.assertIn("## File Path: first.py\n\n" + _words(0, 60), context)
+        # The span that reaches the budget is cut rather than dropped for a lower-ranked file
+        self.assertIn("## File Path: second.py", context)
+        self.assertTrue(context.endswith(TRUNCATION_MARKER))
+        self.assertNotIn("third.py", context)
+        self.assertLessEqual(count_tokens(context), max_tokens)
+
+    def test_separators_count_against_the_budget(self):
+        docs = [_chunk(0, 20, f"file{i}.py") for i in range(5)] + [_chunk(50, 60, "file0.py")]
+        full = count_tokens(build_context(docs))
+        for max_tokens in range(full - 100, full + 1, 7):
+            self.assertLessEqual(count_tokens(build_context(docs, max_tokens=max_tokens)), max_tokens)
+
+    def test_empty(self):
+        self.assertEqual(build_context([]), "")
+
+
+class TestContextTokenBudget(unittest.TestCase):
+    """Tests for get_context_token_budget."""
+
+    def test_model_then_provider_then_default(self):
+        configs = {
+            "default_provider": "p",
+            "context_token_budget": 1000,
+            "providers": {
+                "p": {"default_model": "m1", "context_token_budget": 2000, "context_token_budgets": {"m2": 3000}},
+                "q": {"default_model": "x"},
+            },
+        }
+        with mock.patch("api.config.configs", configs):
+            self.assertEqual(get_context_token_budget("p", "m2"), 3000)
+            self.assertEqual(get_context_token_budget("p", "m1"), 2000)
+            self.assertEqual(get_context_token_budget("q", None), 1000)
+            self.assertEqual(get_context_token_budget(None, None), 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded executors and the event loop lag monitor.
+"""
+import sys
+import asyncio
+import threading
+import time
+import unittest
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.executors import BoundedExecutor, LoopLagMonitor
+
+
+class TestBoundedExecutor(unittest.TestCase):
+    """Tests for BoundedExecutor."""
+
+    def setUp(self):
+        self.executor = BoundedExecutor("test", max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_runs_off_the_loop_thread(self):
+        async def main():
+            return await self.executor.run(lambda: threading.current_thread().name)
+        self.assertTrue(asyncio.run(main()).startswith("deepwiki-test"))
+
+    def test_blocking_call_does_not_stall_other_tasks(self):
+        async def main():
+            ticks = []
+
+            async def heartbeat():
+                for _ in range(5):
+                    ticks.append(time.perf_counter())
+                    await asyncio.sleep(0.02)
+
+            await asyncio.gather(self.executor.run(time.sleep, 0.2), heartbeat())
+            return ticks
+        ticks = asyncio.run(main())
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.15)
+
+    def test_concurrency_is_bounded_and_counted(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+        async def main():
+            await asyncio.gather(*(self.executor.run(work) for _ in range(6)))
+        asyncio.run(main())
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(self.executor.stats(), {"max_workers": 2, "queued": 0, "running": 0, "completed": 6, "cancelled": 0})
+
+    def test_exceptions_propagate(self):
+        async def main():
+            await self.executor.run(int, "not a number")
+        with self.assertRaises(ValueError):
+            asyncio.run(main())
+        self.assertEqual(self.executor.stats()["running"], 0)
+
+
+class TestLoopLagMonitor(unittest.TestCase):
+    """Tests for LoopLagMonitor."""
+
+    def test_blocking_the_loop_is_measured(self):
+        monitor = LoopLagMonitor(interval=0.01)
+
+        async def main():
+            monitor.start()
+            await asyncio.sleep(0.05)
+            time.sleep(0.15)  # block the loop
+            await asyncio.sleep(0.05)
+            monitor.stop()
+        asyncio.run(main())
+        stats = monitor.stats()
+        self.assertGreater(stats["samples"], 2)
+        self.assertGreater(stats["max_ms"], 100)
+        self.assertLess(stats["p50_ms"], 100)
+
+    def test_empty_stats(self):
+        self.assertEqual(LoopLagMonitor().stats()["samples"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared HTTP connection pools.
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import api.http_pool
+from api.http_pool import HttpPools, HttpPoolSettings, get_async_http_client, loop_async_client
+from api.openai_client import OpenAIClient
+
+
+class TestHttpPoolSettings(unittest.TestCase):
+    """Tests for reading pool settings from the environment."""
+
+    def test_environment_overrides(self):
+        env = {
+            "DEEPWIKI_HTTP_MAX_CONNECTIONS": "10",
+            "DEEPWIKI_HTTP_MAX_KEEPALIVE": "50",
+            "DEEPWIKI_HTTP_CONNECT_TIMEOUT": "2.5",
+            "DEEPWIKI_HTTP2": "false",
+        }
+        with mock.patch.dict("os.environ", env):
+            settings = HttpPoolSettings()
+        self.assertEqual(settings.max_connections, 10)
+        # Never more idle connections than connections
+        self.assertEqual(settings.max_keepalive, 10)
+        self.assertEqual(settings.connect_timeout, 2.5)
+        self.assertFalse(settings.http2)
+
+    def test_invalid_value_uses_default(self):
+        with mock.patch.dict("os.environ", {"DEEPWIKI_HTTP_MAX_CONNECTIONS": "many"}):
+            settings = HttpPoolSettings()
+        self.assertEqual(settings.max_connections, api.http_pool.DEFAULT_MAX_CONNECTIONS)
+
+
+class TestHttpPools(unittest.IsolatedAsyncioTestCase):
+    """Tests for sharing and closing pooled clients."""
+
+    async def test_clients_are_shared_until_closed(self):
+        pools = HttpPools()
+        sync_client = pools.sync_client()
+        async_client = pools.async_client()
+        session = pools.requests_session()
+        self.assertIs(pools.sync_client(), sync_client)
+        self.assertIs(pools.async_client(), async_client)
+        self.assertIs(pools.requests_session(), session)
+
+        await pools.close()
+        self.assertTrue(sync_client.is_closed)
+        self.assertTrue(async_client.is_closed)
+        self.assertIsNot(pools.sync_client(), sync_client)
+        self.assertIsNot(pools.async_client(), async_client)
+        await pools.close()
+
+    async def test_aiohttp_session_is_shared(self):
+        pools = HttpPools()
+        session = pools.aiohttp_session()
+        self.assertIs(pools.aiohttp_session(), session)
+        await pools.close()
+        self.assertTrue(session.closed)
+
+    def test_async_clients_are_per_event_loop(self):
+        pools = HttpPools()
+
+        async def get_client():
+            return pools.async_client()
+
+        first = asyncio.run(get_client())
+        second = asyncio.run(get_client())
+        self.assertIsNot(first, second)
+
+    async def test_requests_session_has_default_timeout(self):
+        pools = HttpPools()
+        adapter = pools.requests_session().get_adapter("https://api.github.com")
+        self.assertEqual(adapter.timeout, (pools.settings.connect_timeout, pools.settings.read_timeout))
+        await pools.close()
+
+
+class TestProviderClients(unittest.IsolatedAsyncioTestCase):
+    """Tests that provider clients draw from the shared pools."""
+
+    async def test_openai_client_uses_shared_pools(self):
+        first = OpenAIClient(api_key="test-key")
+        second = OpenAIClient(api_key="test-key")
+        self.assertIs(first.sync_client._client, second.sync_client._client)
+        self.assertIs(first.init_async_client()._client, second.init_async_client()._client)
+
+
+    def test_async_sdk_client_follows_the_event_loop(self):
+        client = OpenAIClient(api_key="test-key")
+
+        async def sdk_client():
+            client.async_client = loop_async_client(client.async_client, client.init_async_client)
+            self.assertIs(loop_async_client(client.async_client, client.init_async_client), client.async_client)
+            self.assertIs(client.async_client._client, get_async_http_client())
+            return client.async_client
+
+        first = asyncio.run(sdk_client())
+        second = asyncio.run(sdk_client())
+        self.assertIsNot(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Tests for embedder-aware index store keys.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+from adalflow.core.db import LocalDB
+
+from api.config import configs
+from api.data_pipeline import DatabaseManager, get_index_fingerprint
+from api.index_store import migrate_pickle_to_index_store
+
+
+class TestIndexFingerprint(unittest.TestCase):
+    """Tests for get_index_fingerprint."""
+
+    def test_stable_for_same_configuration(self):
+        """The same configuration always maps to the same store."""
+        first, key = get_index_fingerprint("openai", excluded_dirs=["b", "a"])
+        second, _ = get_index_fingerprint("openai", excluded_dirs=["a", "b"])
+        self.assertEqual(first, second)
+        self.assertEqual(key["filters"]["excluded_dirs"], ["a", "b"])
+
+    def test_differs_by_embedder_type(self):
+        """Different embedders never share a store."""
+        openai_fp, openai_key = get_index_fingerprint("openai")
+        copilot_fp, copilot_key = get_index_fingerprint("github_copilot")
+        self.assertNotEqual(openai_key["embedder_type"], copilot_key["embedder_type"])
+        self.assertNotEqual(openai_fp, copilot_fp)
+
+    def test_differs_by_filters(self):
+        """Different file filters index different documents."""
+        default_fp, _ = get_index_fingerprint("openai")
+        filtered_fp, _ = get_index_fingerprint("openai", included_dirs=["src"])
+        self.assertNotEqual(default_fp, filtered_fp)
+
+    def test_differs_by_text_splitter(self):
+        """Changing the splitter settings selects a new store."""
+        before, _ = get_index_fingerprint("openai")
+        original = dict(configs["text_splitter"])
+        try:
+            configs["text_splitter"]["chunk_size"] = original.get("chunk_size", 350) + 1
+            after, _ = get_index_fingerprint("openai")
+        finally:
+            configs["text_splitter"].clear()
+            configs["text_splitter"].update(original)
+        self.assertNotEqual(before, after)
+
+
+class TestLegacyMigrationCompatibility(unittest.TestCase):
+    """Legacy pickles are only migrated when their embeddings fit the current embedder."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        source = [Document(text="hello world", meta_data={"file_path": "a.py"})]
+        chunk = Document(text="hello world", vector=[0.1] * 8, parent_doc_id=source[0].id,
+                         meta_data={"file_path": "a.py"}, estimated_num_tokens=2)
+        db = LocalDB()
+        db.load(source)
+        db.transformed_items = {"split_and_embed": [chunk]}
+        self.pickle_path = os.path.join(self.tmp_dir, "legacy.pkl")
+        db.save_state(self.pickle_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_incompatible_pickle_is_not_migrated(self):
+        store = migrate_pickle_to_index_store(self.pickle_path, os.path.join(self.tmp_dir, "s"),
+                                              expected_dimensions=1536)
+        self.assertIsNone(store)
+
+    def test_compatible_pickle_records_fingerprint(self):
+        store = migrate_pickle_to_index_store(self.pickle_path, os.path.join(self.tmp_dir, "s"),
+                                              expected_dimensions=8,
+                                              manifest_extra={"fingerprint": "abc"})
+        try:
+            self.assertEqual(store.fingerprint, "abc")
+            self.assertEqual(len(store), 1)
+        finally:
+            store.close()
+
+
+class TestPrepareDbIndexMigration(unittest.TestCase):
+    """prepare_db_index only migrates a legacy pickle into the store it can vouch for."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        source = [Document(text="hello world", meta_data={"file_path": "a.py"})]
+        chunk = Document(text="hello world", vector=[0.1] * 8, parent_doc_id=source[0].id,
+                         meta_data={"file_path": "a.py"}, estimated_num_tokens=2)
+        db = LocalDB()
+        db.load(source)
+        db.transformed_items = {"split_and_embed": [chunk]}
+        pickle_path = os.path.join(self.tmp_dir, "repo.pkl")
+        db.save_state(pickle_path)
+        self.manager = DatabaseManager()
+        self.manager.repo_paths = {
+            "repo_name": "repo",
+            "save_repo_dir": os.path.join(self.tmp_dir, "repo"),
+            "save_db_file": pickle_path,
+            "save_index_dir": os.path.join(self.tmp_dir, "repo_index"),
+        }
+        # Stand-in for a rebuild, so the tests can tell it apart from a migration
+        self.rebuilt = mock.MagicMock()
+        self.rebuilt.documents.return_value = ["rebuilt"]
+        patches = [
+            # An embedder whose config does not state its dimension, like ollama or google
+            mock.patch("api.data_pipeline.get_index_fingerprint", side_effect=self._fingerprint),
+            mock.patch("api.data_pipeline.read_all_documents", return_value=[]),
+            mock.patch("api.data_pipeline.transform_documents_and_save_to_store", return_value=self.rebuilt),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _fingerprint(*args, **kwargs):
+        fingerprint, key = get_index_fingerprint(*args, **kwargs)
+        key["dimensions"] = None
+        return fingerprint, key
+
+    def tearDown(self):
+        if self.manager.db is not None and self.manager.db is not self.rebuilt:
+            self.manager.db.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_probed_dimension_allows_migration(self):
+        """Without a configured dimension, a matching probe embedding lets the pickle migrate."""
+        with mock.patch("api.data_pipeline.probe_embedding_dimensions", return_value=8) as probe:
+            documents = self.manager.prepare_db_index("openai")
+        probe.assert_called_once_with("openai")
+        self.assertEqual([doc.text for doc in documents], ["hello world"])
+
+    def test_mismatched_probe_rebuilds(self):
+        with mock.patch("api.data_pipeline.probe_embedding_dimensions", return_value=768):
+            documents = self.manager.prepare_db_index("openai")
+        self.assertEqual(documents, ["rebuilt"])
+
+    def test_unknown_dimension_rebuilds(self):
+        """If the embedder cannot be probed the pickle is not trusted."""
+        with mock.patch("api.data_pipeline.probe_embedding_dimensions", return_value=None):
+            documents = self.manager.prepare_db_index("openai")
+        self.assertEqual(documents, ["rebuilt"])
+
+    def test_filtered_store_is_never_migrated(self):
+        """The pickle's filters are unknown, so filtered stores are always rebuilt."""
+        with mock.patch("api.data_pipeline.probe_embedding_dimensions", return_value=8) as probe:
+            documents = self.manager.prepare_db_index("openai", included_dirs=["src"])
+        probe.assert_not_called()
+        self.assertEqual(documents, ["rebuilt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
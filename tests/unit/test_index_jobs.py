@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Tests for index preparation jobs and startup preloading.
+"""
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+
+from api.index_jobs import (
+    JOB_FAILED,
+    JOB_READY,
+    IndexJob,
+    IndexJobManager,
+    preload_recent_indexes,
+    split_filter,
+)
+from api.index_store import write_index_store
+from api.retriever_cache import RetrieverCache
+from api.storage_manager import KIND_INDEX, StorageManager
+
+
+class TestIndexJobs(unittest.IsolatedAsyncioTestCase):
+    """Tests for IndexJobManager."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "index_jobs.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    async def test_job_becomes_ready(self):
+        manager = IndexJobManager(self.db_path)
+        with mock.patch("api.index_jobs.prepare_index", return_value=(12, "/stores/repo")) as prepare:
+            job = await manager.submit("https://github.com/owner/repo", excluded_dirs=["docs"])
+            await asyncio.wait_for(self._finished(manager, job), 5)
+        self.assertEqual(job.status, JOB_READY)
+        self.assertEqual(job.num_chunks, 12)
+        self.assertEqual((await manager.get(job.job_id)).to_dict(), job.to_dict())
+        prepare.assert_called_once_with("https://github.com/owner/repo", "github", None,
+                                        ["docs"], None, None, None)
+
+    async def test_repeated_requests_share_a_running_job(self):
+        manager = IndexJobManager(self.db_path)
+        release = threading.Event()
+        with mock.patch("api.index_jobs.prepare_index",
+                        side_effect=lambda *args: release.wait(5) and (3, "/stores/repo")):
+            first = await manager.submit("https://github.com/owner/repo")
+            second = await manager.submit("https://github.com/owner/repo")
+            other = await manager.submit("https://github.com/owner/repo", included_dirs=["src"])
+            release.set()
+            await asyncio.wait_for(self._finished(manager, first), 5)
+            await asyncio.wait_for(self._finished(manager, other), 5)
+            self.assertIs(first, second)
+            self.assertIsNot(first, other)
+            # A finished job is not reused; the next request prepares again
+            self.assertIsNot(await manager.submit("https://github.com/owner/repo"), first)
+
+    async def test_jobs_are_shared_between_workers(self):
+        """A second manager on the same database stands in for another worker process."""
+        worker_a = IndexJobManager(self.db_path)
+        worker_b = IndexJobManager(self.db_path)
+        worker_b.pid = worker_a.pid + 1
+        release = threading.Event()
+        with mock.patch("api.index_jobs.prepare_index",
+                        side_effect=lambda *args: release.wait(5) and (3, "/stores/repo")) as prepare:
+            job = await worker_a.submit("https://github.com/owner/repo")
+            self.assertEqual((await worker_b.submit("https://github.com/owner/repo")).job_id, job.job_id)
+            self.assertFalse((await worker_b.get(job.job_id)).done)
+            release.set()
+            await asyncio.wait_for(self._finished(worker_a, job), 5)
+        prepare.assert_called_once()
+        polled = await worker_b.get(job.job_id)
+        self.assertEqual(polled.status, JOB_READY)
+        self.assertEqual(polled.store_dir, "/stores/repo")
+        self.assertEqual(worker_b.stats()[JOB_READY], 1)
+
+    async def test_locked_database_does_not_block_the_event_loop(self):
+        """While another worker holds the write lock, submit waits in a thread, not on the loop."""
+        manager = IndexJobManager(self.db_path)
+        blocker = sqlite3.connect(self.db_path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            with mock.patch("api.index_jobs.prepare_index", return_value=(1, "/stores/repo")):
+                submitted = asyncio.ensure_future(manager.submit("https://github.com/owner/repo"))
+                await asyncio.sleep(0.2)
+                self.assertFalse(submitted.done())
+                blocker.execute("COMMIT")
+                job = await asyncio.wait_for(submitted, 5)
+                await asyncio.wait_for(self._finished(manager, job), 5)
+        finally:
+            blocker.close()
+        self.assertEqual(job.status, JOB_READY)
+
+    async def test_job_of_a_stopped_worker_fails(self):
+        worker_a = IndexJobManager(self.db_path)
+        release = threading.Event()
+        with mock.patch("api.index_jobs.prepare_index", side_effect=lambda *args: release.wait(5) and (1, "")):
+            job = await worker_a.submit("https://github.com/owner/repo")
+            worker_b = IndexJobManager(self.db_path)
+            with mock.patch("api.index_jobs._pid_alive", return_value=False):
+                self.assertEqual((await worker_b.get(job.job_id)).status, JOB_FAILED)
+                self.assertNotEqual((await worker_b.submit("https://github.com/owner/repo")).job_id, job.job_id)
+            release.set()
+            await asyncio.wait_for(self._finished(worker_a, job), 5)
+
+    async def test_ready_job_is_loaded_by_the_polled_worker(self):
+        cache = mock.Mock()
+        cache.get.return_value = None
+        job = IndexJob("job", "https://github.com/owner/repo", "github", status=JOB_READY, store_dir="/stores/repo")
+        with mock.patch("api.index_jobs.get_retriever_cache", return_value=cache):
+            IndexJobManager(self.db_path).warm(job)
+            for _ in range(100):
+                if cache.load.called:
+                    break
+                await asyncio.sleep(0.01)
+        cache.load.assert_called_once_with("/stores/repo")
+
+    async def test_failed_job_reports_error(self):
+        manager = IndexJobManager(self.db_path)
+        with mock.patch("api.index_jobs.prepare_index", side_effect=ValueError("clone failed")):
+            job = await manager.submit("https://github.com/owner/repo")
+            await asyncio.wait_for(self._finished(manager, job), 5)
+        self.assertEqual(job.status, JOB_FAILED)
+        self.assertEqual((await manager.get(job.job_id)).to_dict()["error"], "clone failed")
+
+    async def test_finished_jobs_expire(self):
+        manager = IndexJobManager(self.db_path, ttl=0)
+        with mock.patch("api.index_jobs.prepare_index", return_value=(1, "/stores/repo")):
+            job = await manager.submit("https://github.com/owner/repo")
+            await asyncio.wait_for(self._finished(manager, job), 5)
+        await asyncio.sleep(0.01)
+        self.assertIsNone(await manager.get(job.job_id))
+
+    async def test_oldest_finished_jobs_are_dropped_beyond_max_jobs(self):
+        manager = IndexJobManager(self.db_path, max_jobs=2)
+        with mock.patch("api.index_jobs.prepare_index", return_value=(1, "/stores/repo")):
+            jobs = []
+            for i in range(3):
+                jobs.append(await manager.submit(f"https://github.com/owner/repo{i}"))
+                await asyncio.wait_for(self._finished(manager, jobs[-1]), 5)
+        self.assertIsNone(await manager.get(jobs[0].job_id))
+        self.assertIsNotNone(await manager.get(jobs[2].job_id))
+
+    @staticmethod
+    async def _finished(manager, job):
+        """Wait until a job has run and its final state is saved; finished tasks are already removed."""
+        task = manager._tasks.get(job.job_id)
+        if task is not None:
+            await task
+
+
+class TestPreload(unittest.TestCase):
+    """Tests for preloading recently used index stores."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.storage = StorageManager(root_path=self.tmp_dir)
+        self.stores = []
+        for i, repo in enumerate(("old_repo", "new_repo")):
+            store_dir = os.path.join(self.tmp_dir, "databases", repo, "fp")
+            rng = np.random.default_rng(i)
+            docs = [Document(text=f"chunk {j}", vector=rng.random(4).tolist(), estimated_num_tokens=2)
+                    for j in range(5)]
+            write_index_store(docs, store_dir).close()
+            self.storage.touch(KIND_INDEX, repo, store_dir)
+            self.stores.append(store_dir)
+            time.sleep(0.01)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_most_recent_stores_are_loaded(self):
+        cache = RetrieverCache(max_bytes=1 << 30)
+        with mock.patch("api.index_jobs.get_storage_manager", return_value=self.storage), \
+                mock.patch("api.index_jobs.get_retriever_cache", return_value=cache):
+            self.assertEqual(preload_recent_indexes(1), 1)
+        self.assertIsNotNone(cache.get(self.stores[1]))
+        self.assertIsNone(cache.get(self.stores[0]))
+
+    def test_missing_stores_are_skipped(self):
+        shutil.rmtree(self.stores[1])
+        cache = RetrieverCache(max_bytes=1 << 30)
+        with mock.patch("api.index_jobs.get_storage_manager", return_value=self.storage), \
+                mock.patch("api.index_jobs.get_retriever_cache", return_value=cache):
+            self.assertEqual(preload_recent_indexes(5), 1)
+        self.assertIsNotNone(cache.get(self.stores[0]))
+
+
+class TestSplitFilter(unittest.TestCase):
+    def test_split_filter(self):
+        self.assertEqual(split_filter("docs\n%2Fbuild\n\n"), ["docs", "/build"])
+        self.assertIsNone(split_filter(""))
+        self.assertIsNone(split_filter(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
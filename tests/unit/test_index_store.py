@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar, memory-mapped index store.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+from adalflow.core.db import LocalDB
+from adalflow.components.data_process import TextSplitter
+
+from api.index_store import (
+    ChunkCache,
+    ChunkFilter,
+    IndexStore,
+    write_index_store,
+    migrate_pickle_to_index_store,
+)
+
+
+def _make_corpus():
+    """Build source documents and embedded chunks the way the pipeline does."""
+    code_text = "\n".join(f"line {i} word{i} foo bar" for i in range(120))
+    source = [
+        Document(
+            text=code_text,
+            meta_data={
+                "file_path": "pkg/module.py",
+                "type": "py",
+                "is_code": True,
+                "is_implementation": True,
+                "title": "pkg/module.py",
+                "token_count": 600,
+            },
+        ),
+        Document(
+            text="A short readme",
+            meta_data={
+                "file_path": "README.md",
+                "type": "md",
+                "is_code": False,
+                "is_implementation": False,
+                "title": "README.md",
+                "token_count": 4,
+                "extra": "kept",
+            },
+        ),
+    ]
+    chunks = TextSplitter(split_by="word", chunk_size=50, chunk_overlap=10)(source)
+    for i, chunk in enumerate(chunks):
+        chunk.vector = [float(i + 1)] * 4
+    return source, chunks
+
+
+class TestIndexStore(unittest.TestCase):
+    """Round-trip tests for write_index_store / IndexStore."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmp_dir, "store")
+        self.source, self.chunks = _make_corpus()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        """Stored chunks come back with identical text, vectors and metadata."""
+        write_index_store(self.chunks, self.store_dir, source_documents=self.source).close()
+        self.assertTrue(IndexStore.exists(self.store_dir))
+
+        store = IndexStore.open(self.store_dir)
+        try:
+            self.assertEqual(len(store), len(self.chunks))
+            self.assertEqual(store.dimensions, 4)
+            docs = list(store.documents())
+            self.assertEqual([d.text for d in docs], [c.text for c in self.chunks])
+            self.assertEqual(docs[3].vector, self.chunks[3].vector)
+            self.assertEqual(docs[-1].meta_data["extra"], "kept")
+            self.assertEqual(docs[-1].meta_data["file_path"], "README.md")
+        finally:
+            store.close()
+
+    def test_line_ranges(self):
+        """Chunks record the source line range they were cut from."""
+        store = write_index_store(self.chunks, self.store_dir, source_documents=self.source)
+        try:
+            lines = self.source[0].text.split("\n")
+            for i in range(len(store) - 1):
+                doc = store.get_document(i)
+                start, end = doc.meta_data["line_start"], doc.meta_data["line_end"]
+                self.assertIn(doc.text.split("\n")[-1], lines[end - 1])
+                self.assertIn(doc.text.split("\n")[0], lines[start - 1])
+        finally:
+            store.close()
+
+    def test_get_documents_preserves_order(self):
+        """get_documents returns documents in the requested order."""
+        store = write_index_store(self.chunks, self.store_dir)
+        try:
+            picked = store.get_documents([4, 0, 2])
+            self.assertEqual([d.text for d in picked],
+                             [self.chunks[i].text for i in (4, 0, 2)])
+        finally:
+            store.close()
+
+    def test_mismatched_vectors_are_flagged(self):
+        """Chunks with a wrong-sized vector are stored without an embedding."""
+        self.chunks[1].vector = [1.0, 2.0]
+        store = write_index_store(self.chunks, self.store_dir)
+        try:
+            self.assertEqual(store.get_document(1).vector, [])
+            self.assertEqual(store.manifest["num_with_vectors"], len(self.chunks) - 1)
+        finally:
+            store.close()
+
+    def test_invalid_vectors_are_rejected_at_build_time(self):
+        """NaN and zero-norm embeddings are excluded once, with counts in the manifest."""
+        self.chunks[1].vector = [float("nan")] * len(self.chunks[0].vector)
+        self.chunks[2].vector = [0.0] * len(self.chunks[0].vector)
+        self.chunks[3].vector = []
+        store = write_index_store(self.chunks, self.store_dir)
+        try:
+            self.assertEqual(store.manifest["invalid_vectors"],
+                             {"missing": 1, "wrong_dimension": 0, "non_finite": 1, "zero_norm": 1})
+            self.assertEqual(store.manifest["num_with_vectors"], len(self.chunks) - 3)
+            self.assertNotIn(1, store.vector_ids().tolist())
+            self.assertEqual(store.valid_mask()[:4].tolist(), [True, False, False, False])
+            self.assertEqual(store.get_document(1).vector, [])
+        finally:
+            store.close()
+
+    def test_open_rejects_vectors_not_matching_manifest(self):
+        """A vectors file that disagrees with the manifest is reported as a bad store."""
+        write_index_store(self.chunks, self.store_dir).close()
+        np.save(os.path.join(self.store_dir, "vectors.npy"), np.zeros((1, 3), dtype=np.float32))
+        with self.assertRaises(ValueError):
+            IndexStore.open(self.store_dir)
+
+    def test_filter_ids_uses_file_ranges(self):
+        """Metadata filters select whole files via their chunk id ranges."""
+        store = write_index_store(self.chunks, self.store_dir)
+        try:
+            code_ids = [i for i, c in enumerate(self.chunks) if c.meta_data["file_path"] == "pkg/module.py"]
+            readme_ids = [i for i, c in enumerate(self.chunks) if c.meta_data["file_path"] == "README.md"]
+            self.assertEqual(store.filter_ids(ChunkFilter(file_path="./pkg/module.py")).tolist(), code_ids)
+            self.assertEqual(store.filter_ids(ChunkFilter(path_prefix="pkg/")).tolist(), code_ids)
+            self.assertEqual(store.filter_ids(ChunkFilter(path_prefix="pk")).tolist(), [])
+            self.assertEqual(store.filter_ids(ChunkFilter(is_code=False)).tolist(), readme_ids)
+            self.assertEqual(store.filter_ids(ChunkFilter(extensions=("MD",))).tolist(), readme_ids)
+            self.assertEqual(store.filter_ids(ChunkFilter(file_path="README.md", is_code=True)).tolist(), [])
+        finally:
+            store.close()
+
+    def test_open_missing_store(self):
+        """Opening an incomplete store raises FileNotFoundError."""
+        with self.assertRaises(FileNotFoundError):
+            IndexStore.open(self.store_dir)
+
+    def test_migrate_pickle(self):
+        """A legacy LocalDB pickle is migrated into an equivalent store."""
+        db = LocalDB()
+        db.load(self.source)
+        db.transformed_items = {"split_and_embed": self.chunks}
+        pickle_path = os.path.join(self.tmp_dir, "legacy.pkl")
+        db.save_state(pickle_path)
+
+        store = migrate_pickle_to_index_store(pickle_path, self.store_dir)
+        try:
+            self.assertEqual(len(store), len(self.chunks))
+            self.assertEqual(store.get_document(2).text, self.chunks[2].text)
+            self.assertIn("line_start", store.get_document(0).meta_data)
+        finally:
+            store.close()
+
+
+class TestChunkCache(unittest.TestCase):
+    """Tests for the LRU of materialized chunks."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        source, self.chunks = _make_corpus()
+        self.store = write_index_store(self.chunks, os.path.join(self.tmp_dir, "store"),
+                                       source_documents=source)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_returns_requested_chunks_without_vectors(self):
+        """Cached reads return text and metadata in order, without embeddings."""
+        cache = ChunkCache(self.store, capacity=4)
+        docs = cache.get_documents([3, 1, 3])
+        self.assertEqual([d.text for d in docs],
+                         [self.chunks[i].text for i in (3, 1, 3)])
+        self.assertEqual(docs[0].vector, [])
+        self.assertEqual(docs[0].meta_data["file_path"], "pkg/module.py")
+
+    def test_evicts_least_recently_used(self):
+        """The cache never grows past its capacity and keeps the hottest chunks."""
+        cache = ChunkCache(self.store, capacity=2)
+        cache.get_documents([0])
+        cache.get_documents([1])
+        cache.get_documents([0])
+        cache.get_documents([2])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(list(cache._cache.keys()), [0, 2])
+
+    def test_ignores_out_of_range_ids(self):
+        """Ids outside the store are skipped rather than misaligning results."""
+        cache = ChunkCache(self.store, capacity=4)
+        docs = cache.get_documents([999, 2])
+        self.assertEqual([d.text for d in docs], [self.chunks[2].text])
+
+
+if __name__ == "__main__":
+    unittest.main()
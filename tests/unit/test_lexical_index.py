@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the BM25 lexical index and rank fusion.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document, RetrieverOutput
+
+from api.index_store import write_index_store
+from api.lexical_index import (
+    LEXICAL_INDEX_FILE,
+    build_lexical_index,
+    load_lexical_index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+TEXTS = [
+    "def prepare_db_index(self, repo):\n    store = self._load_index_store(repo)",
+    "class DatabaseManager:\n    def prepareDatabase(self): pass",
+    "The wiki generator renders markdown pages for every section.",
+    "manager.prepare_db_index(repo_url) is called before retrieval",
+    "HTTPResponseParser parses the raw response body",
+]
+
+
+class TestLexicalIndex(unittest.TestCase):
+    """Tests for building and searching the lexical index."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        docs = [Document(text=text, vector=[1.0, float(i)], estimated_num_tokens=5) for i, text in enumerate(TEXTS)]
+        self.store = write_index_store(docs, os.path.join(self.tmp_dir, "store"))
+        build_lexical_index(self.store)
+        self.index = load_lexical_index(self.store)
+
+    def tearDown(self):
+        self.index.close()
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_tokenize_splits_identifiers(self):
+        tokens = list(tokenize("parseHTTPResponse_v2 prepare_db_index"))
+        self.assertEqual(tokens, ["parsehttpresponse_v2", "parse", "http", "response", "v", "2",
+                                  "prepare_db_index", "prepare", "db", "index"])
+
+    def test_exact_identifier_ranks_first(self):
+        """Chunks containing the whole identifier outrank ones sharing only its parts."""
+        output = self.index.search("where is `prepare_db_index` called?", top_k=3)
+        self.assertEqual(set(output.doc_indices[:2]), {0, 3})
+        self.assertGreater(output.doc_scores[0], 0)
+
+    def test_camel_case_parts_match(self):
+        output = self.index.search("response parser", top_k=2)
+        self.assertEqual(output.doc_indices[0], 4)
+
+    def test_search_restricted_to_ids(self):
+        output = self.index.search("prepare_db_index", top_k=3, ids=np.array([2, 3, 4]))
+        self.assertEqual(output.doc_indices, [3])
+
+    def test_query_without_tokens(self):
+        output = self.index.search("?!", top_k=3)
+        self.assertEqual(output.doc_indices, [])
+
+    def test_missing_index_is_built_on_load(self):
+        self.index.close()
+        os.remove(os.path.join(self.store.store_dir, LEXICAL_INDEX_FILE))
+        self.index = load_lexical_index(self.store)
+        self.assertEqual(self.index.num_chunks, len(TEXTS))
+
+    def test_reciprocal_rank_fusion(self):
+        """Chunks ranked by both retrievers beat chunks ranked highly by only one."""
+        vector = RetrieverOutput(doc_indices=[1, 2, 3], doc_scores=[0.9, 0.8, 0.7], query="q")
+        lexical = RetrieverOutput(doc_indices=[4, 2, 3], doc_scores=[9.0, 5.0, 1.0], query="q")
+        fused = reciprocal_rank_fusion([vector, lexical], top_k=3)
+        self.assertEqual(fused.doc_indices, [2, 3, 1])
+        self.assertEqual(fused.query, "q")
+
+
+if __name__ == "__main__":
+    unittest.main()
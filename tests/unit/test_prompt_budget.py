@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for sizing chat prompts to the model's context window.
+"""
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import api.config
+from api.config import get_context_window
+from api.data_pipeline import count_tokens
+from api.prompt_budget import (
+    PROMPT_SAFETY_MARGIN_TOKENS,
+    format_history,
+    plan_prompt,
+    prompt_token_limit,
+    trim_history,
+    truncate_to_tokens,
+)
+from api.session_store import PromptHistory, Turn
+
+TEST_PROVIDER = {
+    "default_model": "small",
+    "context_window": 3000,
+    "context_windows": {"large": 100000},
+    "context_token_budget": 50000,
+    "models": {"small": {"max_tokens": 500}, "large": {"max_tokens": 1000}},
+}
+
+
+def _words(n, word="lorem"):
+    return " ".join([word] * n)
+
+
+def _history(turns=6, words=100):
+    return PromptHistory("", [Turn(f"question {i} " + _words(words), f"answer {i} " + _words(words))
+                              for i in range(turns)])
+
+
+class PromptBudgetTestCase(unittest.TestCase):
+    def setUp(self):
+        # Patch the module attribute rather than the dict: other tests reload api.config
+        test_configs = dict(api.config.configs, providers=dict(api.config.configs["providers"], test=TEST_PROVIDER))
+        for target in ("api.config.configs", "api.prompt_budget.configs"):
+            patcher = mock.patch(target, test_configs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestLimits(PromptBudgetTestCase):
+    """Tests for context windows and prompt limits."""
+
+    def test_context_window_precedence(self):
+        self.assertEqual(get_context_window("test", "large"), 100000)
+        self.assertEqual(get_context_window("test", "small"), 3000)
+        self.assertEqual(get_context_window("test"), 3000)
+
+    def test_prompt_limit_leaves_room_for_the_answer(self):
+        self.assertEqual(prompt_token_limit("test", "small"), 3000 - 500 - PROMPT_SAFETY_MARGIN_TOKENS)
+
+
+class TestTrimming(unittest.TestCase):
+    """Tests for truncate_to_tokens and trim_history."""
+
+    def test_truncate(self):
+        text = _words(1000)
+        cut = truncate_to_tokens(text, 100)
+        self.assertLessEqual(count_tokens(cut), 100)
+        self.assertTrue(cut.endswith("[truncated]"))
+        self.assertEqual(truncate_to_tokens("short", 100), "short")
+        self.assertEqual(truncate_to_tokens(text, 0), "")
+
+    def test_history_within_budget_is_unchanged(self):
+        history = _history(turns=2, words=10)
+        self.assertIs(trim_history(history, 10000), history)
+
+    def test_older_turns_are_folded_into_the_summary(self):
+        history = _history()
+        trimmed = trim_history(history, 800)
+        self.assertLessEqual(count_tokens(format_history(trimmed)), 800)
+        self.assertTrue(trimmed.summary)
+        self.assertEqual(trimmed.recent_turns[-1], history.recent_turns[-1])
+
+    def test_oversized_newest_turn_is_dropped(self):
+        history = PromptHistory("", [Turn(_words(2000), _words(2000))])
+        trimmed = trim_history(history, 300)
+        self.assertEqual(trimmed.recent_turns, [])
+        self.assertLessEqual(count_tokens(format_history(trimmed)), 300)
+
+
+class TestPlanPrompt(PromptBudgetTestCase):
+    """Tests for plan_prompt."""
+
+    def test_everything_fits_the_limit(self):
+        fixed = _words(300)
+        budget = plan_prompt("test", "small", fixed, _history(), file_content=_words(3000))
+        used = (count_tokens(fixed) + count_tokens(budget.file_content)
+                + count_tokens(format_history(budget.history)) + budget.context_tokens)
+        self.assertLessEqual(used, budget.limit)
+        self.assertTrue(budget.file_content.endswith("[truncated]"))
+        self.assertGreater(budget.context_tokens, 0)
+
+    def test_large_window_keeps_everything(self):
+        history = _history()
+        file_content = _words(3000)
+        budget = plan_prompt("test", "large", _words(300), history, file_content=file_content)
+        self.assertEqual(budget.file_content, file_content)
+        self.assertIs(budget.history, history)
+        self.assertEqual(budget.context_tokens, 50000)
+
+    def test_is_deterministic(self):
+        args = ("test", "small", _words(300), _history(), _words(3000))
+        self.assertEqual(plan_prompt(*args), plan_prompt(*args))
+
+
+if __name__ == "__main__":
+    unittest.main()
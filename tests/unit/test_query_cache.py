@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tests for the query embedding and retrieval result caches.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+
+from api.index_store import write_index_store
+from api.query_cache import QueryCache, TTLCache, embedder_fingerprint
+from api.vector_index import StoreRetriever, apply_search_params, build_faiss_index
+
+INDEX_KEY = {"embedder_type": "openai", "embedder_client": "OpenAIClient",
+             "model": "text-embedding-3-small", "dimensions": 8}
+
+
+class CountingEmbedder:
+    """Embedder returning a deterministic vector per query and counting the texts it embeds."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, queries):
+        self.embedded.extend(queries)
+        data = []
+        for q in queries:
+            rng = np.random.default_rng(abs(hash(q)) % (2 ** 32))
+            data.append(SimpleNamespace(embedding=rng.normal(size=8).tolist()))
+        return SimpleNamespace(data=data)
+
+
+class TestTTLCache(unittest.TestCase):
+    """Tests for TTLCache."""
+
+    def test_lru_eviction_and_stats(self):
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (2, 1, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3, places=3)
+
+    def test_entries_expire(self):
+        cache = TTLCache(max_entries=10, ttl_seconds=30)
+        with mock.patch("api.query_cache.time.monotonic", return_value=1000.0):
+            cache.put("a", 1)
+        with mock.patch("api.query_cache.time.monotonic", return_value=1031.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_embedder_fingerprint_ignores_pipeline_settings(self):
+        """Stores with different filters but the same embedder share query embeddings."""
+        other = dict(INDEX_KEY, filters={"excluded_dirs": ["docs"]})
+        self.assertEqual(embedder_fingerprint(INDEX_KEY), embedder_fingerprint(other))
+        self.assertNotEqual(embedder_fingerprint(INDEX_KEY),
+                            embedder_fingerprint(dict(INDEX_KEY, model="text-embedding-3-large")))
+        self.assertIsNone(embedder_fingerprint(None))
+
+
+class TestRetrieverWithQueryCache(unittest.TestCase):
+    """Tests for StoreRetriever's use of the query cache."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.stores = []
+        for name in ("repo_a", "repo_b"):
+            docs = [Document(text=f"chunk {i}", vector=rng.normal(size=8).tolist(), estimated_num_tokens=2)
+                    for i in range(20)]
+            self.stores.append(write_index_store(docs, os.path.join(self.tmp_dir, name),
+                                                 manifest_extra={"index_key": INDEX_KEY}))
+        self.cache = QueryCache({})
+        self.embedder = CountingEmbedder()
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _retriever(self, store):
+        return StoreRetriever(store, embedder=self.embedder, top_k=5, query_cache=self.cache)
+
+    def test_repeated_query_is_served_from_cache(self):
+        retriever = self._retriever(self.stores[0])
+        first = retriever("how does auth work")
+        second = retriever("how does auth work")
+        self.assertEqual(first[0].doc_indices, second[0].doc_indices)
+        self.assertEqual(first[0].doc_scores, second[0].doc_scores)
+        self.assertEqual(self.embedder.embedded, ["how does auth work"])
+        self.assertEqual(self.cache.results.stats()["hits"], 1)
+
+    def test_results_are_not_shared_across_index_types_or_search_params(self):
+        """Rebuilding with another index type keeps the vectors, but cached results must not carry over."""
+        self._retriever(self.stores[0])("q")
+        index = build_faiss_index(self.stores[0], {"index_type": "hnsw", "hnsw_m": 4, "ef_construction": 8})
+        retriever = StoreRetriever(self.stores[0], embedder=self.embedder, top_k=5, index=index,
+                                   query_cache=self.cache)
+        retriever("q")
+        apply_search_params(retriever.index, {"ef_search": 8})
+        retriever("q")
+        retriever("q")
+        self.assertEqual(self.cache.results.stats()["hits"], 1)
+        self.assertEqual(self.embedder.embedded, ["q"])
+
+    def test_embedding_is_shared_across_stores(self):
+        """A query embedded for one repository is reused for another with the same embedder."""
+        self._retriever(self.stores[0])("q")
+        self._retriever(self.stores[1])("q")
+        self.assertEqual(self.embedder.embedded, ["q"])
+        self.assertEqual(self.cache.embeddings.stats()["hits"], 1)
+
+    def test_only_uncached_queries_are_embedded(self):
+        retriever = self._retriever(self.stores[0])
+        retriever("a")
+        output = retriever(["a", "b"])
+        self.assertEqual(self.embedder.embedded, ["a", "b"])
+        self.assertEqual(len(output[1].doc_indices), 5)
+
+    def test_top_k_is_part_of_the_result_key(self):
+        retriever = self._retriever(self.stores[0])
+        retriever("q")
+        output = retriever("q", top_k=3)
+        self.assertEqual(len(output[0].doc_indices), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for batched multi-query retrieval in RAG.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import adalflow as adal
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+
+from api.index_store import ChunkCache, write_index_store
+from api.lexical_index import load_lexical_index
+from api.rag import RAG
+from api.vector_index import StoreRetriever
+
+
+class RecordingEmbedder:
+    """Embedder returning a deterministic vector per query and recording each call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, queries):
+        self.calls.append(list(queries))
+        data = []
+        for q in queries:
+            rng = np.random.default_rng(sum(map(ord, q)))
+            data.append(SimpleNamespace(embedding=rng.normal(size=8).tolist()))
+        return SimpleNamespace(data=data)
+
+
+class TestRAGBatchCall(unittest.TestCase):
+    """Tests for RAG.batch_call."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        docs = [Document(text=f"chunk {i} about topic{i % 4}", vector=rng.normal(size=8).tolist(),
+                         meta_data={"file_path": f"f{i % 4}.py"}, estimated_num_tokens=4)
+                for i in range(40)]
+        self.store = write_index_store(docs, os.path.join(self.tmp_dir, "store"))
+        self.lexical_index = load_lexical_index(self.store)
+        self.embedder = RecordingEmbedder()
+
+        # Wire a RAG instance to the store without building real embedder/generator clients
+        self.rag = RAG.__new__(RAG)
+        adal.Component.__init__(self.rag)
+        self.rag.is_ollama_embedder = False
+        self.rag.store = self.store
+        self.rag.chunk_cache = ChunkCache(self.store)
+        self.rag.lexical_index = self.lexical_index
+        self.rag.retriever = StoreRetriever(self.store, embedder=self.embedder, top_k=5)
+
+    def tearDown(self):
+        self.lexical_index.close()
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _configs(self, mode):
+        return {"retriever": {"top_k": 5, "mode": mode}}
+
+    def test_batch_embeds_all_queries_in_one_call(self):
+        queries = ["topic1 overview", "topic2 details", "topic3 usage"]
+        with mock.patch("api.rag.configs", self._configs("hybrid")):
+            outputs = self.rag.batch_call(queries)
+        self.assertEqual(self.embedder.calls, [queries])
+        self.assertEqual(len(outputs), 3)
+        for output in outputs:
+            self.assertEqual(len(output.documents), len(output.doc_indices))
+            self.assertTrue(output.documents)
+
+    def test_batch_matches_single_calls(self):
+        queries = ["topic0 overview", "topic2 details"]
+        with mock.patch("api.rag.configs", self._configs("vector")):
+            batched = self.rag.batch_call(queries)
+            single = [self.rag.call(q)[0] for q in queries]
+        self.assertEqual([o.doc_indices for o in batched], [o.doc_indices for o in single])
+
+    def test_lexical_mode_makes_no_embedding_call(self):
+        with mock.patch("api.rag.configs", self._configs("lexical")):
+            outputs = self.rag.batch_call(["topic1", "topic2"])
+        self.assertEqual(self.embedder.calls, [])
+        self.assertTrue(all(d.meta_data["file_path"] == "f1.py" for d in outputs[0].documents))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the process-wide retriever cache.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+
+from api.index_store import write_index_store
+from api.retriever_cache import RetrieverCache
+
+
+def _write_store(store_dir, num_chunks=10, dim=4, seed=0):
+    rng = np.random.default_rng(seed)
+    docs = [Document(text=f"chunk {i}", vector=rng.random(dim).tolist(), estimated_num_tokens=2)
+            for i in range(num_chunks)]
+    write_index_store(docs, store_dir).close()
+
+
+class TestRetrieverCache(unittest.TestCase):
+    """Tests for RetrieverCache."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_a = os.path.join(self.tmp_dir, "repo_a", "fp")
+        self.store_b = os.path.join(self.tmp_dir, "repo_b", "fp")
+        _write_store(self.store_a)
+        _write_store(self.store_b)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_load_is_reused(self):
+        """A second load returns the same ready entry."""
+        cache = RetrieverCache(max_bytes=1 << 30)
+        first = cache.load(self.store_a)
+        second = cache.load(self.store_a)
+        self.assertIs(first, second)
+        self.assertEqual(first.index.ntotal, 10)
+
+    def test_lru_eviction_under_budget(self):
+        """Only the most recently used entry is kept when the budget fits one."""
+        cache = RetrieverCache(max_bytes=1 << 30)
+        entry = cache.load(self.store_a)
+        cache.max_bytes = entry.size_bytes
+        cache.load(self.store_b)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.get(self.store_a))
+        self.assertIsNotNone(cache.get(self.store_b))
+
+    def test_rebuilt_store_is_reloaded(self):
+        """Replacing a store on disk invalidates its cached entry."""
+        cache = RetrieverCache(max_bytes=1 << 30)
+        old = cache.load(self.store_a)
+        time.sleep(0.01)
+        _write_store(self.store_a, num_chunks=12, seed=1)
+        self.assertIsNone(cache.get(self.store_a))
+        new = cache.load(self.store_a)
+        self.assertIsNot(old, new)
+        self.assertEqual(new.index.ntotal, 12)
+
+    def test_invalidate(self):
+        cache = RetrieverCache(max_bytes=1 << 30)
+        cache.load(self.store_a)
+        cache.invalidate(self.store_a)
+        self.assertEqual(len(cache), 0)
+
+    def test_concurrent_loads_share_one_entry(self):
+        """Concurrent cold requests for the same store load it once."""
+        cache = RetrieverCache(max_bytes=1 << 30)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.load(self.store_a)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(entry) for entry in results}), 1)
+        # Load locks only live while loads wait on them
+        self.assertEqual(cache._load_locks, {})
+
+    def test_evicted_and_invalidated_entries_are_closed(self):
+        cache = RetrieverCache(max_bytes=1 << 30)
+        entry = cache.load(self.store_a)
+        cache.max_bytes = entry.size_bytes
+        cache.load(self.store_b)
+        self.assertTrue(entry.store.closed)
+        entry_b = cache.get(self.store_b)
+        cache.invalidate(self.store_b)
+        self.assertTrue(entry_b.store.closed)
+
+    def test_held_entry_is_closed_on_release(self):
+        """An entry dropped while a request holds it stays usable until the request lets go."""
+        cache = RetrieverCache(max_bytes=1 << 30)
+        entry = cache.acquire(self.store_a)
+        cache.invalidate(self.store_a)
+        self.assertFalse(entry.store.closed)
+        self.assertEqual(len(entry.store.get_documents([0])), 1)
+        cache.release(entry)
+        self.assertTrue(entry.store.closed)
+        # A closed store handed back in is not reused
+        reloaded = cache.acquire(self.store_a, store=entry.store)
+        self.assertIsNot(reloaded, entry)
+        self.assertFalse(reloaded.store.closed)
+        cache.release(reloaded)
+        self.assertFalse(reloaded.store.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
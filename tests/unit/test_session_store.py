@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for server-side chat sessions and history budgeting.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.session_store import (
+    Session,
+    SessionStore,
+    Turn,
+    fit_history,
+    resolve_history,
+    stateless_history,
+    summarize_turns,
+    turns_from_messages,
+)
+
+
+def _turn(i, tokens=100):
+    return Turn(f"Question {i}?", f"Answer {i}. More detail follows here.", tokens)
+
+
+def _messages(*pairs):
+    messages = []
+    for user, assistant in pairs:
+        messages.append(SimpleNamespace(role="user", content=user))
+        messages.append(SimpleNamespace(role="assistant", content=assistant))
+    return messages
+
+
+class TestFitHistory(unittest.TestCase):
+    """Tests for the token budget and rolling summary."""
+
+    def test_short_conversation_is_kept_verbatim(self):
+        session = Session("s", [_turn(i) for i in range(3)])
+        self.assertFalse(fit_history(session, max_tokens=1000))
+        self.assertEqual(session.summarized_turns, 0)
+        self.assertEqual(session.summary, "")
+
+    def test_old_turns_are_folded_into_summary(self):
+        session = Session("s", [_turn(i) for i in range(10)])
+        # 75% of 400 tokens for recent turns -> the last three turns
+        self.assertTrue(fit_history(session, max_tokens=400))
+        self.assertEqual(session.summarized_turns, 7)
+        self.assertIn("Question 0?", session.summary)
+        self.assertIn("Answer 6.", session.summary)
+        self.assertNotIn("Question 7?", session.summary)
+
+    def test_summary_rolls_forward(self):
+        session = Session("s", [_turn(i) for i in range(5)])
+        fit_history(session, max_tokens=400)
+        summarizer = mock.Mock(side_effect=summarize_turns)
+        session.turns.append(_turn(5))
+        fit_history(session, max_tokens=400, summarizer=summarizer)
+        # Only the newly overflowing turn is summarized
+        folded = summarizer.call_args[0][1]
+        self.assertEqual([t.user_query for t in folded], ["Question 2?"])
+
+    def test_newest_turn_is_always_kept(self):
+        session = Session("s", [_turn(0), _turn(1, tokens=10000)])
+        fit_history(session, max_tokens=400)
+        self.assertEqual(session.summarized_turns, 1)
+
+    def test_summary_keeps_first_line_within_budget(self):
+        summary = summarize_turns("", [_turn(i) for i in range(50)], max_tokens=60)
+        lines = summary.splitlines()
+        self.assertIn("Question 0?", lines[0])
+        self.assertIn("Question 49?", lines[-1])
+        self.assertLess(len(lines), 50)
+
+    def test_stateless_history(self):
+        messages = _messages(*[(f"q{i}", "a" * 4000) for i in range(5)])
+        history = stateless_history(messages, max_tokens=2000)
+        self.assertTrue(history.summary)
+        self.assertEqual(history.recent_turns[-1].user_query, "q4")
+
+    def test_turns_from_messages_skips_unpaired(self):
+        messages = _messages(("q1", "a1")) + [SimpleNamespace(role="user", content="q2")]
+        self.assertEqual([(t.user_query, t.assistant_response) for t in turns_from_messages(messages)],
+                         [("q1", "a1")])
+
+
+class TestSessionStore(unittest.TestCase):
+    """Tests for SessionStore."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "sessions.sqlite")
+        self.store = SessionStore(self.db_path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_turns_survive_restart(self):
+        self.store.append_turn("c1", "q1", "a1")
+        self.store.append_turn("c1", "q2", "a2")
+        reopened = SessionStore(self.db_path)
+        try:
+            session = reopened.get("c1")
+            self.assertEqual([t.user_query for t in session.turns], ["q1", "q2"])
+        finally:
+            reopened.close()
+
+    def test_other_process_updates_are_seen(self):
+        self.store.append_turn("c1", "q1", "a1")
+        other = SessionStore(self.db_path)
+        try:
+            other.append_turn("c1", "q2", "a2")
+        finally:
+            other.close()
+        self.assertEqual(len(self.store.get("c1").turns), 2)
+
+    def test_summary_is_persisted(self):
+        for i in range(10):
+            self.store.append_turns("c1", [_turn(i)])
+        history = self.store.prompt_history(self.store.get("c1"), max_tokens=400)
+        self.assertEqual(len(history.recent_turns), 3)
+        reopened = SessionStore(self.db_path)
+        try:
+            session = reopened.get("c1")
+            self.assertEqual(session.summarized_turns, 7)
+            self.assertEqual(session.summary, history.summary)
+        finally:
+            reopened.close()
+
+    def test_expired_session_starts_over(self):
+        self.store.append_turn("c1", "q1", "a1")
+        with mock.patch("api.session_store.time.time", return_value=self.store.get("c1").updated_at + 8 * 86400):
+            self.assertEqual(self.store.get("c1").turns, [])
+            self.store.append_turn("c1", "q2", "a2")
+        self.assertEqual([t.user_query for t in self.store.get("c1").turns], ["q2"])
+
+    def test_lru_bound(self):
+        store = SessionStore(self.db_path, max_sessions=2)
+        try:
+            for sid in ("a", "b", "c"):
+                store.append_turn(sid, "q", "a")
+            self.assertEqual(list(store._sessions), ["b", "c"])
+            self.assertEqual(len(store.get("a").turns), 1)
+        finally:
+            store.close()
+
+    def test_resolve_history_seeds_session_from_full_messages(self):
+        messages = _messages(("q1", "a1")) + [SimpleNamespace(role="user", content="q2")]
+        with mock.patch("api.session_store.get_session_store", return_value=self.store):
+            earlier, history = resolve_history(messages, "c1")
+            self.assertEqual([t.user_query for t in earlier], ["q1"])
+            # Later requests only carry the new message
+            self.store.append_turn("c1", "q2", "a2")
+            earlier, history = resolve_history([SimpleNamespace(role="user", content="q3")], "c1")
+        self.assertEqual([t.user_query for t in earlier], ["q1", "q2"])
+        self.assertEqual([t.user_query for t in history.recent_turns], ["q1", "q2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
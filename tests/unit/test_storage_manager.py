@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for disk-budget-aware storage tracking and garbage collection.
+"""
+import sys
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.storage_manager import (
+    KIND_INDEX,
+    KIND_REPO,
+    KIND_WIKI,
+    StorageManager,
+    parse_wiki_cache_filename,
+)
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def _age(path, seconds):
+    """Backdate a file or directory so it looks idle."""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+class TestStorageManager(unittest.TestCase):
+    """Tests for StorageManager."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.manager = StorageManager(self.root)
+        # Two repos whose names share a prefix, to catch substring matching
+        for name, age in (("owner_repo", 7200), ("owner_repo-extra", 3600)):
+            _write(os.path.join(self.root, "repos", name, "file.py"), 1000)
+            _age(os.path.join(self.root, "repos", name), age)
+            store = os.path.join(self.root, "databases", name, "fp1")
+            _write(os.path.join(store, "vectors.npy"), 500)
+            _age(store, age)
+            wiki = os.path.join(self.root, "wikicache", f"deepwiki_cache_github_{name}_en.json")
+            _write(wiki, 100)
+            _age(wiki, age)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_parse_wiki_cache_filename(self):
+        self.assertEqual(parse_wiki_cache_filename("deepwiki_cache_github_my_org_my_repo_zh-tw.json"),
+                         "my_org_my_repo")
+        self.assertIsNone(parse_wiki_cache_filename("notes.json"))
+
+    def test_scan_discovers_all_kinds(self):
+        usage = self.manager.usage()
+        self.assertEqual(usage[KIND_REPO], 2000)
+        self.assertEqual(usage[KIND_INDEX], 1000)
+        self.assertEqual(usage[KIND_WIKI], 200)
+
+    def test_lru_eviction_within_budget(self):
+        """The least recently used clone is evicted first."""
+        evicted = self.manager.collect(repos_budget=1500, min_idle_seconds=0)
+        self.assertEqual([a.repo_name for a in evicted], ["owner_repo"])
+        self.assertFalse(os.path.exists(os.path.join(self.root, "repos", "owner_repo")))
+        self.assertTrue(os.path.exists(os.path.join(self.root, "repos", "owner_repo-extra")))
+
+    def test_touch_protects_recently_used(self):
+        """Recording an access moves an artifact to the back of the eviction order."""
+        self.manager.scan()
+        self.manager.touch(KIND_REPO, "owner_repo", os.path.join(self.root, "repos", "owner_repo"))
+        evicted = self.manager.collect(repos_budget=1500, min_idle_seconds=0)
+        self.assertEqual([a.repo_name for a in evicted], ["owner_repo-extra"])
+
+    def test_min_idle_time_is_respected(self):
+        """Artifacts used within the idle window are never evicted."""
+        evicted = self.manager.collect(repos_budget=0, min_idle_seconds=86400)
+        self.assertEqual(evicted, [])
+
+    def test_derived_budget_leaves_clones_alone(self):
+        """Indexes and wiki caches are evicted independently of clones."""
+        evicted = self.manager.collect(derived_budget=0, min_idle_seconds=0)
+        self.assertEqual({a.kind for a in evicted}, {KIND_INDEX, KIND_WIKI})
+        self.assertEqual(self.manager.usage()[KIND_REPO], 2000)
+
+    def test_dry_run_removes_nothing(self):
+        evicted = self.manager.collect(repos_budget=0, derived_budget=0, min_idle_seconds=0, dry_run=True)
+        self.assertEqual(len(evicted), 6)
+        self.assertEqual(self.manager.usage()[KIND_REPO], 2000)
+
+    def test_remove_repo_matches_exactly(self):
+        """Removing one repo leaves repos with a longer, similar name untouched."""
+        removed = self.manager.remove_repo("owner_repo")
+        self.assertTrue(removed)
+        self.assertTrue(all("owner_repo-extra" not in path for path in removed))
+        remaining = {(a.kind, a.repo_name) for a in self.manager.scan()}
+        self.assertEqual(remaining, {(KIND_REPO, "owner_repo-extra"),
+                                     (KIND_INDEX, "owner_repo-extra"),
+                                     (KIND_WIKI, "owner_repo-extra")})
+
+
+if __name__ == "__main__":
+    unittest.main()
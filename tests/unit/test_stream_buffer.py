@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for resumable chat streams.
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.cancellation import CancelToken, current_cancel_token, set_cancel_token
+from api.stream_buffer import StreamBuffer, StreamRegistry, resumable_streams_enabled
+
+
+async def _collect(stream, offset=0):
+    return "".join([text async for text in stream.read(offset)])
+
+
+class TestStreamBuffer(unittest.IsolatedAsyncioTestCase):
+    """Tests for StreamBuffer."""
+
+    async def test_text_from_offset(self):
+        stream = StreamBuffer("s")
+        for text in ("Hello", ", ", "wörld"):
+            stream.append(text)
+        self.assertEqual(stream.text_from(0), "Hello, wörld")
+        self.assertEqual(stream.text_from(3), "lo, wörld")
+        self.assertEqual(stream.text_from(7), "wörld")
+        self.assertEqual(stream.text_from(12), "")
+
+    async def test_reader_continues_live(self):
+        stream = StreamBuffer("s")
+        stream.append("abc")
+        reader = asyncio.create_task(_collect(stream, offset=1))
+        await asyncio.sleep(0)
+        stream.append("def")
+        await asyncio.sleep(0)
+        stream.append("ghi")
+        stream.finish()
+        self.assertEqual(await reader, "bcdefghi")
+
+    async def test_append_after_finish_is_ignored(self):
+        stream = StreamBuffer("s")
+        stream.append("done")
+        stream.finish()
+        stream.append("late")
+        self.assertEqual(await _collect(stream), "done")
+
+
+class TestStreamRegistry(unittest.IsolatedAsyncioTestCase):
+    """Tests for StreamRegistry."""
+
+    async def test_resume_after_reader_leaves(self):
+        registry = StreamRegistry()
+        release = asyncio.Event()
+
+        async def producer(stream):
+            stream.append("first ")
+            await release.wait()
+            stream.append("second")
+
+        stream = registry.start(producer)
+        reader = stream.read()
+        self.assertEqual(await reader.__anext__(), "first ")
+        # The connection drops; generation keeps going
+        await reader.aclose()
+        release.set()
+        await stream.task
+        resumed = registry.get(stream.stream_id)
+        self.assertEqual(await _collect(resumed, offset=6), "second")
+
+    async def test_orphaned_stream_is_cancelled(self):
+        registry = StreamRegistry(orphan_grace=0.01)
+
+        async def producer(stream):
+            stream.append("partial")
+            await asyncio.sleep(10)
+
+        stream = registry.start(producer)
+        await asyncio.wait_for(stream.task, 1)
+        self.assertTrue(stream.done)
+        self.assertEqual(stream.text, "partial")
+
+    async def test_producer_error_ends_the_stream(self):
+        registry = StreamRegistry()
+
+        async def producer(stream):
+            stream.append("partial")
+            raise RuntimeError("boom")
+
+        stream = registry.start(producer)
+        self.assertEqual(await _collect(stream), "partial\nError: boom")
+
+    async def test_producer_has_its_own_cancel_token(self):
+        registry = StreamRegistry()
+        tokens = []
+
+        async def producer(stream):
+            tokens.append(current_cancel_token())
+
+        await registry.start(producer).task
+        self.assertIsNotNone(tokens[0])
+        self.assertFalse(tokens[0].cancelled)
+
+    async def test_stream_that_is_not_resumable(self):
+        """Without an id to resume with, the answer keeps the connection's token and stops with it."""
+        registry = StreamRegistry(orphan_grace=0.01)
+        connection_token = CancelToken()
+        set_cancel_token(connection_token)
+        tokens = []
+
+        async def producer(stream):
+            tokens.append(current_cancel_token())
+            stream.append("partial")
+            await asyncio.sleep(10)
+
+        stream = registry.start(producer, resumable=False)
+        reader = stream.read()
+        self.assertEqual(await reader.__anext__(), "partial")
+        self.assertIs(tokens[0], connection_token)
+        self.assertIsNone(registry.get(stream.stream_id))
+        # No orphan grace: it would still be running after it
+        await reader.aclose()
+        await asyncio.sleep(0.05)
+        self.assertFalse(stream.done)
+        stream.cancel()
+        await asyncio.wait_for(stream.task, 1)
+        self.assertTrue(stream.done)
+
+    async def test_finished_streams_expire(self):
+        registry = StreamRegistry(ttl=0)
+
+        async def producer(stream):
+            stream.append("x")
+
+        stream = registry.start(producer)
+        await stream.task
+        await asyncio.sleep(0.01)
+        self.assertIsNone(registry.get(stream.stream_id))
+        self.assertEqual(registry.stats()["streams"], 0)
+
+
+
+class TestResumableStreamsEnabled(unittest.TestCase):
+    """Buffers are per worker, so resuming needs a single worker."""
+
+    def test_worker_count(self):
+        for value, enabled in (("", True), ("1", True), ("4", False), ("many", True)):
+            with mock.patch.dict("os.environ", {"DEEPWIKI_WORKERS": value}):
+                self.assertEqual(resumable_streams_enabled(), enabled)
+
+
+if __name__ == "__main__":
+    unittest.main()
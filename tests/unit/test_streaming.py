@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for the provider-agnostic streaming adapter.
+"""
+import sys
+import asyncio
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from api.streaming import chunk_text, coalesce, provider_error_message, stream_completion
+
+
+def _openai_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+async def _deltas(items, delay=0.0, error=None):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+    if error is not None:
+        raise error
+
+
+async def _collect(stream):
+    return [piece async for piece in stream]
+
+
+class FakeClient:
+    """Model client whose acall streams the given chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.api_kwargs = None
+
+    def convert_inputs_to_api_kwargs(self, input, model_kwargs, model_type):
+        return dict(model_kwargs or {}, input=input)
+
+    async def acall(self, api_kwargs, model_type):
+        self.api_kwargs = api_kwargs
+        if isinstance(self.chunks, str):
+            return self.chunks
+        return _deltas(self.chunks)
+
+
+class FakeGoogleModel:
+    """Stand-in for google.generativeai.GenerativeModel with a synchronous stream."""
+
+    def generate_content(self, prompt, stream=False):
+        return iter([SimpleNamespace(text="Hello "), SimpleNamespace(text="world")])
+
+
+class TestChunkText(unittest.TestCase):
+    """Tests for chunk_text."""
+
+    def test_provider_shapes(self):
+        self.assertEqual(chunk_text(_openai_chunk("hi"), "openai"), "hi")
+        self.assertIsNone(chunk_text(_openai_chunk(None), "azure"))
+        self.assertIsNone(chunk_text(SimpleNamespace(choices=[]), "openai"))
+        self.assertEqual(chunk_text("plain", "openrouter"), "plain")
+        self.assertEqual(chunk_text(SimpleNamespace(text="g"), "google"), "g")
+
+    def test_ollama_cleanup(self):
+        self.assertEqual(chunk_text(SimpleNamespace(response="<think>a</think>"), "ollama"), "a")
+        self.assertIsNone(chunk_text("model='qwen3' created_at='now'", "ollama"))
+
+    def test_error_message(self):
+        message = provider_error_message("openai", ValueError("bad key"))
+        self.assertTrue(message.startswith("\nError with Openai API: bad key"))
+        self.assertIn("OPENAI_API_KEY", message)
+        self.assertEqual(provider_error_message("unknown", ValueError("x")), "\nError: x")
+
+
+class TestCoalesce(unittest.TestCase):
+    """Tests for coalesce."""
+
+    def test_rapid_deltas_are_merged(self):
+        pieces = asyncio.run(_collect(coalesce(_deltas(list("abcdefgh")), window=0.05)))
+        self.assertEqual("".join(pieces), "abcdefgh")
+        self.assertEqual(len(pieces), 1)
+
+    def test_max_chars_flushes_early(self):
+        pieces = asyncio.run(_collect(coalesce(_deltas(["aa"] * 10), window=1.0, max_chars=4)))
+        self.assertEqual("".join(pieces), "aa" * 10)
+        self.assertTrue(all(len(piece) <= 4 for piece in pieces))
+
+    def test_window_bounds_latency(self):
+        pieces = asyncio.run(_collect(coalesce(_deltas(["a", "b", "c"], delay=0.06), window=0.01)))
+        self.assertEqual(pieces, ["a", "b", "c"])
+
+    def test_error_after_partial_text(self):
+        async def main():
+            received = []
+            with self.assertRaises(RuntimeError):
+                async for piece in coalesce(_deltas(["a", "b"], error=RuntimeError("boom")), window=0.01):
+                    received.append(piece)
+            return received
+        self.assertEqual("".join(asyncio.run(main())), "ab")
+
+    def test_slow_consumer_pauses_upstream(self):
+        read = []
+
+        async def upstream():
+            for i in range(1000):
+                read.append(i)
+                yield "x"
+
+        async def main():
+            stream = coalesce(upstream(), window=0.0, max_chars=1, queue_size=8)
+            await stream.__anext__()
+            await asyncio.sleep(0.05)  # a client that stopped reading
+            count = len(read)
+            await stream.aclose()
+            return count
+        self.assertLess(asyncio.run(main()), 20)
+
+
+class TestStreamCompletion(unittest.TestCase):
+    """Tests for stream_completion."""
+
+    def test_openai_compatible_client(self):
+        client = FakeClient([_openai_chunk("Hel"), _openai_chunk(None), _openai_chunk("lo")])
+        pieces = asyncio.run(_collect(stream_completion("openai", client, "prompt", {"model": "m", "stream": True})))
+        self.assertEqual("".join(pieces), "Hello")
+        self.assertEqual(client.api_kwargs["input"], "prompt")
+
+    def test_non_streaming_response(self):
+        pieces = asyncio.run(_collect(stream_completion("bedrock", FakeClient("whole answer"), "prompt", {})))
+        self.assertEqual(pieces, ["whole answer"])
+
+    def test_google_sync_stream(self):
+        pieces = asyncio.run(_collect(stream_completion("google", FakeGoogleModel(), "prompt")))
+        self.assertEqual("".join(pieces), "Hello world")
+
+
+if __name__ == "__main__":
+    unittest.main()
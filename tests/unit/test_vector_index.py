@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Tests for the persisted FAISS index and StoreRetriever.
+"""
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from unittest import mock
+
+import faiss
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from adalflow.core.types import Document
+
+from api.index_store import ChunkFilter, write_index_store
+import api.vector_index
+from api.vector_index import (
+    FAISS_INDEX_FILE,
+    FAISS_META_FILE,
+    StoreRetriever,
+    benchmark_index_types,
+    build_faiss_index,
+    load_faiss_index,
+    resolve_index_params,
+)
+
+
+class FakeEmbedder:
+    """Embedder returning fixed vectors for known queries, shaped like adalflow's EmbedderOutput."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = []
+
+    def __call__(self, queries):
+        self.calls.append(list(queries))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=self.vectors[q]) for q in queries])
+
+
+class TestVectorIndex(unittest.TestCase):
+    """Tests for building, persisting and loading the FAISS index."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(30, 8)).astype(np.float32)
+        docs = [
+            Document(text=f"chunk {i}", vector=self.vectors[i].tolist(),
+                     meta_data={"file_path": f"f{i % 3}.py"}, estimated_num_tokens=2)
+            for i in range(30)
+        ]
+        # One chunk with a broken embedding must not appear in the index
+        docs[5].vector = [1.0, 2.0]
+        self.store = write_index_store(docs, os.path.join(self.tmp_dir, "store"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_build_writes_index_and_checksum(self):
+        """Building saves the index with the vectors' checksum."""
+        index = build_faiss_index(self.store)
+        self.assertEqual(index.ntotal, 29)
+        self.assertTrue(os.path.exists(os.path.join(self.store.store_dir, FAISS_INDEX_FILE)))
+        with open(os.path.join(self.store.store_dir, FAISS_META_FILE)) as f:
+            meta = json.load(f)
+        self.assertEqual(meta["vectors_checksum"], self.store.vectors_checksum)
+
+    def test_load_reuses_persisted_index(self):
+        """A matching persisted index is loaded instead of rebuilt."""
+        build_faiss_index(self.store)
+        index_path = os.path.join(self.store.store_dir, FAISS_INDEX_FILE)
+        mtime = os.path.getmtime(index_path)
+        index = load_faiss_index(self.store)
+        self.assertEqual(index.ntotal, 29)
+        self.assertEqual(os.path.getmtime(index_path), mtime)
+
+    def test_checksum_mismatch_triggers_rebuild(self):
+        """An index built from different vectors is rebuilt on load."""
+        build_faiss_index(self.store)
+        meta_path = os.path.join(self.store.store_dir, FAISS_META_FILE)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["vectors_checksum"] = "stale"
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+        load_faiss_index(self.store)
+        with open(meta_path) as f:
+            self.assertEqual(json.load(f)["vectors_checksum"], self.store.vectors_checksum)
+
+    def test_index_swapped_without_its_sidecar_is_not_trusted(self):
+        """An index file replaced after its sidecar was written (a build in flight) is rebuilt."""
+        build_faiss_index(self.store)
+        index_path = os.path.join(self.store.store_dir, FAISS_INDEX_FILE)
+        # Another build's index file of the same shape, renamed into place before its sidecar
+        other = faiss.IndexIDMap(faiss.IndexFlatIP(8))
+        other.add_with_ids(np.zeros((29, 8), dtype=np.float32), np.arange(29, dtype=np.int64))
+        faiss.write_index(other, index_path)
+        with mock.patch("api.vector_index.build_faiss_index", wraps=api.vector_index.build_faiss_index) as build:
+            index = load_faiss_index(self.store)
+        self.assertEqual(build.call_count, 1)
+        _, ids = index.search(self.vectors[:1] / np.linalg.norm(self.vectors[0]), 1)
+        self.assertEqual(ids[0][0], 0)
+
+    def test_inconsistent_read_rechecks_under_the_lock(self):
+        """A worker that read a mismatched index reuses one rebuilt while it waited for the lock."""
+        build_faiss_index(self.store)
+        real_read = api.vector_index._read_consistent_index
+        with mock.patch("api.vector_index._read_consistent_index",
+                        side_effect=[None, real_read(self.store, os.path.join(self.store.store_dir, FAISS_INDEX_FILE))]), \
+                mock.patch("api.vector_index.build_faiss_index") as build:
+            index = load_faiss_index(self.store)
+        build.assert_not_called()
+        self.assertEqual(index.ntotal, 29)
+
+    def test_concurrent_loads_build_once(self):
+        """Workers loading a store without an index wait for one build and reuse it."""
+        results = []
+        with mock.patch("api.vector_index.build_faiss_index", wraps=api.vector_index.build_faiss_index) as build:
+            threads = [threading.Thread(target=lambda: results.append(load_faiss_index(self.store)))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual([index.ntotal for index in results], [29] * 4)
+
+    def test_retriever_matches_brute_force(self):
+        """Retrieved ids are store chunk ids ranked by cosine similarity."""
+        query_vec = self.vectors[7] + 0.01
+        embedder = FakeEmbedder({"q": query_vec.tolist()})
+        retriever = StoreRetriever(self.store, embedder=embedder, top_k=5)
+        output = retriever("q")
+
+        normed = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        sims = normed @ (query_vec / np.linalg.norm(query_vec))
+        sims[5] = -np.inf
+        expected = np.argsort(-sims)[:5].tolist()
+
+        self.assertEqual(len(output), 1)
+        self.assertEqual(output[0].doc_indices, expected)
+        self.assertEqual(output[0].doc_indices[0], 7)
+        self.assertTrue(all(0.0 <= s <= 1.0 for s in output[0].doc_scores))
+        self.assertEqual(self.store.get_document(output[0].doc_indices[0]).text, "chunk 7")
+
+    def test_filtered_retrieval_is_exact_over_the_subset(self):
+        """A file filter ranks only that file's chunks, by exact cosine similarity."""
+        query_vec = self.vectors[7] + 0.01
+        retriever = StoreRetriever(self.store, embedder=FakeEmbedder({"q": query_vec.tolist()}), top_k=4)
+        output = retriever("q", chunk_filter=ChunkFilter(file_path="f2.py"))
+
+        subset = [i for i in range(30) if i % 3 == 2 and i != 5]
+        normed = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        sims = normed[subset] @ (query_vec / np.linalg.norm(query_vec))
+        expected = [subset[i] for i in np.argsort(-sims)[:4]]
+        self.assertEqual(output[0].doc_indices, expected)
+        self.assertTrue(all(0.0 <= s <= 1.0 for s in output[0].doc_scores))
+
+    def test_filter_without_matches(self):
+        retriever = StoreRetriever(self.store, embedder=FakeEmbedder({"q": self.vectors[0].tolist()}), top_k=4)
+        output = retriever("q", chunk_filter=ChunkFilter(file_path="missing.py"))
+        self.assertEqual(output[0].doc_indices, [])
+
+    def test_retriever_skips_empty_queries(self):
+        """Empty queries get empty results and are not embedded."""
+        embedder = FakeEmbedder({"q": self.vectors[0].tolist()})
+        retriever = StoreRetriever(self.store, embedder=embedder, top_k=3)
+        output = retriever(["", "q"])
+        self.assertEqual(output[0].doc_indices, [])
+        self.assertEqual(len(output[1].doc_indices), 3)
+        self.assertEqual(embedder.calls, [["q"]])
+
+
+class TestIndexTypes(unittest.TestCase):
+    """Tests for selectable index types."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(1)
+        self.vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+        docs = [Document(text=f"chunk {i}", vector=v.tolist(), meta_data={}, estimated_num_tokens=2)
+                for i, v in enumerate(self.vectors)]
+        self.store = write_index_store(docs, os.path.join(self.tmp_dir, "store"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _read_meta(self):
+        with open(os.path.join(self.store.store_dir, FAISS_META_FILE)) as f:
+            return json.load(f)
+
+    def test_auto_selects_by_corpus_size(self):
+        self.assertEqual(resolve_index_params(1000, retriever_config={})["index_type"], "flat")
+        self.assertEqual(resolve_index_params(200_000, retriever_config={})["index_type"], "hnsw")
+        self.assertEqual(resolve_index_params(2_000_000, retriever_config={})["index_type"], "ivf")
+
+    def test_ivf_nlist_is_capped_by_training_size(self):
+        """Small corpora get few enough lists to train each one properly."""
+        params = resolve_index_params(400, index_type="ivf", retriever_config={"nlist": 1000})
+        self.assertEqual(params["nlist"], 10)
+
+    def test_unknown_index_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            resolve_index_params(10, index_type="annoy", retriever_config={})
+
+    def test_index_type_is_persisted_and_reused(self):
+        """The built index type is recorded, and a config change triggers a rebuild."""
+        config = {"index_type": "hnsw", "hnsw_m": 16, "ef_construction": 80, "ef_search": 64}
+        with mock.patch("api.vector_index.configs", {"retriever": config}):
+            load_faiss_index(self.store)
+            self.assertEqual(self._read_meta()["index_params"]["index_type"], "hnsw")
+            mtime = os.path.getmtime(os.path.join(self.store.store_dir, FAISS_INDEX_FILE))
+            load_faiss_index(self.store)
+            self.assertEqual(os.path.getmtime(os.path.join(self.store.store_dir, FAISS_INDEX_FILE)), mtime)
+
+        with mock.patch("api.vector_index.configs", {"retriever": {"index_type": "ivf", "nprobe": 8}}):
+            index = load_faiss_index(self.store)
+            self.assertEqual(self._read_meta()["index_params"]["index_type"], "ivf")
+            self.assertEqual(index.ntotal, 2000)
+
+    def test_loaded_index_is_memory_mapped(self):
+        """Flat and HNSW vectors stay in the mapped file, shared by every worker."""
+        for config in ({"index_type": "flat"}, {"index_type": "hnsw"}):
+            with mock.patch("api.vector_index.configs", {"retriever": config}):
+                index = load_faiss_index(self.store)
+            inner = faiss.downcast_index(index.index)
+            if isinstance(inner, faiss.IndexHNSW):
+                inner = faiss.downcast_index(inner.storage)
+            self.assertFalse(inner.codes.is_owned, config)
+
+    def test_approximate_retrieval_returns_store_ids(self):
+        """HNSW and IVF indexes still map results back to store chunk ids."""
+        embedder = FakeEmbedder({"q": self.vectors[42].tolist()})
+        for config in ({"index_type": "hnsw"}, {"index_type": "ivf", "nprobe": 64}):
+            with mock.patch("api.vector_index.configs", {"retriever": config}):
+                index = load_faiss_index(self.store)
+                output = StoreRetriever(self.store, embedder=embedder, top_k=5, index=index)("q")
+            self.assertEqual(output[0].doc_indices[0], 42)
+
+    def test_benchmark_reports_recall_against_flat(self):
+        with mock.patch("api.vector_index.configs", {"retriever": {"nprobe": 4}}):
+            results = benchmark_index_types(self.store, num_queries=20, top_k=10)
+        by_type = {r["index_type"]: r for r in results}
+        self.assertEqual(set(by_type), {"flat", "hnsw", "ivf"})
+        self.assertEqual(by_type["flat"]["recall"], 1.0)
+        for result in results:
+            self.assertGreater(result["recall"], 0.5)
+            self.assertGreaterEqual(result["p95_ms"], result["p50_ms"])
+        # Benchmarks build in memory only
+        self.assertFalse(os.path.exists(os.path.join(self.store.store_dir, FAISS_INDEX_FILE)))
+
+
+if __name__ == "__main__":
+    unittest.main()